@@ -0,0 +1,57 @@
+"""initial schema
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-18 09:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Databases created before migrations existed already have these tables
+    inspector = sa.inspect(op.get_bind())
+
+    if not inspector.has_table('users'):
+        op.create_table(
+            'users',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column('email', sa.String(), nullable=False),
+            sa.Column('hashed_password', sa.String(), nullable=False),
+            sa.Column('full_name', sa.String(), nullable=False),
+            sa.Column('is_active', sa.Boolean(), nullable=True),
+            sa.Column('is_superuser', sa.Boolean(), nullable=True),
+        )
+        op.create_index('ix_users_id', 'users', ['id'])
+        op.create_index('ix_users_email', 'users', ['email'], unique=True)
+
+    if not inspector.has_table('messages'):
+        op.create_table(
+            'messages',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column('content', sa.String(), nullable=False),
+            sa.Column('sender_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+            sa.Column('recipient_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+            sa.Column('room_id', sa.String(), nullable=False),
+            sa.Column('is_read', sa.Boolean(), nullable=True),
+            sa.Column('read_at', sa.DateTime(timezone=True), nullable=True),
+        )
+        op.create_index('ix_messages_id', 'messages', ['id'])
+        op.create_index('ix_messages_room_id', 'messages', ['room_id'])
+
+
+def downgrade() -> None:
+    op.drop_table('messages')
+    op.drop_table('users')
@@ -0,0 +1,40 @@
+"""composite index for keyset room history
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 09:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        # Build without blocking writes on a large messages table
+        with op.get_context().autocommit_block():
+            op.create_index(
+                'ix_messages_room_created_id',
+                'messages',
+                ['room_id', 'created_at', 'id'],
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+    else:
+        op.create_index(
+            'ix_messages_room_created_id',
+            'messages',
+            ['room_id', 'created_at', 'id'],
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_messages_room_created_id', table_name='messages')
@@ -0,0 +1,55 @@
+"""per-user read cursors and unread message index
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'read_cursors',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('room_id', sa.String(), nullable=False),
+        sa.Column('last_read_message_id', sa.Integer(), nullable=False),
+        sa.UniqueConstraint('user_id', 'room_id', name='uq_read_cursors_user_room'),
+    )
+    op.create_index('ix_read_cursors_id', 'read_cursors', ['id'])
+
+    # Start each cursor at the newest message already marked read
+    op.execute(
+        """
+        INSERT INTO read_cursors (user_id, room_id, last_read_message_id)
+        SELECT recipient_id, room_id, MAX(id)
+        FROM messages
+        WHERE is_read AND recipient_id IS NOT NULL
+        GROUP BY recipient_id, room_id
+        """
+    )
+
+    op.create_index(
+        'ix_messages_unread',
+        'messages',
+        ['recipient_id', 'room_id', 'id'],
+        postgresql_where=sa.text('NOT is_read'),
+        sqlite_where=sa.text('NOT is_read'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_messages_unread', table_name='messages')
+    op.drop_index('ix_read_cursors_id', table_name='read_cursors')
+    op.drop_table('read_cursors')
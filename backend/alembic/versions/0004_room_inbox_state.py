@@ -0,0 +1,90 @@
+"""room state and per-member inbox counters
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 10:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'room_state',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column('room_id', sa.String(), nullable=False),
+        sa.Column('last_message_id', sa.Integer(), nullable=True),
+        sa.Column('last_activity', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('message_count', sa.Integer(), nullable=False),
+    )
+    op.create_index('ix_room_state_id', 'room_state', ['id'])
+    op.create_index('ix_room_state_room_id', 'room_state', ['room_id'], unique=True)
+
+    op.create_table(
+        'room_members',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('room_id', sa.String(), nullable=False),
+        sa.Column('unread_count', sa.Integer(), nullable=False),
+        sa.Column('last_message_id', sa.Integer(), nullable=True),
+        sa.Column('last_activity', sa.DateTime(timezone=True), nullable=True),
+        sa.UniqueConstraint('user_id', 'room_id', name='uq_room_members_user_room'),
+    )
+    op.create_index('ix_room_members_id', 'room_members', ['id'])
+    op.create_index('ix_room_members_inbox', 'room_members', ['user_id', 'last_activity', 'room_id'])
+
+    # Backfill from existing history: members are everyone who sent,
+    # received or read messages in a room
+    op.execute(
+        """
+        INSERT INTO room_state (room_id, last_message_id, last_activity, message_count)
+        SELECT m.room_id, MAX(m.id), MAX(m.created_at), COUNT(*)
+        FROM messages m
+        GROUP BY m.room_id
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO room_members (user_id, room_id, unread_count, last_message_id, last_activity)
+        SELECT p.user_id, p.room_id,
+            (
+                SELECT COUNT(*) FROM messages m
+                WHERE m.room_id = p.room_id
+                AND m.sender_id <> p.user_id
+                AND m.id > COALESCE((
+                    SELECT rc.last_read_message_id FROM read_cursors rc
+                    WHERE rc.user_id = p.user_id AND rc.room_id = p.room_id
+                ), 0)
+            ),
+            s.last_message_id, s.last_activity
+        FROM (
+            SELECT sender_id AS user_id, room_id FROM messages
+            UNION
+            SELECT recipient_id, room_id FROM messages WHERE recipient_id IS NOT NULL
+            UNION
+            SELECT user_id, room_id FROM read_cursors
+        ) p
+        JOIN room_state s ON s.room_id = p.room_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_room_members_inbox', table_name='room_members')
+    op.drop_index('ix_room_members_id', table_name='room_members')
+    op.drop_table('room_members')
+    op.drop_index('ix_room_state_room_id', table_name='room_state')
+    op.drop_index('ix_room_state_id', table_name='room_state')
+    op.drop_table('room_state')
@@ -0,0 +1,94 @@
+"""full-text search index over message content
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 11:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH = 50000
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        # A nullable column without a default is added without a rewrite;
+        # the trigger covers new writes while old rows are backfilled
+        op.execute("ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector tsvector")
+        op.execute(
+            """
+            CREATE OR REPLACE TRIGGER messages_search_vector_update
+            BEFORE INSERT OR UPDATE OF content ON messages
+            FOR EACH ROW EXECUTE FUNCTION
+            tsvector_update_trigger(search_vector, 'pg_catalog.english', content)
+            """
+        )
+        with op.get_context().autocommit_block():
+            max_id = bind.execute(sa.text("SELECT COALESCE(MAX(id), 0) FROM messages")).scalar()
+            for start in range(0, max_id, BACKFILL_BATCH):
+                bind.execute(
+                    sa.text(
+                        "UPDATE messages SET search_vector = to_tsvector('english', content) "
+                        "WHERE id > :start AND id <= :stop AND search_vector IS NULL"
+                    ),
+                    {"start": start, "stop": start + BACKFILL_BATCH},
+                )
+            op.create_index(
+                'ix_messages_search_vector',
+                'messages',
+                ['search_vector'],
+                postgresql_using='gin',
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+    else:
+        op.execute(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts
+            USING fts5(content, content='messages', content_rowid='id')
+            """
+        )
+        op.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+                INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+            END
+            """
+        )
+        op.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+                INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            END
+            """
+        )
+        op.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+                INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+                INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+            END
+            """
+        )
+        # Index the existing rows
+        op.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_messages_search_vector', table_name='messages')
+        op.execute("DROP TRIGGER IF EXISTS messages_search_vector_update ON messages")
+        op.execute("ALTER TABLE messages DROP COLUMN IF EXISTS search_vector")
+    else:
+        for trigger in ('messages_fts_insert', 'messages_fts_delete', 'messages_fts_update'):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS messages_fts")
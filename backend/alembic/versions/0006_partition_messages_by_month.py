@@ -0,0 +1,121 @@
+"""message archives; opt-in monthly partitioning of messages
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 11:30:00
+
+The message_archives table is always created. With MESSAGE_PARTITIONING
+set (PostgreSQL only) messages is also rebuilt as a table range-partitioned
+by created_at, one partition per month. The rebuild copies every row and
+holds an exclusive lock on messages throughout: run it in a maintenance
+window. Downgrading copies the data back into a plain table.
+"""
+from datetime import datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.core.config import settings
+from app.core.partitions import add_months, is_partitioned, month_start
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+COLUMNS = (
+    "id, created_at, updated_at, content, sender_id, recipient_id, "
+    "room_id, is_read, read_at, search_vector"
+)
+
+INDEXES = [
+    "CREATE INDEX ix_messages_id ON messages (id)",
+    "CREATE INDEX ix_messages_room_id ON messages (room_id)",
+    "CREATE INDEX ix_messages_room_created_id ON messages (room_id, created_at, id)",
+    "CREATE INDEX ix_messages_unread ON messages (recipient_id, room_id, id) WHERE NOT is_read",
+    "CREATE INDEX ix_messages_search_vector ON messages USING gin (search_vector)",
+    """
+    CREATE TRIGGER messages_search_vector_update
+    BEFORE INSERT OR UPDATE OF content ON messages
+    FOR EACH ROW EXECUTE FUNCTION
+    tsvector_update_trigger(search_vector, 'pg_catalog.english', content)
+    """,
+]
+
+
+def _rebuild(partitioned: bool) -> None:
+    """Copy messages into a new (partitioned or plain) table and swap it in"""
+    bind = op.get_bind()
+    primary_key = "PRIMARY KEY (id, created_at)" if partitioned else "PRIMARY KEY (id)"
+    op.execute("LOCK TABLE messages IN ACCESS EXCLUSIVE MODE")
+    op.execute(
+        f"""
+        CREATE TABLE messages_rebuild (
+            id integer NOT NULL DEFAULT nextval('messages_id_seq'),
+            created_at timestamp with time zone NOT NULL DEFAULT now(),
+            updated_at timestamp with time zone DEFAULT now(),
+            content varchar NOT NULL,
+            sender_id integer NOT NULL REFERENCES users (id),
+            recipient_id integer REFERENCES users (id),
+            room_id varchar NOT NULL,
+            is_read boolean,
+            read_at timestamp with time zone,
+            search_vector tsvector,
+            {primary_key}
+        ) {"PARTITION BY RANGE (created_at)" if partitioned else ""}
+        """
+    )
+    if partitioned:
+        oldest = bind.execute(sa.text("SELECT MIN(created_at) FROM messages")).scalar()
+        now = datetime.now(timezone.utc)
+        first = month_start(oldest or now)
+        months = (now.year - first.year) * 12 + now.month - first.month
+        for offset in range(months + settings.MESSAGE_PARTITION_PREMAKE_MONTHS + 1):
+            lower = add_months(first, offset)
+            op.execute(
+                f"CREATE TABLE messages_p{lower:%Y_%m} PARTITION OF messages_rebuild "
+                f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{add_months(lower, 1).isoformat()}')"
+            )
+    op.execute(
+        f"INSERT INTO messages_rebuild ({COLUMNS}) "
+        f"SELECT id, COALESCE(created_at, now()), updated_at, content, sender_id, recipient_id, "
+        f"room_id, is_read, read_at, search_vector FROM messages"
+    )
+    op.execute("ALTER SEQUENCE messages_id_seq OWNED BY NONE")
+    op.execute("DROP TABLE messages")
+    op.execute("ALTER TABLE messages_rebuild RENAME TO messages")
+    op.execute("ALTER TABLE messages RENAME CONSTRAINT messages_rebuild_pkey TO messages_pkey")
+    op.execute("ALTER SEQUENCE messages_id_seq OWNED BY messages.id")
+    for statement in INDEXES:
+        op.execute(statement)
+
+
+def upgrade() -> None:
+    op.create_table(
+        'message_archives',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column('partition_name', sa.String(), nullable=False, unique=True),
+        sa.Column('range_start', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('range_end', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('min_id', sa.Integer(), nullable=True),
+        sa.Column('max_id', sa.Integer(), nullable=True),
+        sa.Column('row_count', sa.Integer(), nullable=False),
+        sa.Column('path', sa.String(), nullable=False),
+    )
+    op.create_index('ix_message_archives_id', 'message_archives', ['id'])
+
+    bind = op.get_bind()
+    if settings.MESSAGE_PARTITIONING and bind.dialect.name == 'postgresql' and not is_partitioned(bind):
+        _rebuild(partitioned=True)
+
+
+def downgrade() -> None:
+    # Archived months stay in their files; they are not restored
+    if is_partitioned(op.get_bind()):
+        _rebuild(partitioned=False)
+    op.drop_index('ix_message_archives_id', table_name='message_archives')
+    op.drop_table('message_archives')
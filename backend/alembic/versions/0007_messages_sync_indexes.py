@@ -0,0 +1,42 @@
+"""indexes for delta sync: messages past a mark, messages changed since
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 12:00:00
+
+"""
+from alembic import op
+
+from app.core.partitions import is_partitioned
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_messages_room_id_id', ['room_id', 'id']),
+    ('ix_messages_room_updated', ['room_id', 'updated_at']),
+]
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    # Partitioned parents cannot build indexes concurrently
+    if bind.dialect.name == 'postgresql' and not is_partitioned(bind):
+        # Build without blocking writes on a large messages table
+        with op.get_context().autocommit_block():
+            for name, columns in INDEXES:
+                op.create_index(
+                    name, 'messages', columns, postgresql_concurrently=True, if_not_exists=True
+                )
+    else:
+        for name, columns in INDEXES:
+            op.create_index(name, 'messages', columns, if_not_exists=True)
+
+
+def downgrade() -> None:
+    for name, _ in INDEXES:
+        op.drop_index(name, table_name='messages')
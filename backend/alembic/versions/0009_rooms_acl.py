@@ -0,0 +1,47 @@
+"""rooms: public or private, with room_members as the member list
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 14:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'rooms',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column('room_id', sa.String(), nullable=False),
+        sa.Column('is_private', sa.Boolean(), nullable=False),
+        sa.Column('created_by', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+    )
+    op.create_index('ix_rooms_id', 'rooms', ['id'])
+    op.create_index('ix_rooms_room_id', 'rooms', ['room_id'], unique=True)
+
+    # Every room so far was open to everyone, so existing ones stay public,
+    # as does the default room clients open
+    op.execute(
+        """
+        INSERT INTO rooms (room_id, is_private)
+        SELECT room_id, false FROM room_state
+        UNION
+        SELECT 'general', false
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_rooms_room_id', table_name='rooms')
+    op.drop_index('ix_rooms_id', table_name='rooms')
+    op.drop_table('rooms')
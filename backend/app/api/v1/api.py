@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from app.api.v1.endpoints import auth, messages, users
+from app.api.v1.endpoints import auth, messages, rooms, users
 
 api_router = APIRouter()
 
@@ -8,3 +8,4 @@ api_router = APIRouter()
 api_router.include_router(auth.router, prefix="/auth", tags=["Authentication"])
 api_router.include_router(users.router, prefix="/users", tags=["Users"])
 api_router.include_router(messages.router, prefix="/messages", tags=["Messages"])
+api_router.include_router(rooms.router, prefix="/rooms", tags=["Rooms"])
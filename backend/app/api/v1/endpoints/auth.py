@@ -1,27 +1,26 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
 from datetime import timedelta
 from typing import Any
 
 from .... import crud, schemas, models
 from ....core import security
 from ....core.config import settings
-from ....database import get_db
-from ....core.security import get_password_hash
 
 router = APIRouter()
 
 @router.post("/login", response_model=schemas.Token)
-def login(
-    db: Session = Depends(get_db), 
+async def login(
     form_data: OAuth2PasswordRequestForm = Depends()
 ) -> Any:
     """
     OAuth2 compatible token login, get an access token for future requests
+
+    Lookups use short-lived sessions so no pooled connection is held while
+    waiting for the password pool.
     """
-    user = crud.user.authenticate(
-        db, email=form_data.username, password=form_data.password
+    user = await crud.user.aauthenticate(
+        None, email=form_data.username, password=form_data.password
     )
     if not user:
         raise HTTPException(
@@ -44,21 +43,20 @@ def login(
     }
 
 @router.post("/register", response_model=schemas.UserInResponse)
-def register(
+async def register(
     user_in: schemas.UserCreate,
-    db: Session = Depends(get_db)
 ) -> Any:
     """
     Create new user
     """
-    user = crud.user.get_by_email(db, email=user_in.email)
+    user = await crud.user.aget_by_email(None, email=user_in.email)
     if user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="The user with this email already exists in the system.",
         )
     
-    user = crud.user.create(db, obj_in=user_in)
+    user = await crud.user.acreate(None, obj_in=user_in)
     
     # Generate access token
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
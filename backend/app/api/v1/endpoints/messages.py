@@ -1,130 +1,574 @@
-from typing import Any, List, Optional
-from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
+from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
-import json
 
 from .... import crud, models, schemas
 from ....database import get_db
-from ....core.security import get_current_active_user
-from ....core.websocket import ConnectionManager
+from ....core import codec as wire
+from ....core.acl import require_room_access, room_acl
+from ....core.config import settings
+from ....core.fanout import Connection, StreamQueue
+from ....core.message_cache import CachedMessage, message_cache
+from ....core.metrics import stream_frames_out, ws_frames_in, ws_frames_invalid, ws_frames_suppressed, ws_replays
+from ....core.pipeline import message_pipeline
+from ....core.ratelimit import TokenBucket
+from ....core.security import get_current_active_user, oauth2_scheme
+from ....core.websocket import manager
 
 router = APIRouter()
-manager = ConnectionManager()
+
+def _message_event(message: models.Message, sender_name: Optional[str]) -> dict:
+    """WebSocket frame for a message, as broadcast and as replayed"""
+    return {
+        "type": "message",
+        "id": message.id,
+        "room_id": message.room_id,
+        "content": message.content,
+        "recipient_id": message.recipient_id,
+        "sender_id": message.sender_id,
+        "created_at": message.created_at.isoformat(),
+        "sender_name": sender_name,
+        "is_read": bool(message.is_read),
+    }
 
 @router.get("/", response_model=List[schemas.Message])
-def read_messages(
+async def read_messages(
     room_id: str,
+    response: Response,
     skip: int = 0,
     limit: int = 50,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user),
+) -> Any:
+    """
+    Retrieve messages for a specific room, newest first.
+
+    Pass the `X-Cursor-Before` response header back as `before` to page
+    into older history, or `X-Cursor-After` as `after` for newer messages.
+    `skip` keeps the old offset paging working for existing clients.
+    """
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either before or after, not both")
+    await require_room_access(current_user.id, room_id)
+
+    if not (skip or before or after) and limit <= message_cache.size:
+        # First page: served already serialized from the recent-message cache
+        entries = await message_cache.aget(room_id, limit)
+        if entries is None:
+            entries = await crud.message.aget_recent_page(db, room_id=room_id, limit=limit)
+        return _serialized_page(entries)
+
+    if skip and not (before or after):
+        messages = await crud.message.aget_multi_by_room(
+            db, room_id=room_id, skip=skip, limit=limit
+        )
+    else:
+        try:
+            messages = await crud.message.aget_page_by_room(
+                db, room_id=room_id, before=before, after=after, limit=limit
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    if messages:
+        response.headers["X-Cursor-Before"] = crud.message.encode_cursor(messages[-1])
+        response.headers["X-Cursor-After"] = crud.message.encode_cursor(messages[0])
+    return messages
+
+def _serialized_page(entries: List[CachedMessage]) -> Response:
+    """History response from already serialized messages, newest first"""
+    headers = {}
+    if entries:
+        headers["X-Cursor-Before"] = crud.message.encode_cursor(entries[-1])
+        headers["X-Cursor-After"] = crud.message.encode_cursor(entries[0])
+    body = b"[" + b",".join(entry.body for entry in entries) + b"]"
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@router.get("/page", response_model=schemas.MessagePage)
+async def read_message_page(
+    room_id: str,
+    limit: int = 50,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user),
 ) -> Any:
     """
-    Retrieve messages for a specific room with pagination.
+    Retrieve a compact page of room history: messages without nested users,
+    plus every distinct sender and recipient once.
+    """
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either before or after, not both")
+    await require_room_access(current_user.id, room_id)
+    try:
+        messages, users = await crud.message.aget_compact_page_by_room(
+            db, room_id=room_id, before=before, after=after, limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "messages": messages,
+        "users": users,
+        "before": crud.message.encode_cursor(messages[-1]) if messages else None,
+        "after": crud.message.encode_cursor(messages[0]) if messages else None,
+    }
+
+@router.get("/search", response_model=schemas.MessageSearchPage)
+async def search_messages(
+    q: str = Query(..., min_length=1, max_length=200),
+    room_id: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    current_user: models.User = Depends(get_current_active_user),
+) -> Any:
+    """
+    Full-text search across the rooms the current user belongs to, or
+    within one of them, best matches first.
+    """
+    if room_id is not None:
+        await require_room_access(current_user.id, room_id)
+    try:
+        hits = await crud.message.asearch(
+            None, user_id=current_user.id, query=q, room_id=room_id, cursor=cursor, limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    next_cursor = None
+    if len(hits) == limit:
+        message, rank = hits[-1]
+        next_cursor = crud.message.encode_search_cursor(rank, message.id)
+    return {
+        "hits": [{"message": message, "rank": rank} for message, rank in hits],
+        "next": next_cursor,
+    }
+
+@router.post("/sync", response_model=schemas.SyncResponse)
+async def sync_messages(
+    sync_in: schemas.SyncRequest,
+    current_user: models.User = Depends(get_current_active_user),
+) -> Any:
+    """
+    Catch up on many rooms in one round-trip after a reconnect: new
+    messages past each room's mark, changed ones at or below it and moved
+    read cursors. Pass `synced_at` back as `since` next time.
     """
-    return crud.message.get_by_room(
-        db, room_id=room_id, skip=skip, limit=limit
+    for room_id in sync_in.rooms:
+        await require_room_access(current_user.id, room_id)
+    rooms, users, synced_at = await crud.message.aget_changes(
+        None, user_id=current_user.id, marks=sync_in.rooms, since=sync_in.since
     )
+    return {"rooms": rooms, "users": users, "synced_at": synced_at}
 
 @router.post("/", response_model=schemas.Message)
-def create_message(
+async def create_message(
     message_in: schemas.MessageCreate,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user),
 ) -> Any:
     """
-    Create a new message.
+    Create a new message and deliver it to the room's live connections.
+    Posting to a new room_id creates the room (see POST /rooms/).
+    """
+    await require_room_access(current_user.id, message_in.room_id, claim=True)
+    message = await crud.message.acreate_with_sender(
+        db, obj_in=message_in, sender_id=current_user.id
+    )
+    await manager.broadcast_message(
+        room_id=message.room_id, message=_message_event(message, current_user.full_name)
+    )
+    return message
+
+@router.websocket("/ws")
+async def multiplexed_websocket_endpoint(websocket: WebSocket, token: str):
+    """
+    One WebSocket for many rooms, so a client with many conversations open
+    authenticates once instead of once per room. Rooms are joined and left
+    with control frames, each answered by the server:
+
+        {"type": "subscribe", "room_id": ..., "last_id": ...}
+            -> {"type": "subscribed", "room_id": ...}
+        {"type": "unsubscribe", "room_id": ...}
+            -> {"type": "unsubscribed", "room_id": ...}
+
+    `last_id` replays what was missed, as on the single-room endpoint.
+    Control frames are always answered and do not count against the
+    inbound rate limit, so a client may subscribe to all its rooms at once
+    (bounded by WS_MAX_ROOMS_PER_CONNECTION instead). Room events carry the `room_id` they belong to, and message, read and
+    typing frames must name a subscribed room. A connection may be in at
+    most WS_MAX_ROOMS_PER_CONNECTION rooms; a subscribe over that or to a
+    room the user may not use (see core.acl), or a frame for a room it is
+    not in, is answered with {"type": "error", "room_id": ..., "detail": ...}.
+    A user removed from a room is sent {"type": "unsubscribed", "room_id":
+    ..., "reason": "revoked"}.
+
+    Everything else works as on GET /ws/{room_id}.
     """
-    message_in.sender_id = current_user.id
-    return crud.message.create(db, obj_in=message_in)
+    await _serve_websocket(websocket, token, None, None)
 
 @router.websocket("/ws/{room_id}")
 async def websocket_endpoint(
     websocket: WebSocket,
     room_id: str,
     token: str,
-    db: Session = Depends(get_db),
+    last_id: Optional[int] = None,
 ):
     """
-    WebSocket endpoint for real-time messaging.
+    WebSocket endpoint for real-time messaging in one room: a multiplexed
+    connection (see GET /ws) subscribed to `room_id` from the start, which
+    frames without a room_id go to. It is closed with 1008 if the user may
+    not use the room.
+
+    Reconnecting clients pass the newest message id they have as `last_id`
+    and are sent what they missed before any live event: from the room's
+    replay buffer when it reaches back that far, otherwise from the
+    database, ending with a `resync` event if there was too much.
+
+    Frames are JSON text unless the client offers the `chat.msgpack`
+    subprotocol (see core.codec). Frames that fail validation are dropped.
+    Message, read and typing frames over the connection's rate limit
+    (WS_INBOUND_RATE) are dropped too, except that a refused message is
+    answered with {"type": "error", "room_id": ..., "detail": ..., "reason":
+    "rate_limited"} so the client can send it again. Typing frames are relayed as
+    per-room digests and join/leave announcements are debounced (see
+    core.coalesce). Quiet connections are sent `ping` and must answer
+    `pong` or send something else before the idle timeout (see
+    core.presence).
+
+    Database work runs on the database executor with a short-lived session
+    per call, so the socket neither blocks the event loop nor holds a
+    pooled connection while idle.
     """
+    await _serve_websocket(websocket, token, room_id, last_id)
+
+async def _serve_websocket(
+    websocket: WebSocket, token: str, room_id: Optional[str], last_id: Optional[int]
+):
     try:
         # Authenticate user from token
-        user = await manager.authenticate_user(db, token)
-        if not user:
+        user = await manager.authenticate_user(None, token)
+        if not user or (room_id is not None and not await room_acl.check(user.id, room_id, claim=True)):
             await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
             return
             
-        # Connect to the room
-        await manager.connect(websocket, room_id, user)
+        # Connect, and join the room on the single-room endpoint
+        codec, subprotocol = wire.negotiate(websocket)
+        replayed = await manager.connect(
+            websocket, room_id, user, last_id=last_id, codec=codec, subprotocol=subprotocol
+        )
+        # Newest message id read per room, to skip stale receipts
+        last_read_ids: Dict[str, int] = {}
+        limiter = (
+            TokenBucket(settings.WS_INBOUND_RATE, settings.WS_INBOUND_BURST)
+            if settings.WS_INBOUND_RATE > 0 else None
+        )
         
         try:
+            if not replayed:
+                await _replay_from_database(websocket, user.id, room_id, last_id)
             while True:
-                data = await websocket.receive_text()
-                message_data = json.loads(data)
+                data = await wire.receive(websocket)
+                ws_frames_in.inc()
+                manager.presence.touch(websocket)
+                try:
+                    event = codec.parse(data)
+                except (ValidationError, ValueError):
+                    ws_frames_invalid.inc()
+                    continue
+
+                # `pong` only answers a ping; receiving it was the point
+                if event.type == "pong":
+                    continue
+
+                if event.type == "subscribe":
+                    await _subscribe(websocket, user, event.room_id, event.last_id)
+                    continue
+
+                if event.type == "unsubscribe":
+                    manager.leave(websocket, event.room_id)
+                    last_read_ids.pop(event.room_id, None)
+                    _send_control(websocket, {"type": "unsubscribed", "room_id": event.room_id})
+                    continue
+
+                target = event.room_id or room_id
+                record = manager.connections.get(websocket)
+                if record is None or target not in record.rooms:
+                    _send_control(websocket, {
+                        "type": "error", "room_id": target, "detail": "Not subscribed to this room"
+                    })
+                    continue
+
+                # Control frames above are bounded by max_rooms, not the limiter
+                if limiter is not None and not limiter.allow():
+                    ws_frames_suppressed.labels("rate_limited").inc()
+                    if event.type == "message":
+                        # Never dropped silently: the client may resend it
+                        _send_control(websocket, {
+                            "type": "error", "room_id": target, "detail": "Rate limited", "reason": "rate_limited"
+                        })
+                    continue
                 
                 # Handle different types of messages
-                if message_data["type"] == "message":
-                    # Save message to database
-                    message_in = schemas.MessageCreate(
-                        content=message_data["content"],
-                        room_id=room_id,
-                        recipient_id=message_data.get("recipient_id")
-                    )
-                    message = crud.message.create_with_sender(
-                        db=db, obj_in=message_in, sender_id=user.id
+                if event.type == "message":
+                    # Save message to database; the event has already been
+                    # validated, so skip MessageCreate's validation
+                    message_in = schemas.MessageCreate.model_construct(
+                        content=event.content,
+                        room_id=target,
+                        recipient_id=event.recipient_id,
                     )
+                    if settings.MESSAGE_PIPELINE_ENABLED:
+                        # Resolves once the message's batch is committed
+                        message = await message_pipeline.submit(
+                            obj_in=message_in, sender_id=user.id
+                        )
+                    else:
+                        message = await crud.message.acreate_with_sender(
+                            None, obj_in=message_in, sender_id=user.id
+                        )
                     
                     # Broadcast message to all clients in the room
                     await manager.broadcast_message(
-                        room_id=room_id,
-                        message={
-                            "type": "message",
-                            "content": message.content,
-                            "sender_id": message.sender_id,
-                            "created_at": message.created_at.isoformat(),
-                            "sender_name": user.full_name,
-                        }
+                        room_id=target,
+                        message=_message_event(message, user.full_name),
                     )
                     
-                elif message_data["type"] == "typing":
-                    # Broadcast typing indicator
-                    await manager.broadcast_message(
-                        room_id=room_id,
-                        message={
-                            "type": "typing",
-                            "user_id": user.id,
-                            "user_name": user.full_name,
-                            "is_typing": message_data["is_typing"]
-                        },
-                        exclude=[websocket]
-                    )
+                elif event.type == "read":
+                    # Clients coalesce receipts, sending only the newest id
+                    # seen every few hundred ms; stale ids are ignored
+                    if event.message_id > last_read_ids.get(target, 0):
+                        last_read_ids[target] = event.message_id
+                        await _apply_read_receipts(user.id, {target: event.message_id})
+                    
+                elif event.type == "typing":
+                    # Merged into the room's next typing digest
+                    await manager.typing.update(target, user, event.is_typing)
                     
         except WebSocketDisconnect:
-            manager.disconnect(websocket, room_id)
-            await manager.broadcast_message(
-                room_id=room_id,
-                message={
-                    "type": "user_left",
-                    "user_id": user.id,
-                    "user_name": user.full_name
-                }
-            )
+            pass
+        finally:
+            # Leaves every room the connection is still in
+            manager.disconnect(websocket)
             
     except Exception as e:
         print(f"WebSocket error: {str(e)}")
         await websocket.close()
 
+async def _subscribe(websocket: WebSocket, user: models.User, room_id: str, last_id: Optional[int]):
+    """Join another room on a multiplexed connection and acknowledge it"""
+    if not await room_acl.check(user.id, room_id, claim=True):
+        _send_control(websocket, {"type": "error", "room_id": room_id, "detail": "Not a member of this room"})
+        return
+    try:
+        replayed = await manager.join(websocket, room_id, user, last_id=last_id)
+    except ValueError as e:
+        _send_control(websocket, {"type": "error", "room_id": room_id, "detail": str(e)})
+        return
+    if not replayed:
+        await _replay_from_database(websocket, user.id, room_id, last_id)
+    _send_control(websocket, {"type": "subscribed", "room_id": room_id})
+
+def _send_control(websocket: WebSocket, event: dict):
+    manager.send_frames(websocket, [wire.Frame(event)])
+
+async def _replay_from_database(connection: Connection, user_id: int, room_id: str, last_id: int):
+    """Send a reconnecting client what it missed when the replay buffer cannot"""
+    rooms, users, _ = await crud.message.aget_changes(None, user_id=user_id, marks={room_id: last_id})
+    changes = rooms[0]
+    names = {u.id: u.full_name for u in users}
+    events = [
+        _message_event(message, names.get(message.sender_id))
+        for message in changes["updated"] + changes["messages"]
+    ]
+    events.extend(
+        {
+            "type": "read",
+            "room_id": room_id,
+            "user_id": cursor.user_id,
+            "message_id": cursor.last_read_message_id,
+        }
+        for cursor in changes["read_cursors"]
+    )
+    if changes["has_more"]:
+        events.append({"type": "resync", "room_id": room_id})
+    manager.send_frames(connection, [wire.Frame(event) for event in events])
+    ws_replays.labels("database").inc()
+
+@router.get("/stream")
+async def stream_user_events(token: str) -> Any:
+    """
+    Server-Sent Events sent to the current user directly rather than to a
+    room. See GET /stream/{room_id}.
+    """
+    return await _open_stream(token, None, None)
+
+@router.get("/stream/{room_id}")
+async def stream_room_events(
+    room_id: str,
+    token: str,
+    last_id: Optional[int] = None,
+    last_event_id: Optional[str] = Header(None),
+) -> Any:
+    """
+    Server-Sent Events for a room, for clients whose proxies break
+    WebSockets. Each event is a `data:` line with the same JSON as the room
+    WebSocket sends, delivered through the same fan-out. EventSource cannot
+    set headers, so the token goes in the query string as for the
+    WebSocket.
+
+    Message events carry their id as the SSE id, so a reconnecting
+    EventSource resumes from its Last-Event-ID header (or `last_id` on a
+    fresh connection), replayed as for the WebSocket. Idle streams get a
+    comment line every SSE_KEEPALIVE_SECONDS.
+    """
+    resume_id = last_id
+    if last_event_id and last_event_id.isdigit():
+        resume_id = int(last_event_id)
+    return await _open_stream(token, room_id, resume_id)
+
+async def _open_stream(token: str, room_id: Optional[str], last_id: Optional[int]) -> StreamingResponse:
+    user = await manager.authenticate_user(None, token)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+    if room_id is not None:
+        await require_room_access(user.id, room_id, claim=True)
+
+    stream = StreamQueue(max_queue=manager.max_queue, policy=manager.policy)
+    replayed = await manager.subscribe(stream, room_id, user, last_id=last_id)
+    try:
+        if not replayed:
+            await _replay_from_database(stream, user.id, room_id, last_id)
+    except Exception:
+        manager.disconnect(stream)
+        raise
+    return StreamingResponse(
+        _event_stream(stream),
+        media_type="text/event-stream",
+        # No caching, and no response buffering in nginx
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def _event_stream(stream: StreamQueue):
+    try:
+        # EventSource waits this long (ms) before reconnecting
+        yield "retry: 3000\n\n"
+        while True:
+            frames = await stream.wait(settings.SSE_KEEPALIVE_SECONDS)
+            if frames is None:
+                # Dropped as a slow consumer; the client reconnects and resumes
+                break
+            if frames:
+                yield "".join(frame.encode(wire.sse_codec) for frame in frames)
+                stream_frames_out.labels("sse").inc(len(frames))
+            else:
+                yield ": keepalive\n\n"
+    finally:
+        # Also runs when the client disconnects and the response is cancelled
+        manager.disconnect(stream)
+
+@router.get("/poll")
+async def poll_user_events(
+    timeout: float = Query(settings.LONG_POLL_TIMEOUT_SECONDS, ge=0, le=settings.LONG_POLL_TIMEOUT_SECONDS),
+    token: str = Depends(oauth2_scheme),
+) -> Any:
+    """
+    Long-poll for events sent to the current user directly. See
+    GET /poll/{room_id}.
+    """
+    return await _poll(token, None, None, timeout)
+
+@router.get("/poll/{room_id}")
+async def poll_room_events(
+    room_id: str,
+    last_id: Optional[int] = None,
+    timeout: float = Query(settings.LONG_POLL_TIMEOUT_SECONDS, ge=0, le=settings.LONG_POLL_TIMEOUT_SECONDS),
+    token: str = Depends(oauth2_scheme),
+) -> Any:
+    """
+    Long-poll fallback for clients that can use neither WebSockets nor
+    SSE. Returns a JSON array of room events, as the WebSocket sends them,
+    as soon as there is at least one, or [] after `timeout` seconds. Pass
+    the newest message id seen as `last_id` so nothing between polls is
+    lost; it is replayed as for a reconnecting WebSocket. Polls are not
+    announced as joins or leaves.
+    """
+    return await _poll(token, room_id, last_id, timeout)
+
+async def _poll(token: str, room_id: Optional[str], last_id: Optional[int], timeout: float) -> Response:
+    # Authenticated without get_db, so a waiting poll holds no pooled connection
+    user = await manager.authenticate_user(None, token)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if room_id is not None:
+        await require_room_access(user.id, room_id, claim=True)
+
+    stream = StreamQueue(max_queue=manager.max_queue, policy=manager.policy)
+    replayed = await manager.subscribe(stream, room_id, user, last_id=last_id, announce=False)
+    try:
+        if not replayed:
+            await _replay_from_database(stream, user.id, room_id, last_id)
+        frames = await stream.wait(timeout) or []
+    finally:
+        manager.disconnect(stream, announce=False)
+    stream_frames_out.labels("long_poll").inc(len(frames))
+    body = "[" + ",".join(frame.encode(wire.json_codec) for frame in frames) + "]"
+    return Response(content=body, media_type="application/json")
+
+async def _apply_read_receipts(user_id: int, cursors: dict) -> List[models.ReadCursor]:
+    """
+    Advance read cursors and tell each room how far the user has read.
+    Returns the cursors that moved; only those are announced.
+    """
+    result = await crud.read_cursor.aadvance_many(None, user_id=user_id, cursors=cursors)
+    for cursor in result:
+        await manager.broadcast_message(
+            room_id=cursor.room_id,
+            message={
+                "type": "read",
+                "user_id": user_id,
+                "message_id": cursor.last_read_message_id,
+            },
+            coalesce_key=f"read:{user_id}",
+        )
+    return result
+
+@router.post("/read", response_model=List[schemas.ReadCursor])
+async def mark_read_batch(
+    receipts_in: schemas.ReadReceiptBatch,
+    current_user: models.User = Depends(get_current_active_user),
+) -> Any:
+    """
+    Apply read receipts for one or more rooms in a single round-trip.
+    Each room's cursor moves to the newest message id given for it.
+    """
+    cursors: dict = {}
+    for receipt in receipts_in.receipts:
+        cursors[receipt.room_id] = max(receipt.message_id, cursors.get(receipt.room_id, 0))
+    for room_id in cursors:
+        await require_room_access(current_user.id, room_id)
+    await _apply_read_receipts(current_user.id, cursors)
+    return await crud.read_cursor.aget_by_user(None, user_id=current_user.id, room_ids=list(cursors))
+
 @router.put("/{message_id}/read", response_model=schemas.Message)
-def mark_as_read(
+async def mark_as_read(
     message_id: int,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user),
 ) -> Any:
     """
-    Mark a message as read.
+    Mark a message as read, along with every earlier message in its room.
+    Prefer POST /read or the WebSocket `read` event for many receipts.
     """
-    message = crud.message.get(db, id=message_id)
+    message = await crud.message.aget(db, id=message_id)
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
     if message.recipient_id != current_user.id:
@@ -132,4 +576,4 @@ def mark_as_read(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to mark this message as read",
         )
-    return crud.message.mark_as_read(db, db_obj=message)
+    return await crud.message.amark_as_read(db, db_obj=message)
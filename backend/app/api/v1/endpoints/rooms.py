@@ -0,0 +1,101 @@
+from typing import Any, List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+
+from .... import crud, models, schemas
+from ....core.acl import require_room_access
+from ....core.security import get_current_active_superuser, get_current_active_user
+from ....core.websocket import manager
+
+router = APIRouter()
+
+@router.get("/", response_model=List[schemas.RoomSummary])
+async def read_inbox(
+    limit: int = Query(50, ge=1, le=200),
+    current_user: models.User = Depends(get_current_active_user),
+) -> Any:
+    """
+    The current user's rooms with their latest message and unread count,
+    most recently active first.
+    """
+    entries = await crud.room_member.aget_inbox(None, user_id=current_user.id, limit=limit)
+    return [
+        schemas.RoomSummary.model_validate(
+            {
+                "room_id": member.room_id,
+                "unread_count": member.unread_count,
+                "last_activity": member.last_activity,
+                "last_message": message,
+            },
+            from_attributes=True,
+        )
+        for member, message in entries
+    ]
+
+@router.post("/", response_model=schemas.Room, status_code=status.HTTP_201_CREATED)
+async def create_room(
+    room_in: schemas.RoomCreate,
+    current_user: models.User = Depends(get_current_active_user),
+) -> Any:
+    """
+    Create a room with the current user and `member_ids` as members.
+    Private rooms are open to their members only, public ones to everyone.
+    Rooms are also created, members-only by default, by the first message
+    or join to a new room_id.
+    """
+    room = await crud.room.acreate_with_members(None, obj_in=room_in, created_by=current_user.id)
+    if room is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Room already exists")
+    return room
+
+@router.post("/{room_id}/members", status_code=status.HTTP_204_NO_CONTENT)
+async def add_room_member(
+    room_id: str,
+    member_in: schemas.RoomMemberAdd,
+    current_user: models.User = Depends(get_current_active_user),
+) -> Response:
+    """Add a user to a room; any member may"""
+    if await crud.room.aget_by_room_id(None, room_id=room_id) is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+    await require_room_access(current_user.id, room_id)
+    if await crud.user.aget(None, id=member_in.user_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    await crud.room_member.ainvite(None, room_id=room_id, user_ids=[member_in.user_id])
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+@router.delete("/{room_id}/members/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def remove_room_member(
+    room_id: str,
+    user_id: int,
+    current_user: models.User = Depends(get_current_active_user),
+) -> Response:
+    """
+    Leave a room, or remove someone from a room you created. Their open
+    connections are taken out of it at once.
+    """
+    room = await crud.room.aget_by_room_id(None, room_id=room_id)
+    if room is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+    if user_id != current_user.id and room.created_by != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only the room's creator can remove other members",
+        )
+    if not await crud.room_member.aremove(None, room_id=room_id, user_id=user_id):
+        raise HTTPException(status_code=404, detail="Not a member of this room")
+    await manager.revoke(room_id, user_id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+@router.get("/{room_id}/fanout", response_model=schemas.RoomFanoutStats)
+async def read_room_fanout(
+    room_id: str,
+    current_user: models.User = Depends(get_current_active_superuser),
+) -> Any:
+    """
+    Broadcast delivery latency (p50/p99, enqueue to write), dropped and
+    coalesced frames and queue depth for the room's connections in the
+    worker serving the request. 404 once none are connected here.
+    """
+    stats = manager.get_room_stats(room_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="No connections to this room")
+    return stats
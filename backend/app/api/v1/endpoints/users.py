@@ -1,3 +1,4 @@
+from datetime import datetime, timezone
 from typing import Any, List
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
@@ -5,6 +6,7 @@ from sqlalchemy.orm import Session
 from .... import crud, models, schemas
 from ....database import get_db
 from ....core.security import get_current_active_user, get_current_active_superuser
+from ....core.websocket import manager
 
 router = APIRouter()
 
@@ -27,9 +29,36 @@ def update_user_me(
     """
     Update current user.
     """
-    user = crud.user.update(db, db_obj=current_user, obj_in=user_in)
+    # current_user is a cached snapshot; update the row loaded in this session
+    user = crud.user.get(db, id=current_user.id)
+    user = crud.user.update(db, db_obj=user, obj_in=user_in)
     return user
 
+@router.post("/presence", response_model=List[schemas.UserPresence])
+async def read_presence(
+    presence_in: schemas.PresenceQuery,
+    current_user: models.User = Depends(get_current_active_user),
+) -> Any:
+    """
+    Which of up to 500 users are online, in the order asked. Answered from
+    presence state, not the database; only a `last_seen_at` the presence
+    store does not know is read from the users table.
+    """
+    user_ids = presence_in.user_ids
+    states = await manager.presence.lookup(user_ids)
+    unknown = [user_id for user_id, (_, seen) in zip(user_ids, states) if seen is None]
+    stored = await crud.user.aget_last_seen(None, user_ids=unknown) if unknown else {}
+    return [
+        {
+            "user_id": user_id,
+            "online": online,
+            "last_seen_at": (
+                datetime.fromtimestamp(seen, timezone.utc) if seen is not None else stored.get(user_id)
+            ),
+        }
+        for user_id, (online, seen) in zip(user_ids, states)
+    ]
+
 @router.get("/", response_model=List[schemas.User])
 def read_users(
     db: Session = Depends(get_db),
@@ -1,16 +1,16 @@
-from .security import (
-    get_password_hash,
-    verify_password,
-    create_access_token,
-    get_current_user,
-    get_current_active_user,
-    get_current_active_superuser,
-    oauth2_scheme
-)
+# Re-exported lazily: importing app.core.config from app.database must not
+# pull in security, which itself depends on app.database.
+def __getattr__(name):
+    if name in __all__:
+        from . import security
+        return getattr(security, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 __all__ = [
     'get_password_hash',
     'verify_password',
+    'aget_password_hash',
+    'averify_password',
     'create_access_token',
     'get_current_user',
     'get_current_active_user',
@@ -0,0 +1,116 @@
+"""
+Who may use which room, answered from memory.
+
+Public rooms are open to every user, private ones to their members only.
+Two caches answer a check without a query: room -> public or private, and
+user -> the private rooms they belong to. The most recently active rooms
+and their members are bulk-loaded at startup (warm()), anything else is
+read through on first use, and a user's entry is invalidated when they
+lose a membership (ConnectionManager.revoke(), in every worker).
+
+Only grants are trusted from the cache. Before a user is refused, their
+memberships are reloaded, so someone just added, possibly by another
+worker, gets in at once; the refusal itself costs a query.
+"""
+from typing import FrozenSet, Optional
+
+from fastapi import HTTPException, status
+
+from .. import crud
+from .cache import TTLCache
+from .config import settings
+from .metrics import registry, room_acl_denied
+
+PUBLIC = "public"
+PRIVATE = "private"
+
+
+class RoomACL:
+    def __init__(self, maxsize: int, ttl: float):
+        # room_id -> PUBLIC or PRIVATE; rooms nobody created yet are not kept
+        self.rooms: TTLCache[str] = TTLCache(maxsize=maxsize, ttl=ttl)
+        # user_id -> the private rooms they are a member of
+        self.members: TTLCache[FrozenSet[str]] = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def check(self, user_id: int, room_id: str, claim: bool = False) -> bool:
+        """
+        Whether a user may read and post in a room. Callers that join or
+        post pass claim=True: a room nobody created yet then becomes the
+        user's, private if ROOMS_PRIVATE_BY_DEFAULT. Without claim, such a
+        room is allowed, as there is nothing in it to read.
+        """
+        visibility = self.rooms.get(room_id)
+        if visibility is None:
+            visibility = await self._load_room(room_id)
+        if visibility is None:
+            if not claim:
+                return True
+            is_private = await crud.room.aclaim(
+                None, room_id=room_id, user_id=user_id, is_private=settings.ROOMS_PRIVATE_BY_DEFAULT
+            )
+            visibility = self._set_room(room_id, is_private)
+            self.members.invalidate(user_id)
+        if visibility == PUBLIC:
+            return True
+
+        rooms = self.members.get(user_id)
+        if rooms is not None and room_id in rooms:
+            return True
+        # Maybe added since this was cached
+        if room_id in await self._load_members(user_id):
+            return True
+        room_acl_denied.inc()
+        return False
+
+    async def _load_room(self, room_id: str) -> Optional[str]:
+        room = await crud.room.aget_by_room_id(None, room_id=room_id)
+        return self._set_room(room_id, room.is_private) if room is not None else None
+
+    async def _load_members(self, user_id: int) -> FrozenSet[str]:
+        rooms = frozenset(await crud.room_member.aget_private_room_ids(None, user_id=user_id))
+        self.members.set(user_id, rooms)
+        return rooms
+
+    def _set_room(self, room_id: str, is_private: bool) -> str:
+        visibility = PRIVATE if is_private else PUBLIC
+        self.rooms.set(room_id, visibility)
+        return visibility
+
+    async def warm(self, limit: int = settings.ROOM_ACL_WARM_ROOMS) -> int:
+        """Load the most recently active rooms and their members; returns the rooms loaded"""
+        if limit <= 0:
+            return 0
+        rooms, members = await crud.room.aget_access_index(None, limit=limit)
+        for room_id, is_private in rooms.items():
+            self._set_room(room_id, is_private)
+        for user_id, room_ids in members.items():
+            self.members.set(user_id, frozenset(room_ids))
+        return len(rooms)
+
+    def forget_member(self, user_id: int) -> None:
+        """Drop a user's memberships after they lost one"""
+        self.members.invalidate(user_id)
+
+    def stats(self) -> dict:
+        return {"rooms": self.rooms.stats(), "members": self.members.stats()}
+
+
+room_acl = RoomACL(
+    maxsize=settings.ROOM_ACL_CACHE_MAX_ENTRIES, ttl=settings.ROOM_ACL_CACHE_TTL_SECONDS
+)
+
+async def require_room_access(user_id: int, room_id: str, claim: bool = False) -> None:
+    """403 unless the user may use the room; see RoomACL.check()"""
+    if not await room_acl.check(user_id, room_id, claim=claim):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not a member of this room")
+
+registry.gauge(
+    "room_acl_lookups",
+    "Room access index hits and misses",
+    lambda: {
+        (cache, outcome): room_acl.stats()[cache][outcome]
+        for cache in ("rooms", "members")
+        for outcome in ("hits", "misses")
+    },
+    ("cache", "outcome"),
+)
@@ -0,0 +1,166 @@
+import csv
+import gzip
+import io
+from datetime import datetime, timezone
+from typing import List, NamedTuple, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from ..models import Message, MessageArchive
+from .cache import TTLCache
+from .config import settings
+
+# (created_at, id): the order room history is paged in
+HistoryKey = Tuple[datetime, int]
+
+
+class ArchivedMonth(NamedTuple):
+    """Plain copy of a message_archives row, safe to cache across sessions"""
+    path: str
+    range_start: datetime
+    range_end: datetime
+    min_id: Optional[int]
+    max_id: Optional[int]
+
+
+def _key(row: dict) -> HistoryKey:
+    return (row["created_at"], row["id"])
+
+
+def _aware(value: datetime) -> datetime:
+    # Archive times are aware; SQLite hands back naive UTC ones
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def _utc(key: HistoryKey) -> HistoryKey:
+    return (_aware(key[0]), key[1])
+
+
+def _parse_time(value: str) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _parse(row: dict) -> dict:
+    return dict(
+        id=int(row["id"]),
+        content=row["content"],
+        sender_id=int(row["sender_id"]),
+        recipient_id=int(row["recipient_id"]) if row["recipient_id"] else None,
+        room_id=row["room_id"],
+        is_read=row["is_read"] == "t",
+        read_at=_parse_time(row["read_at"]),
+        created_at=_parse_time(row["created_at"]),
+        updated_at=_parse_time(row["updated_at"]),
+    )
+
+
+def _message(row: dict) -> Message:
+    """
+    Transient Message for an archived row, built per request since callers
+    attach users to it. It is never added to a session.
+    """
+    return Message(**row)
+
+
+class ArchiveReader:
+    """
+    Room history from archived months (see core/partitions.py).
+
+    Archive files are sorted by room, so reading one room stops once its
+    run of rows ends. Parsed (archive, room) histories are kept in an LRU,
+    and the list of archives is cached for a minute. Archives only exist
+    once messages is partitioned, so without MESSAGE_PARTITIONING there is
+    nothing to read and the list is never queried.
+    """
+
+    def __init__(
+        self,
+        max_rooms: int = settings.MESSAGE_ARCHIVE_CACHE_ROOMS,
+        enabled: bool = settings.MESSAGE_PARTITIONING,
+    ):
+        self.enabled = enabled
+        self._rooms: TTLCache[List[dict]] = TTLCache(maxsize=max_rooms, ttl=3600)
+        self._archives: TTLCache[List[ArchivedMonth]] = TTLCache(maxsize=1, ttl=60)
+
+    def archives(self, db: Session) -> List[ArchivedMonth]:
+        """Archived months, newest first"""
+        if not self.enabled:
+            return []
+        archives = self._archives.get("all")
+        if archives is None:
+            rows = db.query(
+                MessageArchive.path,
+                MessageArchive.range_start,
+                MessageArchive.range_end,
+                MessageArchive.min_id,
+                MessageArchive.max_id,
+            ).order_by(MessageArchive.range_start.desc())
+            archives = [
+                ArchivedMonth(path, _aware(start), _aware(end), min_id, max_id)
+                for path, start, end, min_id, max_id in rows
+            ]
+            self._archives.set("all", archives)
+        return archives
+
+    def room_history(self, archive: ArchivedMonth, room_id: str) -> List[dict]:
+        """A room's message rows in one archive, oldest first"""
+        key = (archive.path, room_id)
+        rows = self._rooms.get(key)
+        if rows is not None:
+            return rows
+        rows = []
+        with gzip.open(archive.path, "rb") as raw:
+            for row in csv.DictReader(io.TextIOWrapper(raw, encoding="utf-8", newline="")):
+                if row["room_id"] == room_id:
+                    rows.append(_parse(row))
+                elif rows or row["room_id"] > room_id:
+                    break
+        self._rooms.set(key, rows)
+        return rows
+
+    def find(self, db: Session, *, room_id: str, message_id: int) -> Optional[Message]:
+        for archive in self.archives(db):
+            if archive.min_id is None or not archive.min_id <= message_id <= archive.max_id:
+                continue
+            for row in self.room_history(archive, room_id):
+                if row["id"] == message_id:
+                    return _message(row)
+        return None
+
+    def page_before(
+        self, db: Session, *, room_id: str, before: Optional[HistoryKey], limit: int
+    ) -> List[Message]:
+        """Up to `limit` archived messages older than `before`, newest first"""
+        page: List[Message] = []
+        if before is not None:
+            before = _utc(before)
+        for archive in self.archives(db):
+            if before is not None and archive.range_start > before[0]:
+                continue
+            for row in reversed(self.room_history(archive, room_id)):
+                if before is None or _key(row) < before:
+                    page.append(_message(row))
+                    if len(page) == limit:
+                        return page
+        return page
+
+    def page_after(
+        self, db: Session, *, room_id: str, after: HistoryKey, limit: int
+    ) -> List[Message]:
+        """Up to `limit` archived messages just newer than `after`, newest first"""
+        page: List[Message] = []
+        after = _utc(after)
+        for archive in reversed(self.archives(db)):
+            if archive.range_end <= after[0]:
+                continue
+            for row in self.room_history(archive, room_id):
+                if _key(row) > after:
+                    page.append(_message(row))
+                    if len(page) == limit:
+                        page.reverse()
+                        return page
+        page.reverse()
+        return page
+
+
+archive_reader = ArchiveReader()
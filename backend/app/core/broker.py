@@ -0,0 +1,281 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, List, Optional
+
+from .codec import dumps, loads
+from .metrics import broker_errors, broker_reconnects
+
+# Called with every envelope published by another process
+EventHandler = Callable[[dict], Awaitable[None]]
+
+# Seconds between attempts to reopen a lost listen connection, doubling
+RECONNECT_DELAY = 1.0
+RECONNECT_MAX_DELAY = 30.0
+
+# NOTIFY payloads must be shorter than this
+PG_NOTIFY_MAX_BYTES = 8000
+
+
+class Broker:
+    """
+    Relays WebSocket events between backend processes.
+
+    Envelopes are plain dicts:
+    {"origin": node_id, "kind": "room" | "user", "target": ..., "message": ...}
+    """
+
+    async def start(self, handler: EventHandler) -> None:
+        self.handler = handler
+
+    async def publish(self, envelope: dict) -> None:
+        raise NotImplementedError
+
+    async def stop(self) -> None:
+        pass
+
+    async def _dispatch(self, envelope: dict) -> None:
+        """Run the handler for one event; a failure never stops the listener"""
+        try:
+            await self.handler(envelope)
+        except Exception as e:
+            broker_errors.labels("handler").inc()
+            print(f"Error handling broker event: {e}")
+
+
+class InMemoryBroker(Broker):
+    """
+    Process-local broker. Every InMemoryBroker sharing a hub sees the
+    others' events, which is enough for a single worker and for tests.
+    """
+
+    default_hub: List["InMemoryBroker"] = []
+
+    def __init__(self, hub: Optional[List["InMemoryBroker"]] = None):
+        self.hub = hub if hub is not None else self.default_hub
+        self.handler: Optional[EventHandler] = None
+
+    async def start(self, handler: EventHandler) -> None:
+        self.handler = handler
+        self.hub.append(self)
+
+    async def publish(self, envelope: dict) -> None:
+        for broker in self.hub:
+            if broker is not self and broker.handler is not None:
+                await broker.handler(envelope)
+
+    async def stop(self) -> None:
+        if self in self.hub:
+            self.hub.remove(self)
+        self.handler = None
+
+
+class PostgresBroker(Broker):
+    """
+    PostgreSQL LISTEN/NOTIFY broker.
+
+    The listening connection is polled from the event loop; NOTIFY runs on a
+    single background thread so publish order is preserved. Payloads are
+    limited to 8000 bytes by PostgreSQL: a message event over that is sent
+    without its content, flagged `content_omitted`, for receivers to read
+    back from the database; anything else that large is dropped. Both are
+    counted on /metrics.
+
+    A lost connection is reopened with backoff, and counted on /metrics.
+    Events published while the listener is down are not delivered here.
+    """
+
+    def __init__(self, url: str, channel: str = "chat_events"):
+        self.url = url
+        self.channel = channel
+        self.handler: Optional[EventHandler] = None
+        self._listen_conn = None
+        self._notify_conn = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pg-notify")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._reconnect: Optional[asyncio.Task] = None
+
+    async def start(self, handler: EventHandler) -> None:
+        self.handler = handler
+        self._loop = asyncio.get_running_loop()
+        self._listen()
+        self._notify_conn = self._connect()
+
+    def _connect(self):
+        import psycopg2
+        import psycopg2.extensions
+
+        conn = psycopg2.connect(self.url)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        return conn
+
+    def _listen(self) -> None:
+        self._listen_conn = self._connect()
+        with self._listen_conn.cursor() as cur:
+            cur.execute(f"LISTEN {self.channel}")
+        self._loop.add_reader(self._listen_conn.fileno(), self._on_readable)
+
+    def _on_readable(self) -> None:
+        import psycopg2
+
+        try:
+            self._listen_conn.poll()
+        except psycopg2.Error as e:
+            print(f"Broker listen connection lost: {e}")
+            broker_errors.labels("connection").inc()
+            self._close_listen()
+            self._reconnect = self._loop.create_task(self._relisten())
+            return
+        while self._listen_conn.notifies:
+            notify = self._listen_conn.notifies.pop(0)
+            self._loop.create_task(self._dispatch(loads(notify.payload)))
+
+    async def _relisten(self) -> None:
+        delay = RECONNECT_DELAY
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                self._listen()
+            except Exception as e:
+                self._close_listen()
+                print(f"Error reconnecting broker: {e}")
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+                continue
+            broker_reconnects.inc()
+            return
+
+    def _close_listen(self) -> None:
+        if self._listen_conn is None:
+            return
+        try:
+            self._loop.remove_reader(self._listen_conn.fileno())
+        except Exception:
+            # Closed underneath us, so there is no descriptor to unregister
+            pass
+        self._listen_conn.close()
+        self._listen_conn = None
+
+    def _notify(self, payload: str) -> None:
+        import psycopg2
+
+        try:
+            with self._notify_conn.cursor() as cur:
+                cur.execute("SELECT pg_notify(%s, %s)", (self.channel, payload))
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # Connection lost: reopen it and send this event once more
+            broker_errors.labels("connection").inc()
+            self._notify_conn.close()
+            self._notify_conn = self._connect()
+            broker_reconnects.inc()
+            with self._notify_conn.cursor() as cur:
+                cur.execute("SELECT pg_notify(%s, %s)", (self.channel, payload))
+
+    async def publish(self, envelope: dict) -> None:
+        payload = dumps(envelope)
+        if len(payload.encode()) >= PG_NOTIFY_MAX_BYTES:
+            broker_errors.labels("payload").inc()
+            message = envelope.get("message") or {}
+            if message.get("type") != "message" or "id" not in message:
+                print(f"Broker event too large to relay: {envelope.get('kind')} {message.get('type')}")
+                return
+            stub = {key: value for key, value in message.items() if key != "content"}
+            payload = dumps(dict(envelope, message=dict(stub, content_omitted=True)))
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._notify, payload)
+
+    async def stop(self) -> None:
+        if self._reconnect is not None:
+            self._reconnect.cancel()
+            self._reconnect = None
+        self._close_listen()
+        self._executor.shutdown(wait=True)
+        if self._notify_conn is not None:
+            self._notify_conn.close()
+            self._notify_conn = None
+
+
+class RedisBroker(Broker):
+    """
+    Redis (or any RESP-compatible server) pub/sub broker. Requires `redis`.
+
+    A lost subscription is reopened with backoff, and counted on /metrics.
+    Events published while it is down are not delivered here.
+    """
+
+    def __init__(self, url: str, channel: str = "chat_events"):
+        self.url = url
+        self.channel = channel
+        self.handler: Optional[EventHandler] = None
+        self._redis = None
+        self._pubsub = None
+        self._reader: Optional[asyncio.Task] = None
+
+    async def start(self, handler: EventHandler) -> None:
+        try:
+            import redis.asyncio as aioredis
+        except ImportError as e:
+            raise RuntimeError("RedisBroker requires the 'redis' package") from e
+
+        self.handler = handler
+        self._redis = aioredis.from_url(self.url)
+        self._pubsub = self._redis.pubsub()
+        await self._pubsub.subscribe(self.channel)
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self) -> None:
+        delay = RECONNECT_DELAY
+        while True:
+            try:
+                async for item in self._pubsub.listen():
+                    delay = RECONNECT_DELAY
+                    if item["type"] == "message":
+                        await self._dispatch(loads(item["data"]))
+                # listen() ends once nothing is subscribed
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Broker subscription lost: {e}")
+                broker_errors.labels("connection").inc()
+            while True:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+                try:
+                    await self._resubscribe()
+                except Exception as e:
+                    print(f"Error reconnecting broker: {e}")
+                    continue
+                broker_reconnects.inc()
+                break
+
+    async def _resubscribe(self) -> None:
+        try:
+            await self._pubsub.close()
+        except Exception:
+            pass
+        self._pubsub = self._redis.pubsub()
+        await self._pubsub.subscribe(self.channel)
+
+    async def publish(self, envelope: dict) -> None:
+        await self._redis.publish(self.channel, dumps(envelope))
+
+    async def stop(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+            self._reader = None
+        if self._pubsub is not None:
+            await self._pubsub.unsubscribe(self.channel)
+            await self._pubsub.close()
+            self._pubsub = None
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+
+
+def create_broker(url: str) -> Broker:
+    """Pick a broker backend from a URL (memory://, postgresql://, redis://)"""
+    if not url or url.startswith("memory://"):
+        return InMemoryBroker()
+    if url.startswith(("postgresql://", "postgres://")):
+        return PostgresBroker(url)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBroker(url)
+    raise ValueError(f"Unsupported broker URL: {url}")
@@ -0,0 +1,147 @@
+"""
+Keeps chatty clients from turning into room-wide broadcast storms.
+
+Typing frames are merged into periodic per-room digests, and join/leave
+events are debounced so extra tabs and quick reconnects stay invisible to
+the rest of the room.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .metrics import ws_frames_suppressed
+
+# Broadcasts an event to a room: (room_id, message, exclude)
+Announce = Callable[..., Awaitable[None]]
+
+
+class TypingDigests:
+    """
+    Merges typing frames into one event per room every `interval` seconds,
+    carrying each user's latest state since the previous digest:
+
+        {"type": "typing", "users": [{"user_id", "user_name", "is_typing"}]}
+
+    The flush loop only runs while there is something to send.
+    """
+
+    def __init__(self, interval: float, announce: Announce):
+        self.interval = interval
+        self.announce = announce
+        # room_id -> user_id -> latest typing entry
+        self.pending: Dict[str, Dict[int, dict]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def update(self, room_id: str, user, is_typing: bool) -> None:
+        entry = {"user_id": user.id, "user_name": user.full_name, "is_typing": is_typing}
+        if self.interval <= 0:
+            await self.announce(room_id, {"type": "typing", "users": [entry]})
+            return
+        room = self.pending.setdefault(room_id, {})
+        if user.id in room:
+            ws_frames_suppressed.labels("typing_coalesced").inc()
+        room[user.id] = entry
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while self.pending:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Error sending typing digest: {e}")
+
+    async def flush(self) -> None:
+        pending, self.pending = self.pending, {}
+        for room_id, users in pending.items():
+            await self.announce(room_id, {"type": "typing", "users": list(users.values())})
+
+    def stop(self) -> None:
+        self.pending.clear()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+class JoinLeaveDebouncer:
+    """
+    Announces user_joined when a user's first connection to a room opens
+    and user_left when their last one closes, `grace` seconds later. A
+    reconnect within the grace window cancels the leave and is not
+    announced either.
+    """
+
+    def __init__(self, grace: float, announce: Announce):
+        self.grace = grace
+        self.announce = announce
+        # (room_id, user_id) -> open connections in this process
+        self.connections: Dict[Tuple[str, int], int] = {}
+        # (room_id, user_id) -> task announcing the leave once the window ends
+        self.pending_leaves: Dict[Tuple[str, int], asyncio.Task] = {}
+
+    async def joined(self, room_id: str, user, exclude: Optional[List] = None) -> None:
+        key = (room_id, user.id)
+        count = self.connections.get(key, 0)
+        self.connections[key] = count + 1
+        pending = self.pending_leaves.pop(key, None)
+        if pending is not None:
+            # Back within the grace window: nobody saw the user leave
+            pending.cancel()
+            ws_frames_suppressed.labels("presence_debounced").inc(2)
+            return
+        if count:
+            # Another tab; the room already knows the user is here
+            ws_frames_suppressed.labels("presence_debounced").inc()
+            return
+        await self.announce(room_id, _presence_event("user_joined", user.id, user.full_name), exclude)
+
+    def left(self, room_id: str, user_id: int, user_name: Optional[str]) -> None:
+        """
+        Not a coroutine, so a connection torn down from any path can call
+        it: the leave is always announced from its own task.
+        """
+        key = (room_id, user_id)
+        count = self.connections.get(key, 0) - 1
+        if count > 0:
+            self.connections[key] = count
+            ws_frames_suppressed.labels("presence_debounced").inc()
+            return
+        self.connections.pop(key, None)
+        event = _presence_event("user_left", user_id, user_name)
+        self.pending_leaves[key] = asyncio.create_task(self._leave_later(key, event))
+
+    async def _leave_later(self, key: Tuple[str, int], event: dict) -> None:
+        await asyncio.sleep(max(self.grace, 0))
+        if self.pending_leaves.get(key) is asyncio.current_task():
+            del self.pending_leaves[key]
+        try:
+            await self.announce(key[0], event)
+        except Exception as e:
+            print(f"Error announcing user_left: {e}")
+
+    async def on_remote(self, room_id: str, message: dict) -> None:
+        """
+        Reconcile with a join or leave announced by another process: the
+        user reconnected there, or closed one of several connections.
+        """
+        kind = message.get("type")
+        key = (room_id, message.get("user_id"))
+        if kind == "user_joined":
+            pending = self.pending_leaves.pop(key, None)
+            if pending is not None:
+                pending.cancel()
+                ws_frames_suppressed.labels("presence_debounced").inc()
+        elif kind == "user_left" and self.connections.get(key):
+            # Still connected here, so the room should not think they left
+            await self.announce(
+                room_id, _presence_event("user_joined", key[1], message.get("user_name"))
+            )
+
+    def stop(self) -> None:
+        for task in self.pending_leaves.values():
+            task.cancel()
+        self.pending_leaves.clear()
+
+
+def _presence_event(kind: str, user_id: int, user_name: Optional[str]) -> dict:
+    return {"type": kind, "user_id": user_id, "user_name": user_name}
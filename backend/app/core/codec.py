@@ -0,0 +1,159 @@
+"""
+Wire codecs for the room WebSocket and Server-Sent Events streams.
+
+Clients pick a format with the WebSocket subprotocol header: `chat.msgpack`
+for MessagePack binary frames (when the `msgpack` package is installed) or
+`chat.json` / no subprotocol for JSON text frames. JSON is encoded with
+orjson when it is installed and the standard library otherwise.
+
+Outgoing events are wrapped in a Frame, which encodes at most once per
+codec however many connections it is queued for, whatever their transport.
+"""
+import json
+from typing import Any, Dict, Optional, Tuple, Union
+
+from fastapi import WebSocket, WebSocketDisconnect
+from pydantic import TypeAdapter
+
+from ..schemas.ws import ClientEvent
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to the json module
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional, chat.msgpack is then not offered
+    msgpack = None
+
+Payload = Union[str, bytes]
+
+# Validates straight from the raw frame, without an intermediate dict
+client_event = TypeAdapter(ClientEvent)
+
+
+def stdlib_dumps(obj: Any) -> str:
+    return json.dumps(obj, separators=(",", ":"))
+
+
+if orjson is not None:
+    def dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode()
+
+    loads = orjson.loads
+else:
+    dumps = stdlib_dumps
+    loads = json.loads
+
+
+class Codec:
+    """Encodes outgoing events and parses incoming frames in one wire format"""
+
+    subprotocol: Optional[str] = None
+    # Binary codecs write bytes frames, text codecs str frames
+    binary = False
+
+    def encode(self, event: dict) -> Payload:
+        raise NotImplementedError
+
+    def decode(self, data: bytes) -> Any:
+        raise NotImplementedError
+
+    def parse(self, data: Payload) -> ClientEvent:
+        """Validate an incoming frame; raises pydantic.ValidationError"""
+        if isinstance(data, str) or not self.binary:
+            return client_event.validate_json(data)
+        return client_event.validate_python(self.decode(data))
+
+
+class JSONCodec(Codec):
+    subprotocol = "chat.json"
+
+    def __init__(self, dumps=dumps):
+        self.dumps = dumps
+
+    def encode(self, event: dict) -> Payload:
+        return self.dumps(event)
+
+    def decode(self, data: bytes) -> Any:
+        return loads(data)
+
+
+class MessagePackCodec(Codec):
+    subprotocol = "chat.msgpack"
+    binary = True
+
+    def __init__(self):
+        if msgpack is None:
+            raise RuntimeError("MessagePackCodec requires the 'msgpack' package")
+
+    def encode(self, event: dict) -> Payload:
+        return msgpack.packb(event, use_bin_type=True)
+
+    def decode(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, raw=False)
+
+
+class EventStreamCodec(Codec):
+    """
+    Server-Sent Events: one `data:` line of JSON per event. Messages also
+    get an `id:` line, so a reconnecting EventSource sends the newest
+    message id it saw as Last-Event-ID. Outgoing only.
+    """
+
+    def encode(self, event: dict) -> Payload:
+        data = dumps(event)
+        if event.get("type") == "message":
+            return f"id: {event['id']}\ndata: {data}\n\n"
+        return f"data: {data}\n\n"
+
+
+json_codec = JSONCodec()
+sse_codec = EventStreamCodec()
+
+# Subprotocol name -> codec, for the formats this process can speak
+CODECS: Dict[str, Codec] = {json_codec.subprotocol: json_codec}
+if msgpack is not None:
+    CODECS[MessagePackCodec.subprotocol] = MessagePackCodec()
+
+
+def negotiate(websocket: WebSocket) -> Tuple[Codec, Optional[str]]:
+    """
+    The codec for a connection and the subprotocol to accept it with: the
+    client's first offered format this process supports, otherwise JSON.
+    """
+    for name in websocket.scope.get("subprotocols") or ():
+        codec = CODECS.get(name)
+        if codec is not None:
+            return codec, name
+    return json_codec, None
+
+
+async def receive(websocket: WebSocket) -> Payload:
+    """Next text or binary frame from a client"""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+    text = message.get("text")
+    return text if text is not None else message.get("bytes", b"")
+
+
+class Frame:
+    """
+    An outgoing event, encoded lazily and at most once per codec no matter
+    how many connections it is queued for.
+    """
+
+    __slots__ = ("event", "_encoded")
+
+    def __init__(self, event: dict):
+        self.event = event
+        self._encoded: Dict[Codec, Payload] = {}
+
+    def encode(self, codec: Codec) -> Payload:
+        payload = self._encoded.get(codec)
+        if payload is None:
+            payload = self._encoded[codec] = codec.encode(self.event)
+        return payload
+
@@ -1,4 +1,4 @@
-from pydantic import PostgresDsn, computed_field, Field
+from pydantic import AliasChoices, PostgresDsn, computed_field, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing import List, Optional
 import os
@@ -9,20 +9,135 @@ class Settings(BaseSettings):
     PROJECT_NAME: str = "Real-Time Chat API"
     
     # Security
-    SECRET_KEY: str = Field(default="your-secret-key-here", env="JWT_SECRET")
-    ALGORITHM: str = Field(default="HS256", env="JWT_ALGORITHM")
+    # JWT_SECRET/JWT_ALGORITHM take precedence, as deployments set those
+    SECRET_KEY: str = Field(default="your-secret-key-here", validation_alias=AliasChoices("JWT_SECRET", "SECRET_KEY"))
+    ALGORITHM: str = Field(default="HS256", validation_alias=AliasChoices("JWT_ALGORITHM", "ALGORITHM"))
     ACCESS_TOKEN_EXPIRE_MINUTES: int = Field(default=10080, env="ACCESS_TOKEN_EXPIRE_MINUTES")  # 7 days in minutes
     
+    # Password hashing
+    BCRYPT_ROUNDS: int = Field(default=12, env="BCRYPT_ROUNDS")
+    PASSWORD_HASH_WORKERS: int = Field(default=2, env="PASSWORD_HASH_WORKERS")
+    # Hash/verify calls allowed to wait for a worker before login/register return 503
+    PASSWORD_HASH_QUEUE_LIMIT: int = Field(default=32, env="PASSWORD_HASH_QUEUE_LIMIT")
+    
+    # Request auth cache (decoded tokens and user snapshots)
+    AUTH_CACHE_TTL_SECONDS: float = Field(default=30.0, env="AUTH_CACHE_TTL_SECONDS")
+    AUTH_CACHE_MAX_ENTRIES: int = Field(default=10000, env="AUTH_CACHE_MAX_ENTRIES")
+    
+    # Room access index: entries kept, how long they are trusted, and how
+    # many recently active rooms are loaded at startup
+    ROOM_ACL_CACHE_MAX_ENTRIES: int = Field(default=100000, env="ROOM_ACL_CACHE_MAX_ENTRIES")
+    ROOM_ACL_CACHE_TTL_SECONDS: float = Field(default=300.0, env="ROOM_ACL_CACHE_TTL_SECONDS")
+    ROOM_ACL_WARM_ROOMS: int = Field(default=10000, env="ROOM_ACL_WARM_ROOMS")
+    # Whether rooms created by the first join or message are members-only
+    ROOMS_PRIVATE_BY_DEFAULT: bool = Field(default=True, env="ROOMS_PRIVATE_BY_DEFAULT")
+    
     # Database
     POSTGRES_SERVER: str = Field(default="db", env="POSTGRES_SERVER")
     POSTGRES_USER: str = Field(default="postgres", env="POSTGRES_USER")
     POSTGRES_PASSWORD: str = Field(default="postgres", env="POSTGRES_PASSWORD")
     POSTGRES_DB: str = Field(default="fastapi", env="POSTGRES_DB")
     
+    # Full URL from the DATABASE_URL env var; when unset, built from POSTGRES_*
+    # if any of them is given, else the local SQLite file
+    SQLALCHEMY_DATABASE_URL: Optional[str] = Field(default=None, validation_alias="DATABASE_URL")
+    
     @computed_field
     @property
     def DATABASE_URL(self) -> str:
-        return f"postgresql://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_SERVER}/{self.POSTGRES_DB}"
+        if self.SQLALCHEMY_DATABASE_URL:
+            return self.SQLALCHEMY_DATABASE_URL
+        if self.model_fields_set & {"POSTGRES_SERVER", "POSTGRES_USER", "POSTGRES_PASSWORD", "POSTGRES_DB"}:
+            return f"postgresql://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_SERVER}/{self.POSTGRES_DB}"
+        return "sqlite:///./test.db"
+    
+    # Connection pool (ignored for SQLite)
+    DB_POOL_SIZE: int = Field(default=5, env="DB_POOL_SIZE")
+    DB_MAX_OVERFLOW: int = Field(default=10, env="DB_MAX_OVERFLOW")
+    DB_POOL_TIMEOUT: float = Field(default=30.0, env="DB_POOL_TIMEOUT")
+    DB_POOL_RECYCLE: int = Field(default=1800, env="DB_POOL_RECYCLE")
+    DB_POOL_PRE_PING: bool = Field(default=True, env="DB_POOL_PRE_PING")
+    # Per-statement limit in milliseconds, 0 disables it
+    DB_STATEMENT_TIMEOUT_MS: int = Field(default=0, env="DB_STATEMENT_TIMEOUT_MS")
+    # Behind PgBouncer (transaction pooling): no client-side pool, no session state
+    DB_PGBOUNCER_MODE: bool = Field(default=False, env="DB_PGBOUNCER_MODE")
+    # Threads for blocking database calls made from async code
+    DB_EXECUTOR_WORKERS: int = Field(default=8, env="DB_EXECUTOR_WORKERS")
+    # Refuse to start unless the database is at the Alembic head revision
+    # (run `alembic upgrade head` once per deploy); false only warns
+    DB_REQUIRE_HEAD: bool = Field(default=True, env="DB_REQUIRE_HEAD")
+    # Pooled connections opened at startup, at most DB_POOL_SIZE (0 disables)
+    DB_POOL_WARM_CONNECTIONS: int = Field(default=5, env="DB_POOL_WARM_CONNECTIONS")
+    # Print how long imports and each startup step took
+    STARTUP_PROFILE: bool = Field(default=False, env="STARTUP_PROFILE")
+    
+    # WebSocket fan-out
+    WS_SEND_QUEUE_SIZE: int = Field(default=256, env="WS_SEND_QUEUE_SIZE")
+    # One of: drop_oldest, coalesce, disconnect
+    WS_SLOW_CONSUMER_POLICY: str = Field(default="drop_oldest", env="WS_SLOW_CONSUMER_POLICY")
+    # memory:// (single process), postgresql://... (LISTEN/NOTIFY) or redis://...
+    BROKER_URL: str = Field(default="memory://", env="BROKER_URL")
+    # Recent message/read events kept per room to replay on reconnect, and
+    # how many rooms keep them (least recently active rooms are dropped)
+    WS_REPLAY_BUFFER_SIZE: int = Field(default=256, env="WS_REPLAY_BUFFER_SIZE")
+    WS_REPLAY_BUFFER_ROOMS: int = Field(default=1000, env="WS_REPLAY_BUFFER_ROOMS")
+    # Most new messages per room returned by sync or a reconnect replay
+    SYNC_MAX_MESSAGES: int = Field(default=200, env="SYNC_MAX_MESSAGES")
+    # Typing frames are merged into one digest per room every interval (0 sends each at once)
+    WS_TYPING_DIGEST_MS: int = Field(default=250, env="WS_TYPING_DIGEST_MS")
+    # A leave is announced only if the user has not reconnected within this
+    # window, so flaky clients do not flap user_left/user_joined
+    WS_PRESENCE_GRACE_MS: int = Field(default=5000, env="WS_PRESENCE_GRACE_MS")
+    # Inbound frames per second allowed per connection, and the burst on top (0 disables)
+    WS_INBOUND_RATE: float = Field(default=10.0, env="WS_INBOUND_RATE")
+    WS_INBOUND_BURST: int = Field(default=20, env="WS_INBOUND_BURST")
+    # Rooms one multiplexed WebSocket may be subscribed to at once
+    WS_MAX_ROOMS_PER_CONNECTION: int = Field(default=50, env="WS_MAX_ROOMS_PER_CONNECTION")
+    # Quiet connections are pinged after this long and reaped after the
+    # idle timeout without any frame (0 interval disables both)
+    WS_PING_INTERVAL_SECONDS: float = Field(default=25.0, env="WS_PING_INTERVAL_SECONDS")
+    WS_IDLE_TIMEOUT_SECONDS: float = Field(default=60.0, env="WS_IDLE_TIMEOUT_SECONDS")
+    # memory:// (this process only) or redis://... (shared by every worker)
+    PRESENCE_URL: str = Field(default="memory://", env="PRESENCE_URL")
+    # Last-seen times are written to the users table in batches this often
+    LAST_SEEN_FLUSH_SECONDS: float = Field(default=60.0, env="LAST_SEEN_FLUSH_SECONDS")
+    # Idle SSE streams get a comment line this often so proxies keep them open
+    SSE_KEEPALIVE_SECONDS: float = Field(default=15.0, env="SSE_KEEPALIVE_SECONDS")
+    # Longest a long poll waits for an event before returning empty
+    LONG_POLL_TIMEOUT_SECONDS: float = Field(default=25.0, env="LONG_POLL_TIMEOUT_SECONDS")
+    
+    # Write-behind message persistence for the WebSocket path
+    MESSAGE_PIPELINE_ENABLED: bool = Field(default=False, env="MESSAGE_PIPELINE_ENABLED")
+    MESSAGE_BATCH_SIZE: int = Field(default=100, env="MESSAGE_BATCH_SIZE")
+    MESSAGE_BATCH_LINGER_MS: float = Field(default=5.0, env="MESSAGE_BATCH_LINGER_MS")
+    MESSAGE_QUEUE_SIZE: int = Field(default=10000, env="MESSAGE_QUEUE_SIZE")
+    
+    # Monthly range partitions of messages by created_at (PostgreSQL only,
+    # applied by migration 0006); history reads fall back to archived
+    # months only when set
+    MESSAGE_PARTITIONING: bool = Field(default=False, env="MESSAGE_PARTITIONING")
+    # Partitions created ahead of the current month
+    MESSAGE_PARTITION_PREMAKE_MONTHS: int = Field(default=3, env="MESSAGE_PARTITION_PREMAKE_MONTHS")
+    # Partitions older than this many months are archived; 0 keeps everything
+    MESSAGE_RETENTION_MONTHS: int = Field(default=0, env="MESSAGE_RETENTION_MONTHS")
+    MESSAGE_ARCHIVE_DIR: str = Field(default="./archives", env="MESSAGE_ARCHIVE_DIR")
+    # Archived (archive, room) histories kept in memory once read
+    MESSAGE_ARCHIVE_CACHE_ROOMS: int = Field(default=64, env="MESSAGE_ARCHIVE_CACHE_ROOMS")
+    
+    # Newest messages of active rooms kept serialized for first-page history
+    # reads: memory:// (per process), redis://... (shared) or empty to disable
+    MESSAGE_CACHE_URL: str = Field(default="memory://", env="MESSAGE_CACHE_URL")
+    # Messages kept per room; first pages up to this size are served from it
+    MESSAGE_CACHE_SIZE: int = Field(default=50, env="MESSAGE_CACHE_SIZE")
+    # memory:// only: total serialized bytes and rooms before cold rooms go
+    MESSAGE_CACHE_MAX_BYTES: int = Field(default=64 * 1024 * 1024, env="MESSAGE_CACHE_MAX_BYTES")
+    MESSAGE_CACHE_MAX_ROOMS: int = Field(default=10000, env="MESSAGE_CACHE_MAX_ROOMS")
+    
+    # Message search ranks at most this many of the newest matches
+    SEARCH_MAX_CANDIDATES: int = Field(default=5000, env="SEARCH_MAX_CANDIDATES")
+    
+    # Prometheus-style /metrics endpoint; disabled makes instrumentation a no-op
+    METRICS_ENABLED: bool = Field(default=True, env="METRICS_ENABLED")
     
     # CORS
     BACKEND_CORS_ORIGINS: List[str] = ["http://localhost:3000", "http://localhost:8000"]
@@ -0,0 +1,224 @@
+import asyncio
+import time
+from collections import deque
+from enum import Enum
+from typing import Callable, Deque, Dict, List, Optional, Tuple, Union
+
+from fastapi import WebSocket, status
+
+from .codec import Codec, Frame, json_codec
+from .metrics import ws_frames_out, ws_send_failures
+
+
+class SlowConsumerPolicy(str, Enum):
+    """What to do when a connection's outgoing queue is full"""
+    DROP_OLDEST = "drop_oldest"
+    COALESCE = "coalesce"
+    DISCONNECT = "disconnect"
+
+
+class RoomFanoutStats:
+    """Delivery counters for a single room"""
+
+    def __init__(self, sample_size: int = 1024):
+        self.broadcasts = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.frames_coalesced = 0
+        self.slow_disconnects = 0
+        self.max_queue_depth = 0
+        # Recent enqueue -> socket write latencies in seconds
+        self.latencies: Deque[float] = deque(maxlen=sample_size)
+
+    def percentile(self, pct: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * pct / 100))
+        return ordered[index]
+
+    def as_dict(self) -> dict:
+        return {
+            "broadcasts": self.broadcasts,
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "frames_coalesced": self.frames_coalesced,
+            "slow_disconnects": self.slow_disconnects,
+            "max_queue_depth": self.max_queue_depth,
+            "latency_p50_ms": self.percentile(50) * 1000,
+            "latency_p99_ms": self.percentile(99) * 1000,
+        }
+
+
+# (frame, coalesce key, enqueue time, room stats)
+QueuedFrame = Tuple[Frame, Optional[str], float, Optional[RoomFanoutStats]]
+
+
+class FrameQueue:
+    """
+    Bounded outgoing queue for one subscriber, applying the slow-consumer
+    policy when it fills. Subclasses decide how queued frames are written.
+    """
+
+    def __init__(self, *, max_queue: int, policy: SlowConsumerPolicy):
+        self.max_queue = max_queue
+        self.policy = policy
+        self.queue: Deque[QueuedFrame] = deque()
+        self.closed = False
+        self._evict = False
+        self._wakeup = asyncio.Event()
+
+    def enqueue(
+        self,
+        frame: Frame,
+        *,
+        key: Optional[str] = None,
+        stats: Optional[RoomFanoutStats] = None,
+        now: Optional[float] = None,
+    ) -> None:
+        if self.closed or self._evict:
+            return
+        entry = (frame, key, now if now is not None else time.perf_counter(), stats)
+
+        if len(self.queue) >= self.max_queue:
+            if self.policy == SlowConsumerPolicy.DISCONNECT:
+                self._evict = True
+                if stats is not None:
+                    stats.slow_disconnects += 1
+                self._wakeup.set()
+                return
+            if self.policy == SlowConsumerPolicy.COALESCE and key is not None:
+                for index in range(len(self.queue) - 1, -1, -1):
+                    if self.queue[index][1] == key:
+                        # Keep the original enqueue time so latency stays honest
+                        self.queue[index] = (frame, key, self.queue[index][2], stats)
+                        if stats is not None:
+                            stats.frames_coalesced += 1
+                        return
+            dropped = self.queue.popleft()
+            if dropped[3] is not None:
+                dropped[3].frames_dropped += 1
+
+        self.queue.append(entry)
+        if stats is not None and len(self.queue) > stats.max_queue_depth:
+            stats.max_queue_depth = len(self.queue)
+        self._wakeup.set()
+
+    def close(self) -> None:
+        """Discard anything still queued and stop accepting frames"""
+        self.closed = True
+        self.queue.clear()
+        self._wakeup.set()
+
+
+class ConnectionWriter(FrameQueue):
+    """
+    Bounded outgoing queue plus a dedicated writer task for one WebSocket.
+
+    Broadcasts only enqueue frames shared by every recipient, so a slow
+    socket never blocks delivery to the rest of the room. Each frame is
+    written in the connection's negotiated codec.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        *,
+        max_queue: int,
+        policy: SlowConsumerPolicy,
+        on_error: Callable[[WebSocket], None],
+        codec: Codec = json_codec,
+    ):
+        super().__init__(max_queue=max_queue, policy=policy)
+        self.websocket = websocket
+        self.codec = codec
+        self._send = websocket.send_bytes if codec.binary else websocket.send_text
+        self.on_error = on_error
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                if self._evict:
+                    self.queue.clear()
+                    await self.websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+                    break
+                while self.queue:
+                    frame, _, enqueued_at, stats = self.queue.popleft()
+                    await self._send(frame.encode(self.codec))
+                    ws_frames_out.inc()
+                    if stats is not None:
+                        stats.frames_sent += 1
+                        stats.latencies.append(time.perf_counter() - enqueued_at)
+                    if self._evict:
+                        break
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            ws_send_failures.inc()
+            print(f"Error sending message: {e}")
+        self.closed = True
+        self.on_error(self.websocket)
+
+    def close(self) -> None:
+        """Stop the writer task and discard anything still queued"""
+        super().close()
+        if not self._task.done() and self._task is not asyncio.current_task():
+            self._task.cancel()
+
+
+class StreamQueue(FrameQueue):
+    """
+    Subscriber for transports that write from the request handler: SSE
+    streams and long polls. It is registered with the ConnectionManager as
+    both the connection and its writer, and has no task of its own, so an
+    idle subscriber is little more than a deque and an Event.
+    """
+
+    async def wait(self, timeout: float) -> Optional[List[Frame]]:
+        """
+        Frames queued since the last call, waiting up to `timeout` seconds
+        for the first. Returns [] on timeout and None once the subscriber
+        is closed or was evicted as a slow consumer.
+        """
+        if not self.queue and not (self.closed or self._evict):
+            self._wakeup.clear()
+            # A timer rather than wait_for, which would add a task per waiter
+            timer = asyncio.get_running_loop().call_later(timeout, self._wakeup.set)
+            try:
+                await self._wakeup.wait()
+            finally:
+                timer.cancel()
+        if self.closed or self._evict:
+            return None
+        now = time.perf_counter()
+        frames = []
+        while self.queue:
+            frame, _, enqueued_at, stats = self.queue.popleft()
+            frames.append(frame)
+            if stats is not None:
+                stats.frames_sent += 1
+                stats.latencies.append(now - enqueued_at)
+        return frames
+
+
+# What the ConnectionManager tracks per subscriber
+Connection = Union[WebSocket, StreamQueue]
+
+
+class FanoutStats:
+    """Per-room counters keyed by room id"""
+
+    def __init__(self):
+        self.rooms: Dict[str, RoomFanoutStats] = {}
+
+    def for_room(self, room_id: str) -> RoomFanoutStats:
+        stats = self.rooms.get(room_id)
+        if stats is None:
+            stats = self.rooms[room_id] = RoomFanoutStats()
+        return stats
+
+    def discard(self, room_id: str) -> None:
+        self.rooms.pop(room_id, None)
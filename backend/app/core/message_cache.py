@@ -0,0 +1,388 @@
+"""
+Newest messages of active rooms, kept serialized for first-page history.
+
+Almost every history read is the first page of a busy room. Rooms enter
+the cache when such a read misses (the page is stored as it goes out) and
+stay current from then on: new messages are pushed onto them as they are
+committed, and anything that changes messages already cached (read
+receipts, user renames) invalidates them. A fill only lands if nothing
+touched the room while its page was read, so a message committed in
+between is never lost.
+
+Backends are picked by MESSAGE_CACHE_URL like the broker: memory:// keeps
+rooms in this process under a byte budget, redis://... shares them between
+workers. With memory:// and several workers, a room is dropped when another
+worker's message or read event for it arrives through the broker.
+"""
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+from ..schemas.message import Message as MessageSchema
+from .config import settings
+from .metrics import registry
+
+
+class CachedMessage(NamedTuple):
+    """A message serialized as history returns it"""
+    id: int
+    body: bytes
+
+
+def serialize(message: Any) -> CachedMessage:
+    """Serialize a message with its sender and recipient loaded"""
+    return CachedMessage(message.id, MessageSchema.model_validate(message).model_dump_json().encode())
+
+
+class RecentMessages:
+    """
+    Per-room cache of the newest `size` messages, newest first.
+
+    A room that holds fewer than a request's limit can still answer it when
+    it is `complete`, i.e. holds the whole room.
+    """
+
+    # Lookups do network I/O, so async callers run them on a thread
+    blocking = False
+    # Only sees this process's writes; other workers' arrive as broker events
+    process_local = False
+
+    def __init__(self, size: int = settings.MESSAGE_CACHE_SIZE):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, room_id: str, limit: int) -> Optional[List[CachedMessage]]:
+        """The newest `limit` messages, or None if the room cannot answer"""
+        entries = self._get(room_id, limit) if limit <= self.size else None
+        if entries is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entries
+
+    async def aget(self, room_id: str, limit: int) -> Optional[List[CachedMessage]]:
+        if self.blocking:
+            return await asyncio.to_thread(self.get, room_id, limit)
+        return self.get(room_id, limit)
+
+    def begin_fill(self, room_id: str) -> Any:
+        """Token to pass to fill() once the room's first page has been read"""
+        raise NotImplementedError
+
+    def fill(self, room_id: str, token: Any, entries: List[CachedMessage], complete: bool) -> bool:
+        """Store a first page unless the room changed since begin_fill()"""
+        raise NotImplementedError
+
+    def holds(self, room_id: str) -> bool:
+        raise NotImplementedError
+
+    def push(self, room_id: str, entries: List[CachedMessage]) -> None:
+        """
+        Add newly committed messages to the room, if it is cached. Rooms
+        that are not must be invalidated instead, to void fills in flight.
+        """
+        raise NotImplementedError
+
+    def invalidate(self, room_ids: Iterable[str]) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def _get(self, room_id: str, limit: int) -> Optional[List[CachedMessage]]:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class NullRecentMessages(RecentMessages):
+    """Disabled cache: every lookup misses and nothing is stored"""
+
+    def begin_fill(self, room_id: str) -> Any:
+        return None
+
+    def fill(self, room_id: str, token: Any, entries: List[CachedMessage], complete: bool) -> bool:
+        return False
+
+    def holds(self, room_id: str) -> bool:
+        return False
+
+    def push(self, room_id: str, entries: List[CachedMessage]) -> None:
+        pass
+
+    def invalidate(self, room_ids: Iterable[str]) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+    def _get(self, room_id: str, limit: int) -> Optional[List[CachedMessage]]:
+        return None
+
+
+class _CachedRoom:
+    def __init__(self, entries: List[CachedMessage], complete: bool):
+        self.entries = entries
+        self.complete = complete
+        self.nbytes = sum(len(entry.body) for entry in entries)
+
+
+class MemoryRecentMessages(RecentMessages):
+    """
+    Process-local rooms in LRU order. The least recently used rooms are
+    evicted once the serialized bytes exceed `max_bytes` or there are more
+    than `max_rooms`. Thread-safe, as writes arrive from database threads.
+    """
+
+    process_local = True
+
+    def __init__(
+        self,
+        size: int = settings.MESSAGE_CACHE_SIZE,
+        max_bytes: int = settings.MESSAGE_CACHE_MAX_BYTES,
+        max_rooms: int = settings.MESSAGE_CACHE_MAX_ROOMS,
+    ):
+        super().__init__(size)
+        self.max_bytes = max_bytes
+        self.max_rooms = max_rooms
+        self.nbytes = 0
+        self.evictions = 0
+        self._rooms: "OrderedDict[str, _CachedRoom]" = OrderedDict()
+        # room_id -> token of the fill in progress; any change drops it
+        self._filling: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, room_id: str, limit: int) -> Optional[List[CachedMessage]]:
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is None or (len(room.entries) < limit and not room.complete):
+                return None
+            self._rooms.move_to_end(room_id)
+            return room.entries[:limit]
+
+    def begin_fill(self, room_id: str) -> Any:
+        token = object()
+        with self._lock:
+            if len(self._filling) >= self.max_rooms:
+                # Abandoned fills (failed reads) never finish; start over
+                self._filling.clear()
+            self._filling[room_id] = token
+        return token
+
+    def fill(self, room_id: str, token: Any, entries: List[CachedMessage], complete: bool) -> bool:
+        if not entries:
+            return False
+        with self._lock:
+            if self._filling.get(room_id) is not token:
+                return False
+            del self._filling[room_id]
+            self._discard(room_id)
+            room = _CachedRoom(entries[:self.size], complete and len(entries) <= self.size)
+            self._rooms[room_id] = room
+            self.nbytes += room.nbytes
+            self._evict()
+        return True
+
+    def holds(self, room_id: str) -> bool:
+        return room_id in self._rooms
+
+    def push(self, room_id: str, entries: List[CachedMessage]) -> None:
+        with self._lock:
+            self._filling.pop(room_id, None)
+            room = self._rooms.get(room_id)
+            if room is None:
+                return
+            known = {entry.id for entry in room.entries}
+            for entry in entries:
+                if entry.id in known:
+                    continue
+                # Writers can commit out of id order; keep newest first
+                index = 0
+                while index < len(room.entries) and room.entries[index].id > entry.id:
+                    index += 1
+                room.entries.insert(index, entry)
+                room.nbytes += len(entry.body)
+                self.nbytes += len(entry.body)
+            while len(room.entries) > self.size:
+                dropped = room.entries.pop()
+                room.nbytes -= len(dropped.body)
+                self.nbytes -= len(dropped.body)
+                room.complete = False
+            self._rooms.move_to_end(room_id)
+            self._evict()
+
+    def invalidate(self, room_ids: Iterable[str]) -> None:
+        with self._lock:
+            for room_id in room_ids:
+                self._filling.pop(room_id, None)
+                self._discard(room_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._filling.clear()
+            self._rooms.clear()
+            self.nbytes = 0
+
+    def _discard(self, room_id: str) -> None:
+        room = self._rooms.pop(room_id, None)
+        if room is not None:
+            self.nbytes -= room.nbytes
+
+    def _evict(self) -> None:
+        while self._rooms and (self.nbytes > self.max_bytes or len(self._rooms) > self.max_rooms):
+            _, room = self._rooms.popitem(last=False)
+            self.nbytes -= room.nbytes
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        result = super().stats()
+        result.update(rooms=len(self._rooms), bytes=self.nbytes, evictions=self.evictions)
+        return result
+
+
+# KEYS: list, version, complete flag. ARGV: size, ttl, entries oldest first
+PUSH_SCRIPT = """
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+for i = 3, #ARGV do redis.call('LPUSH', KEYS[1], ARGV[i]) end
+if redis.call('LLEN', KEYS[1]) > tonumber(ARGV[1]) then
+    redis.call('LTRIM', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+    redis.call('DEL', KEYS[3])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+# KEYS: list, version, complete flag. ARGV: token, complete, ttl, entries newest first
+FILL_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then return 0 end
+redis.call('DEL', KEYS[1], KEYS[3])
+redis.call('RPUSH', KEYS[1], unpack(ARGV, 4))
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+if ARGV[2] == '1' then redis.call('SET', KEYS[3], '1', 'EX', ARGV[3]) end
+return 1
+"""
+
+
+class RedisRecentMessages(RecentMessages):
+    """
+    Rooms shared by every worker through Redis. Requires `redis`.
+
+    Each room is a list of entries plus a version counter bumped by every
+    change, which fills check atomically. Memory is bounded by the key TTL
+    and the server's own maxmemory policy (allkeys-lru is a good fit).
+    """
+
+    blocking = True
+
+    def __init__(
+        self,
+        url: str,
+        size: int = settings.MESSAGE_CACHE_SIZE,
+        prefix: str = "chat:recent:",
+        ttl: int = 24 * 3600,
+    ):
+        super().__init__(size)
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("RedisRecentMessages requires the 'redis' package") from e
+        self._redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.ttl = ttl
+        self._push = self._redis.register_script(PUSH_SCRIPT)
+        self._fill = self._redis.register_script(FILL_SCRIPT)
+
+    def _keys(self, room_id: str) -> List[str]:
+        key = self.prefix + room_id
+        return [key, key + ":v", key + ":c"]
+
+    @staticmethod
+    def _encode(entry: CachedMessage) -> bytes:
+        return b"%d\n" % entry.id + entry.body
+
+    @staticmethod
+    def _decode(raw: bytes) -> CachedMessage:
+        message_id, _, body = raw.partition(b"\n")
+        return CachedMessage(int(message_id), body)
+
+    def _get(self, room_id: str, limit: int) -> Optional[List[CachedMessage]]:
+        key, _, complete_key = self._keys(room_id)
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.lrange(key, 0, limit - 1)
+        pipe.exists(complete_key)
+        raw, complete = pipe.execute()
+        if not raw or (len(raw) < limit and not complete):
+            return None
+        return [self._decode(item) for item in raw]
+
+    def begin_fill(self, room_id: str) -> Any:
+        version = self._redis.get(self._keys(room_id)[1])
+        return version.decode() if version is not None else "0"
+
+    def fill(self, room_id: str, token: Any, entries: List[CachedMessage], complete: bool) -> bool:
+        if not entries:
+            return False
+        entries = entries[:self.size]
+        complete = complete and len(entries) <= self.size
+        args = [token, "1" if complete else "0", self.ttl] + [self._encode(entry) for entry in entries]
+        return bool(self._fill(keys=self._keys(room_id), args=args))
+
+    def holds(self, room_id: str) -> bool:
+        return bool(self._redis.exists(self._keys(room_id)[0]))
+
+    def push(self, room_id: str, entries: List[CachedMessage]) -> None:
+        ordered = sorted(entries, key=lambda entry: entry.id)
+        args = [self.size, self.ttl] + [self._encode(entry) for entry in ordered]
+        self._push(keys=self._keys(room_id), args=args)
+
+    def invalidate(self, room_ids: Iterable[str]) -> None:
+        pipe = self._redis.pipeline(transaction=False)
+        for room_id in room_ids:
+            key, version_key, complete_key = self._keys(room_id)
+            pipe.delete(key, complete_key)
+            pipe.incr(version_key)
+            pipe.expire(version_key, self.ttl)
+        pipe.execute()
+
+    def clear(self) -> None:
+        for key in self._redis.scan_iter(match=self.prefix + "*", count=1000):
+            if not key.endswith(b":v"):
+                self._redis.delete(key)
+            else:
+                self._redis.incr(key)
+
+
+def create_message_cache(url: str) -> RecentMessages:
+    """Pick a cache backend from a URL (memory://, redis://, or empty to disable)"""
+    if not url:
+        return NullRecentMessages()
+    if url.startswith("memory://"):
+        return MemoryRecentMessages()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisRecentMessages(url)
+    raise ValueError(f"Unsupported message cache URL: {url}")
+
+
+message_cache = create_message_cache(settings.MESSAGE_CACHE_URL)
+
+registry.gauge(
+    "message_cache_lookups",
+    "Recent-message cache hits and misses",
+    lambda: {(outcome,): message_cache.stats()[outcome] for outcome in ("hits", "misses")},
+    ("outcome",),
+)
+registry.gauge("message_cache_hit_ratio", "Recent-message cache hit ratio", lambda: message_cache.stats()["hit_ratio"])
+if isinstance(message_cache, MemoryRecentMessages):
+    # Redis keeps its own memory accounting; only this process's rooms are counted here
+    registry.gauge("message_cache_rooms", "Rooms in the recent-message cache", lambda: message_cache.stats()["rooms"])
+    registry.gauge("message_cache_bytes", "Serialized bytes in the recent-message cache", lambda: message_cache.stats()["bytes"])
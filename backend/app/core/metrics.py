@@ -0,0 +1,272 @@
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from .config import settings
+
+# Request/query latency buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Counter:
+    """Monotonic counter. Increments are plain attribute adds (~50 ns)."""
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram in the Prometheus style: observations are
+    counted into the first bucket whose upper bound is >= the value.
+    """
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> Dict[str, int]:
+        """Cumulative counts keyed by upper bound, ending with "+Inf" """
+        result = {}
+        running = 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            result[repr(float(bound))] = running
+        result["+Inf"] = running + self.counts[-1]
+        return result
+
+    def snapshot(self) -> dict:
+        return {"buckets": self.cumulative(), "sum": self.sum, "count": self.count}
+
+
+class _NoopMetric:
+    """Stands in for every metric type when metrics are disabled"""
+    __slots__ = ()
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+    def observe(self, value: float) -> None:
+        pass
+
+    def labels(self, *values: str) -> "_NoopMetric":
+        return self
+
+
+NOOP = _NoopMetric()
+
+
+class MetricFamily:
+    """A named metric with zero or more label dimensions"""
+
+    def __init__(self, name: str, help: str, kind: str, labelnames: Sequence[str], factory: Callable):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self._factory = factory
+        self.children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            child = self.children[()] = factory()
+            # Bind straight to the single child to skip a call per event
+            for name in ("inc", "observe"):
+                if hasattr(child, name):
+                    setattr(self, name, getattr(child, name))
+
+    def labels(self, *values: str):
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = self._factory()
+        return child
+
+    # Unlabelled families behave like their single child
+    def inc(self, amount: float = 1) -> None:
+        self.children[()].inc(amount)
+
+    def observe(self, value: float) -> None:
+        self.children[()].observe(value)
+
+
+class MetricsRegistry:
+    """
+    In-process metrics with Prometheus text exposition. Hot paths only
+    touch counters and histograms; gauges are callbacks evaluated when
+    /metrics is scraped. With enabled=False every metric is a no-op.
+    """
+
+    def __init__(self, enabled: bool = True, prefix: str = "chat_"):
+        self.enabled = enabled
+        self.prefix = prefix
+        self._families: List[MetricFamily] = []
+        # name -> (help, callback returning a value or {label tuple: value}, labelnames)
+        self._gauges: Dict[str, Tuple[str, Callable, Tuple[str, ...]]] = {}
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        if not self.enabled:
+            return NOOP
+        family = MetricFamily(self.prefix + name, help, "counter", labelnames, Counter)
+        self._families.append(family)
+        return family
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        if not self.enabled:
+            return NOOP
+        family = MetricFamily(
+            self.prefix + name, help, "histogram", labelnames, lambda: Histogram(buckets)
+        )
+        self._families.append(family)
+        return family
+
+    def gauge(self, name: str, help: str, callback: Callable, labelnames: Sequence[str] = ()) -> None:
+        if self.enabled:
+            self._gauges[self.prefix + name] = (help, callback, tuple(labelnames))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for family in self._families:
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for values, child in list(family.children.items()):
+                labels = dict(zip(family.labelnames, values))
+                if family.kind == "counter":
+                    lines.append(f"{family.name}{_labels(labels)} {child.value}")
+                    continue
+                for bound, count in child.cumulative().items():
+                    lines.append(f"{family.name}_bucket{_labels(dict(labels, le=bound))} {count}")
+                lines.append(f"{family.name}_sum{_labels(labels)} {child.sum}")
+                lines.append(f"{family.name}_count{_labels(labels)} {child.count}")
+
+        for name, (help, callback, labelnames) in self._gauges.items():
+            try:
+                value = callback()
+            except Exception:
+                continue
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            if isinstance(value, dict):
+                for values, item in value.items():
+                    lines.append(f"{name}{_labels(dict(zip(labelnames, values)))} {item}")
+            else:
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    body = ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items())
+    return "{" + body + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+registry = MetricsRegistry(enabled=settings.METRICS_ENABLED)
+
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route")
+)
+http_responses = registry.counter(
+    "http_responses_total", "HTTP responses by route and status", ("method", "route", "status")
+)
+ws_frames_in = registry.counter("ws_frames_received_total", "WebSocket frames received from clients")
+ws_frames_out = registry.counter("ws_frames_sent_total", "WebSocket frames written to clients")
+ws_frames_invalid = registry.counter(
+    "ws_frames_invalid_total", "WebSocket frames from clients dropped as malformed"
+)
+ws_frames_suppressed = registry.counter(
+    "ws_frames_suppressed_total",
+    "WebSocket frames and events not broadcast: rate limited, coalesced or debounced",
+    ("reason",),
+)
+ws_reaped = registry.counter("ws_reaped_total", "Idle WebSocket connections closed by the server")
+ws_send_failures = registry.counter("ws_send_failures_total", "WebSocket writes that failed")
+ws_replays = registry.counter(
+    "ws_replays_total", "Reconnect replays by where the missed events came from", ("source",)
+)
+stream_frames_out = registry.counter(
+    "stream_frames_sent_total", "Events written to SSE streams and long polls", ("transport",)
+)
+room_acl_denied = registry.counter("room_acl_denied_total", "Room access checks refused")
+broker_errors = registry.counter(
+    "broker_errors_total",
+    "Broker failures: events a handler raised on, and lost connections",
+    ("kind",),
+)
+broker_reconnects = registry.counter("broker_reconnects_total", "Broker connections reopened after a failure")
+db_query_duration = registry.histogram("db_query_duration_seconds", "SQL statement execution time")
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording latency and status per route template
+    (e.g. /api/v1/messages/{message_id}/read), not per raw path.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            http_request_duration.labels(method, path).observe(time.perf_counter() - started)
+            http_responses.labels(method, path, str(status_code)).inc()
+
+
+def instrument_engine(engine) -> None:
+    """Time every SQL statement through SQLAlchemy cursor events"""
+    if not registry.enabled:
+        return
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        db_query_duration.observe(time.perf_counter() - conn.info["query_start"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        # A failed statement never reaches after_cursor_execute; drop its
+        # start so the next one on this connection is not timed against it
+        conn = context.connection
+        if conn is not None and conn.info.get("query_start"):
+            conn.info["query_start"].pop()
@@ -0,0 +1,203 @@
+"""
+Monthly partitions of the messages table and their retention (PostgreSQL).
+
+Migration 0006 converts `messages` into a table range-partitioned by
+created_at when MESSAGE_PARTITIONING is set. From then on:
+
+    python -m app.core.partitions ensure    # create upcoming partitions
+    python -m app.core.partitions archive   # archive partitions past retention
+
+The app also creates upcoming partitions periodically while it runs.
+Archiving detaches a month, writes it to MESSAGE_ARCHIVE_DIR as a gzipped
+CSV sorted by room, records it in message_archives and drops it; room
+history reads those files back on demand (see core/archive.py).
+"""
+import argparse
+import asyncio
+import gzip
+import os
+import re
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from ..core.config import settings
+from ..database import engine, run_in_db
+
+PARTITION_NAME = re.compile(r"^messages_p(\d{4})_(\d{2})$")
+
+# Column order of archive files
+ARCHIVE_COLUMNS = (
+    "id", "content", "sender_id", "recipient_id", "room_id",
+    "is_read", "read_at", "created_at", "updated_at",
+)
+
+
+def month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    years, month = divmod(value.month - 1 + months, 12)
+    return value.replace(year=value.year + years, month=month + 1)
+
+
+def partition_name(start: datetime) -> str:
+    return f"messages_p{start:%Y_%m}"
+
+
+def is_partitioned(conn: Connection) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    return conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt "
+        "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = 'messages')"
+    )).scalar()
+
+
+def list_partitions(conn: Connection) -> List[str]:
+    rows = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = 'messages' ORDER BY c.relname"
+    ))
+    return [name for (name,) in rows if PARTITION_NAME.match(name)]
+
+
+def ensure_partitions(
+    conn: Connection, *, months_ahead: int, start: Optional[datetime] = None
+) -> List[str]:
+    """
+    Create the monthly partitions from `start` (default: this month)
+    through `months_ahead` months later. Returns the names created.
+    """
+    first = month_start(start or datetime.now(timezone.utc))
+    existing = set(list_partitions(conn))
+    created = []
+    for offset in range(months_ahead + 1):
+        lower = add_months(first, offset)
+        name = partition_name(lower)
+        if name in existing:
+            continue
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF messages "
+            f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{add_months(lower, 1).isoformat()}')"
+        ))
+        created.append(name)
+    return created
+
+
+def archive_partition(conn: Connection, name: str, archive_dir: str) -> dict:
+    """
+    Detach one partition, export it to `<archive_dir>/<name>.csv.gz` and
+    drop it, all in the caller's transaction: if the export fails the
+    partition stays attached.
+    """
+    year, month = (int(part) for part in PARTITION_NAME.match(name).groups())
+    range_start = datetime(year, month, 1, tzinfo=timezone.utc)
+    range_end = add_months(range_start, 1)
+
+    conn.execute(text(f"ALTER TABLE messages DETACH PARTITION {name}"))
+    row_count, min_id, max_id = conn.execute(
+        text(f"SELECT COUNT(*), MIN(id), MAX(id) FROM {name}")
+    ).one()
+
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.csv.gz")
+    partial = path + ".partial"
+    conn.execute(text("SET LOCAL TIME ZONE 'UTC'"))
+    cursor = conn.connection.cursor()
+    try:
+        with gzip.open(partial, "wb") as archive:
+            # Sorted by room (byte order, as Python compares strings) so a
+            # room's history is one contiguous run of the file
+            cursor.copy_expert(
+                f"COPY (SELECT {', '.join(ARCHIVE_COLUMNS)} FROM {name} "
+                f'ORDER BY room_id COLLATE "C", created_at, id) TO STDOUT WITH CSV HEADER',
+                archive,
+            )
+            archive.flush()
+            os.fsync(archive.fileno())
+    finally:
+        cursor.close()
+    os.replace(partial, path)
+
+    conn.execute(
+        text(
+            "INSERT INTO message_archives "
+            "(partition_name, range_start, range_end, min_id, max_id, row_count, path) "
+            "VALUES (:name, :range_start, :range_end, :min_id, :max_id, :row_count, :path)"
+        ),
+        {
+            "name": name, "range_start": range_start, "range_end": range_end,
+            "min_id": min_id, "max_id": max_id, "row_count": row_count, "path": path,
+        },
+    )
+    conn.execute(text(f"DROP TABLE {name}"))
+    return {"partition": name, "rows": row_count, "path": path}
+
+
+def archive_partitions(
+    conn: Connection, *, retention_months: int, archive_dir: str, now: Optional[datetime] = None
+) -> List[dict]:
+    """Archive every partition that ends before the retention window"""
+    cutoff = add_months(month_start(now or datetime.now(timezone.utc)), -retention_months)
+    archived = []
+    for name in list_partitions(conn):
+        year, month = (int(part) for part in PARTITION_NAME.match(name).groups())
+        if add_months(datetime(year, month, 1, tzinfo=timezone.utc), 1) > cutoff:
+            continue
+        with conn.begin_nested():
+            archived.append(archive_partition(conn, name, archive_dir))
+    return archived
+
+
+def _ensure_upcoming() -> List[str]:
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            return []
+        return ensure_partitions(conn, months_ahead=settings.MESSAGE_PARTITION_PREMAKE_MONTHS)
+
+
+async def maintain_partitions(interval: float = 6 * 3600) -> None:
+    """Keep upcoming partitions created for as long as the app runs"""
+    while True:
+        try:
+            created = await run_in_db(_ensure_upcoming)
+            if created:
+                print(f"Created message partitions: {', '.join(created)}")
+        except Exception as e:
+            print(f"Error creating message partitions: {e}")
+        await asyncio.sleep(interval)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage monthly message partitions")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ensure = commands.add_parser("ensure", help="create upcoming partitions")
+    ensure.add_argument("--months-ahead", type=int, default=settings.MESSAGE_PARTITION_PREMAKE_MONTHS)
+    archive = commands.add_parser("archive", help="archive partitions past retention")
+    archive.add_argument("--retention-months", type=int, default=settings.MESSAGE_RETENTION_MONTHS)
+    archive.add_argument("--archive-dir", default=settings.MESSAGE_ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            parser.exit(1, "messages is not partitioned (see MESSAGE_PARTITIONING)\n")
+        if args.command == "ensure":
+            created = ensure_partitions(conn, months_ahead=args.months_ahead)
+            print(f"Created: {', '.join(created) or 'nothing'}")
+        else:
+            if args.retention_months <= 0:
+                parser.exit(1, "Set --retention-months or MESSAGE_RETENTION_MONTHS\n")
+            for result in archive_partitions(
+                conn, retention_months=args.retention_months, archive_dir=args.archive_dir
+            ):
+                print(f"Archived {result['partition']}: {result['rows']} rows -> {result['path']}")
+
+
+if __name__ == "__main__":
+    main()
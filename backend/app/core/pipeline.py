@@ -0,0 +1,127 @@
+import asyncio
+from typing import List, Optional, Tuple
+
+from .. import crud
+from ..core.config import settings
+from ..core.metrics import registry
+from ..database import run_with_session
+from ..models import Message
+from ..schemas.message import MessageCreate
+
+# (row to insert, future resolved with the persisted message)
+PendingMessage = Tuple[dict, asyncio.Future]
+
+
+class MessagePipeline:
+    """
+    Write-behind message persistence.
+
+    Messages are queued in-process, then flushed in multi-row
+    INSERT ... RETURNING batches once `batch_size` messages are waiting or
+    `linger_ms` has passed. Each submit() resolves only after its batch has
+    been committed, so callers acknowledge and broadcast durable messages.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = settings.MESSAGE_BATCH_SIZE,
+        linger_ms: float = settings.MESSAGE_BATCH_LINGER_MS,
+        max_pending: int = settings.MESSAGE_QUEUE_SIZE,
+    ):
+        self.batch_size = batch_size
+        self.linger = linger_ms / 1000
+        self.max_pending = max_pending
+        self.batches_flushed = 0
+        self.messages_flushed = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush everything already submitted, then stop"""
+        if not self.running:
+            return
+        self._closing = True
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, *, obj_in: MessageCreate, sender_id: int) -> Message:
+        """Queue a message and wait until its batch is durable"""
+        if not self.running or self._closing:
+            raise RuntimeError("Message pipeline is not running")
+        # Timestamps are left to the database, as for single inserts
+        row = {
+            "content": obj_in.content,
+            "sender_id": sender_id,
+            "recipient_id": obj_in.recipient_id,
+            "room_id": obj_in.room_id,
+            "is_read": False,
+        }
+        future = asyncio.get_running_loop().create_future()
+        # Blocks here when the queue is full, pushing back on senders
+        await self._queue.put((row, future))
+        return await future
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is None:
+                break
+            batch: List[PendingMessage] = [first]
+            stopping = self._take_ready(batch)
+            if not stopping and len(batch) < self.batch_size and self.linger > 0:
+                await asyncio.sleep(self.linger)
+                stopping = self._take_ready(batch)
+            await self._flush(batch)
+
+    def _take_ready(self, batch: List[PendingMessage]) -> bool:
+        """Move queued messages into the batch; True if a stop was requested"""
+        while len(batch) < self.batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return False
+            if item is None:
+                return True
+            batch.append(item)
+        return False
+
+    async def _flush(self, batch: List[PendingMessage]) -> None:
+        rows = [row for row, _ in batch]
+        try:
+            messages = await run_with_session(crud.message.create_many, rows=rows)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches_flushed += 1
+        self.messages_flushed += len(batch)
+        for (_, future), message in zip(batch, messages):
+            if not future.done():
+                future.set_result(message)
+
+
+message_pipeline = MessagePipeline()
+
+registry.gauge("pipeline_batches_flushed", "Message batches committed", lambda: message_pipeline.batches_flushed)
+registry.gauge("pipeline_messages_flushed", "Messages committed in batches", lambda: message_pipeline.messages_flushed)
+registry.gauge(
+    "pipeline_pending",
+    "Messages waiting to be flushed",
+    lambda: message_pipeline._queue.qsize() if message_pipeline._queue is not None else 0,
+)
@@ -0,0 +1,286 @@
+"""
+Who is online, and dead-socket reaping.
+
+The server pings connections that have been quiet for
+WS_PING_INTERVAL_SECONDS with a `ping` event; clients answer `pong`, and any
+frame counts as activity. A connection silent for WS_IDLE_TIMEOUT_SECONDS is
+reaped: dropped from its rooms at once and closed, without waiting for a
+send to fail.
+
+A user is online while they have at least one connection. Stores are
+picked by PRESENCE_URL like the broker: memory:// answers for this process
+only, redis://... for every worker. Last-seen times are batched and
+written to users.last_seen_at every LAST_SEEN_FLUSH_SECONDS.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from fastapi import WebSocket
+
+from .. import crud
+from .codec import Frame
+from .config import settings
+
+# (online, last seen as a unix timestamp) per user id asked about
+Presence = Tuple[bool, Optional[float]]
+
+
+class PresenceStore:
+    """Records which users have a connection somewhere"""
+
+    # Calls do network I/O, so they run off the event loop
+    blocking = False
+
+    def online(self, user_id: int, now: float) -> None:
+        """The user's first connection to this process opened"""
+        raise NotImplementedError
+
+    def offline(self, user_id: int, now: float) -> None:
+        """The user's last connection to this process closed"""
+        raise NotImplementedError
+
+    def sync(self, user_ids: Iterable[int], now: float) -> None:
+        """Heartbeat with every user connected to this process"""
+        raise NotImplementedError
+
+    def lookup(self, user_ids: Sequence[int], now: float) -> List[Presence]:
+        raise NotImplementedError
+
+
+class MemoryPresenceStore(PresenceStore):
+    """Presence of this process's own connections"""
+
+    def __init__(self):
+        self.users: Set[int] = set()
+        self.last_seen: Dict[int, float] = {}
+
+    def online(self, user_id: int, now: float) -> None:
+        self.users.add(user_id)
+        self.last_seen[user_id] = now
+
+    def offline(self, user_id: int, now: float) -> None:
+        self.users.discard(user_id)
+        self.last_seen[user_id] = now
+
+    def sync(self, user_ids: Iterable[int], now: float) -> None:
+        self.users = set(user_ids)
+        for user_id in self.users:
+            self.last_seen[user_id] = now
+
+    def lookup(self, user_ids: Sequence[int], now: float) -> List[Presence]:
+        return [(user_id in self.users, self.last_seen.get(user_id)) for user_id in user_ids]
+
+
+class RedisPresenceStore(PresenceStore):
+    """
+    Presence shared by every worker. Each worker keeps a set of its online
+    users that expires unless heartbeated, so a crashed worker's users go
+    offline on their own; a lookup checks the sets of the live workers.
+    Requires `redis` and Redis 6.2+.
+    """
+
+    blocking = True
+
+    def __init__(self, url: str, node_id: str, ttl: float, prefix: str = "chat:presence:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("RedisPresenceStore requires the 'redis' package") from e
+        self._redis = redis.Redis.from_url(url)
+        self.node_id = node_id
+        self.ttl = ttl
+        self.prefix = prefix
+        self.nodes_key = prefix + "nodes"
+        self.seen_key = prefix + "last_seen"
+        self.node_key = self._node_key(node_id)
+
+    def _node_key(self, node_id: Any) -> str:
+        if isinstance(node_id, bytes):
+            node_id = node_id.decode()
+        return f"{self.prefix}node:{node_id}"
+
+    def _heartbeat(self, pipe, now: float) -> None:
+        pipe.expire(self.node_key, int(self.ttl) + 1)
+        pipe.zadd(self.nodes_key, {self.node_id: now})
+
+    def online(self, user_id: int, now: float) -> None:
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.sadd(self.node_key, user_id)
+        pipe.hset(self.seen_key, user_id, now)
+        self._heartbeat(pipe, now)
+        pipe.execute()
+
+    def offline(self, user_id: int, now: float) -> None:
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.srem(self.node_key, user_id)
+        pipe.hset(self.seen_key, user_id, now)
+        pipe.execute()
+
+    def sync(self, user_ids: Iterable[int], now: float) -> None:
+        user_ids = list(user_ids)
+        # Replace the set atomically, healing any missed online/offline
+        pipe = self._redis.pipeline(transaction=True)
+        pipe.delete(self.node_key)
+        if user_ids:
+            pipe.sadd(self.node_key, *user_ids)
+            pipe.hset(self.seen_key, mapping={user_id: now for user_id in user_ids})
+        self._heartbeat(pipe, now)
+        pipe.zremrangebyscore(self.nodes_key, "-inf", now - self.ttl)
+        pipe.execute()
+
+    def lookup(self, user_ids: Sequence[int], now: float) -> List[Presence]:
+        if not user_ids:
+            return []
+        nodes = self._redis.zrangebyscore(self.nodes_key, now - self.ttl, "+inf")
+        pipe = self._redis.pipeline(transaction=False)
+        for node in nodes:
+            pipe.smismember(self._node_key(node), list(user_ids))
+        pipe.hmget(self.seen_key, list(user_ids))
+        *members, seen = pipe.execute()
+        return [
+            (
+                any(node_members[i] for node_members in members),
+                float(seen[i]) if seen[i] is not None else None,
+            )
+            for i in range(len(user_ids))
+        ]
+
+
+def create_presence_store(url: str, node_id: str, ttl: float) -> PresenceStore:
+    """Pick a presence backend from a URL (memory:// or redis://)"""
+    if url.startswith("memory://"):
+        return MemoryPresenceStore()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisPresenceStore(url, node_id, ttl)
+    raise ValueError(f"Unsupported presence URL: {url}")
+
+
+class PresenceService:
+    """
+    Watches activity on every connection of a ConnectionManager (kept on
+    its connection records), pings and reaps idle ones, and keeps the
+    presence store and last-seen times current. Expects to be told about
+    connects, disconnects and frames.
+    """
+
+    def __init__(
+        self,
+        manager: Any,
+        store: Optional[PresenceStore] = None,
+        ping_interval: float = settings.WS_PING_INTERVAL_SECONDS,
+        idle_timeout: float = settings.WS_IDLE_TIMEOUT_SECONDS,
+        flush_interval: float = settings.LAST_SEEN_FLUSH_SECONDS,
+    ):
+        self.manager = manager
+        self.ping_interval = ping_interval
+        self.idle_timeout = idle_timeout
+        self.flush_interval = flush_interval
+        self.store = store if store is not None else create_presence_store(
+            settings.PRESENCE_URL, manager.node_id, ttl=max(idle_timeout, 3 * ping_interval)
+        )
+        # user_id -> last seen, waiting to be written to the database
+        self.pending_last_seen: Dict[int, datetime] = {}
+        # One thread keeps store updates in order
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="presence")
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for user_id in self.manager.connections.users:
+            self.pending_last_seen[user_id] = _utcnow()
+        try:
+            await self.flush_last_seen()
+        except Exception as e:
+            # Shutdown carries on: the broker still has to be stopped
+            print(f"Error flushing last seen times: {e}")
+
+    def connected(self, user_id: int, first: bool) -> None:
+        """A connection opened; `first` if the user had none here before"""
+        if first:
+            self._update(self.store.online, user_id, time.time())
+            self.pending_last_seen[user_id] = _utcnow()
+
+    def disconnected(self, user_id: int, last: bool) -> None:
+        """A connection closed; `last` if it was the user's only one here"""
+        if last:
+            self._update(self.store.offline, user_id, time.time())
+            self.pending_last_seen[user_id] = _utcnow()
+
+    def touch(self, websocket: WebSocket) -> None:
+        """A frame arrived: the connection is alive"""
+        record = self.manager.connections.get(websocket)
+        if record is not None and record.last_active is not None:
+            record.last_active = time.monotonic()
+
+    async def lookup(self, user_ids: Sequence[int]) -> List[Presence]:
+        if self.store.blocking:
+            return await asyncio.to_thread(self.store.lookup, user_ids, time.time())
+        return self.store.lookup(user_ids, time.time())
+
+    def _update(self, fn: Callable, *args) -> None:
+        if not self.store.blocking:
+            fn(*args)
+            return
+        future = asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        future.add_done_callback(_log_failure)
+
+    def sweep(self, now: Optional[float] = None) -> None:
+        """
+        Ping quiet connections and reap the ones that stopped answering.
+        SSE streams and long polls have no last_active and are skipped.
+        """
+        now = now if now is not None else time.monotonic()
+        ping = Frame({"type": "ping"})
+        for record in list(self.manager.connections.records.values()):
+            if record.last_active is None:
+                continue
+            idle = now - record.last_active
+            if idle >= self.idle_timeout:
+                self.manager.reap(record.connection)
+            elif idle >= self.ping_interval:
+                record.writer.enqueue(ping)
+
+    async def _run(self) -> None:
+        last_flush = time.monotonic()
+        while True:
+            # Twice per interval, so a quiet connection is pinged in time
+            await asyncio.sleep((self.ping_interval or 30.0) / 2)
+            try:
+                if self.ping_interval > 0:
+                    self.sweep()
+                self._update(self.store.sync, list(self.manager.connections.users), time.time())
+                if time.monotonic() - last_flush >= self.flush_interval:
+                    last_flush = time.monotonic()
+                    now = _utcnow()
+                    for user_id in self.manager.connections.users:
+                        self.pending_last_seen[user_id] = now
+                    await self.flush_last_seen()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error in presence sweep: {e}")
+
+    async def flush_last_seen(self) -> None:
+        """Write pending last-seen times in one batch"""
+        if not self.pending_last_seen:
+            return
+        pending, self.pending_last_seen = self.pending_last_seen, {}
+        await crud.user.aupdate_last_seen(None, seen=pending)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _log_failure(future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Error updating presence: {future.exception()}")
@@ -0,0 +1,27 @@
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Allows `rate` events per second on average, plus bursts of up to
+    `burst` events. Not thread-safe; meant for one connection's frames.
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def allow(self, now: Optional[float] = None) -> bool:
+        """Take a token if one is available"""
+        now = now if now is not None else time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
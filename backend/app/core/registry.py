@@ -0,0 +1,119 @@
+"""
+Who is connected where, for the ConnectionManager.
+
+One compact record per connection plus reverse indexes by room and by
+user, so joining, leaving and dropping a connection cost the same however
+many rooms and connections there are.
+"""
+import itertools
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .fanout import Connection, FrameQueue
+
+
+class ConnectionRecord:
+    """
+    Everything kept about one connection. Only the user's id and display
+    name are stored, not the user object it authenticated as.
+    """
+
+    __slots__ = ("id", "connection", "writer", "user_id", "user_name", "rooms", "last_active")
+
+    def __init__(
+        self,
+        id: int,
+        connection: Connection,
+        writer: FrameQueue,
+        user_id: int,
+        user_name: Optional[str],
+        heartbeat: bool,
+    ):
+        self.id = id
+        self.connection = connection
+        self.writer = writer
+        self.user_id = user_id
+        self.user_name = user_name
+        # A tuple: connections are in one room or a handful, and never more
+        # than WS_MAX_ROOMS_PER_CONNECTION
+        self.rooms: Tuple[str, ...] = ()
+        # time.monotonic() of the last inbound frame; None for transports
+        # that cannot answer pings and are never reaped
+        self.last_active: Optional[float] = time.monotonic() if heartbeat else None
+
+
+class ConnectionRegistry:
+    """Connection records, indexed by connection, room and user"""
+
+    def __init__(self):
+        self.records: Dict[Connection, ConnectionRecord] = {}
+        # room_id -> records of the connections in it
+        self.rooms: Dict[str, Set[ConnectionRecord]] = {}
+        # user_id -> records of the user's connections: a list, as a user
+        # has a few at most and a one-item set costs four times as much
+        self.users: Dict[int, List[ConnectionRecord]] = {}
+        self._ids = itertools.count(1)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def get(self, connection: Connection) -> Optional[ConnectionRecord]:
+        return self.records.get(connection)
+
+    def room(self, room_id: str) -> Iterable[ConnectionRecord]:
+        return self.rooms.get(room_id, ())
+
+    def user(self, user_id: int) -> Iterable[ConnectionRecord]:
+        return self.users.get(user_id, ())
+
+    def add(
+        self, connection: Connection, writer: FrameQueue, user, heartbeat: bool = True
+    ) -> Tuple[ConnectionRecord, bool]:
+        """Register a connection; also returns whether it is the user's first"""
+        record = ConnectionRecord(
+            next(self._ids), connection, writer, user.id, user.full_name, heartbeat
+        )
+        self.records[connection] = record
+        records = self.users.get(user.id)
+        if records is None:
+            self.users[user.id] = [record]
+            return record, True
+        records.append(record)
+        return record, False
+
+    def join(self, record: ConnectionRecord, room_id: str) -> None:
+        if room_id in record.rooms:
+            return
+        record.rooms += (room_id,)
+        members = self.rooms.get(room_id)
+        if members is None:
+            members = self.rooms[room_id] = set()
+        members.add(record)
+
+    def leave(self, record: ConnectionRecord, room_id: str) -> bool:
+        """Take a connection out of a room; True if that emptied the room"""
+        if room_id not in record.rooms:
+            return False
+        record.rooms = tuple(joined for joined in record.rooms if joined != room_id)
+        members = self.rooms[room_id]
+        members.discard(record)
+        if members:
+            return False
+        del self.rooms[room_id]
+        return True
+
+    def remove(self, record: ConnectionRecord) -> bool:
+        """
+        Forget a connection that has left its rooms; True if it was the
+        user's last one.
+        """
+        if self.records.pop(record.connection, None) is None:
+            return False
+        records = self.users.get(record.user_id)
+        if records is None:
+            return False
+        records.remove(record)
+        if records:
+            return False
+        del self.users[record.user_id]
+        return True
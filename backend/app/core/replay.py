@@ -0,0 +1,83 @@
+from collections import OrderedDict, deque
+from typing import Deque, List, Optional, Tuple
+
+from .codec import Frame
+from .config import settings
+
+
+class RoomReplayBuffer:
+    """
+    The most recent message and read events of one room, oldest first.
+
+    Message events are keyed by their id. Read events carry no id of their
+    own, so they are keyed by the newest message id buffered when they
+    happened and replayed to anyone who had seen up to that message.
+    """
+
+    def __init__(self, size: int):
+        self.entries: Deque[Tuple[bool, int, Frame]] = deque(maxlen=size)
+        self.newest_id = 0
+
+    def add_message(self, message_id: int, frame: Frame) -> None:
+        self.entries.append((True, message_id, frame))
+        self.newest_id = max(self.newest_id, message_id)
+
+    def add_read(self, frame: Frame) -> None:
+        self.entries.append((False, self.newest_id, frame))
+
+    def oldest_message_id(self) -> Optional[int]:
+        for is_message, message_id, _ in self.entries:
+            if is_message:
+                return message_id
+        return None
+
+    def since(self, last_id: int) -> Optional[List[Frame]]:
+        """
+        Frames a client that has seen message `last_id` missed, or None if
+        the buffer no longer reaches back that far (or never did).
+        """
+        oldest = self.oldest_message_id()
+        if oldest is None or last_id < oldest or last_id > self.newest_id:
+            return None
+        return [
+            frame
+            for is_message, message_id, frame in self.entries
+            if message_id > last_id or (not is_message and message_id == last_id)
+        ]
+
+
+class ReplayBuffers:
+    """Replay buffers for the most recently active rooms"""
+
+    def __init__(
+        self,
+        size: int = settings.WS_REPLAY_BUFFER_SIZE,
+        max_rooms: int = settings.WS_REPLAY_BUFFER_ROOMS,
+    ):
+        self.size = size
+        self.max_rooms = max_rooms
+        self.rooms: "OrderedDict[str, RoomReplayBuffer]" = OrderedDict()
+
+    def record(self, room_id: str, message: dict, frame: Frame) -> None:
+        """Remember a broadcast if it is something a reconnecting client needs"""
+        kind = message.get("type")
+        if kind not in ("message", "read") or self.size <= 0:
+            return
+        buffer = self.rooms.get(room_id)
+        if buffer is None:
+            if kind == "read":
+                # Without earlier messages there is nothing to order it by
+                return
+            buffer = self.rooms[room_id] = RoomReplayBuffer(self.size)
+            if len(self.rooms) > self.max_rooms:
+                self.rooms.popitem(last=False)
+        else:
+            self.rooms.move_to_end(room_id)
+        if kind == "message":
+            buffer.add_message(message["id"], frame)
+        else:
+            buffer.add_read(frame)
+
+    def since(self, room_id: str, last_id: int) -> Optional[List[Frame]]:
+        buffer = self.rooms.get(room_id)
+        return buffer.since(last_id) if buffer is not None else None
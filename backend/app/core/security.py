@@ -1,32 +1,151 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime, timedelta
-from typing import Optional
+import asyncio
+import threading
+import time
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-import os
-from dotenv import load_dotenv
 
 from .. import models, schemas
-from ..database import get_db
+from ..database import get_db, run_in_db, run_with_session
+from .cache import TTLCache
+from .config import settings
+from .metrics import registry
 
-load_dotenv()
+# Security configurations, read once with the rest of the settings
+SECRET_KEY = settings.SECRET_KEY
+ALGORITHM = settings.ALGORITHM
 
-# Security configurations
-SECRET_KEY = os.getenv("JWT_SECRET", "your-secret-key")
-ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes made with any other cost are flagged for rehash on the next login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+
+class PasswordHasher:
+    """
+    Dedicated, size-capped pool for bcrypt work so a login burst cannot
+    starve FastAPI's shared threadpool. Once `workers + queue_limit` calls
+    are admitted, new ones are rejected with 503 instead of queueing.
+    """
+
+    def __init__(self, workers: int, queue_limit: int):
+        self.capacity = workers + queue_limit
+        self.in_flight = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._lock = threading.Lock()
+        self._admitted: ContextVar[bool] = ContextVar("password_hasher_admitted", default=False)
+
+    @contextmanager
+    def admission(self):
+        """
+        Reserve a slot for a whole login/register flow, so saturated
+        requests are turned away before doing any database work. Nested
+        use within the same task holds a single slot.
+        """
+        if self._admitted.get():
+            yield
+            return
+        with self._lock:
+            if self.in_flight >= self.capacity:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Authentication is busy, please retry",
+                    headers={"Retry-After": "1"},
+                )
+            self.in_flight += 1
+        token = self._admitted.set(True)
+        try:
+            yield
+        finally:
+            self._admitted.reset(token)
+            with self._lock:
+                self.in_flight -= 1
+
+    async def run(self, fn, *args):
+        with self.admission():
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    queue_limit=settings.PASSWORD_HASH_QUEUE_LIMIT,
+)
+
+
+class UserSnapshot:
+    """
+    Read-only copy of the columns request auth needs. Cached across
+    requests instead of ORM instances, which belong to a single session.
+    """
+    __slots__ = (
+        "id", "email", "full_name", "is_active", "is_superuser",
+        "created_at", "updated_at",
+    )
+
+    def __init__(self, user: models.User):
+        for field in self.__slots__:
+            setattr(self, field, getattr(user, field))
+
+
+# token -> user id, for at most the token's remaining lifetime
+token_cache: TTLCache[int] = TTLCache(
+    maxsize=settings.AUTH_CACHE_MAX_ENTRIES, ttl=settings.AUTH_CACHE_TTL_SECONDS
+)
+# user id -> UserSnapshot
+user_cache: TTLCache[UserSnapshot] = TTLCache(
+    maxsize=settings.AUTH_CACHE_MAX_ENTRIES, ttl=settings.AUTH_CACHE_TTL_SECONDS
+)
+
+def invalidate_user(user_id: int) -> None:
+    """Drop a cached user after it is updated or deleted"""
+    user_cache.invalidate(user_id)
+
+def auth_cache_stats() -> dict:
+    return {"tokens": token_cache.stats(), "users": user_cache.stats()}
+
+registry.gauge(
+    "auth_cache_lookups",
+    "Auth cache hits and misses",
+    lambda: {
+        (cache, outcome): stats[outcome]
+        for cache, stats in auth_cache_stats().items()
+        for outcome in ("hits", "misses")
+    },
+    ("cache", "outcome"),
+)
+registry.gauge("password_hash_in_flight", "Admitted password hash/verify calls", lambda: password_hasher.in_flight)
+registry.gauge("password_hash_rejected", "Password hash/verify calls rejected with 503", lambda: password_hasher.rejected)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+async def averify_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify on the password pool. Also returns a new hash when the stored
+    one was made with a different bcrypt cost, otherwise None.
+    """
+    return await password_hasher.run(pwd_context.verify_and_update, plain_password, hashed_password)
+
+async def aget_password_hash(password: str) -> str:
+    return await password_hasher.run(pwd_context.hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     if expires_delta:
@@ -37,38 +156,75 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def decode_token_user_id(token: str) -> Optional[int]:
+    """
+    User id from a JWT, or None if the token is invalid. Verified claims
+    are cached until the token expires.
+    """
+    user_id = token_cache.get(token)
+    if user_id is not None:
+        return user_id
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        sub = payload.get("sub")
+        if sub is None:
+            return None
+        user_id = schemas.TokenData(user_id=sub).user_id
+    except (JWTError, ValueError):
+        return None
+    expires_at = payload.get("exp")
+    ttl = expires_at - time.time() if expires_at is not None else None
+    token_cache.set(token, user_id, ttl=ttl)
+    return user_id
+
+async def get_user_snapshot(db: Optional[Session], user_id: int) -> Optional[UserSnapshot]:
+    """
+    Cached user lookup. Misses query on the database executor; pass
+    db=None to use a short-lived session.
+    """
+    snapshot = user_cache.get(user_id)
+    if snapshot is not None:
+        return snapshot
+
+    def load(session: Session) -> Optional[UserSnapshot]:
+        user = session.query(models.User).filter(models.User.id == user_id).first()
+        return UserSnapshot(user) if user is not None else None
+
+    if db is None:
+        snapshot = await run_with_session(load)
+    else:
+        snapshot = await run_in_db(load, db)
+    if snapshot is not None:
+        user_cache.set(user_id, snapshot)
+    return snapshot
+
 async def get_current_user(
     db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)
-) -> models.User:
+) -> UserSnapshot:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-        token_data = schemas.TokenData(user_id=user_id)
-    except JWTError:
+    user_id = decode_token_user_id(token)
+    if user_id is None:
         raise credentials_exception
     
-    user = db.query(models.User).filter(models.User.id == token_data.user_id).first()
+    user = await get_user_snapshot(db, user_id)
     if user is None:
         raise credentials_exception
     return user
 
 async def get_current_active_user(
-    current_user: models.User = Depends(get_current_user),
-) -> models.User:
+    current_user: UserSnapshot = Depends(get_current_user),
+) -> UserSnapshot:
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
 def get_current_active_superuser(
-    current_user: models.User = Depends(get_current_active_user),
-) -> models.User:
+    current_user: UserSnapshot = Depends(get_current_active_user),
+) -> UserSnapshot:
     if not current_user.is_superuser:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
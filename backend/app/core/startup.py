@@ -0,0 +1,125 @@
+"""
+What each worker does once before it serves, so no request pays for it.
+
+Importing app.main only builds the routes. The lifespan then:
+
+    schema   checks that the database is at the Alembic head revision; it
+             never creates or alters tables, so workers starting together
+             do not race on DDL (migrations run once per deploy)
+    pool     opens DB_POOL_WARM_CONNECTIONS pooled connections at once
+    caches   builds the OpenAPI document, loads the bcrypt backend and
+             bulk-loads the room access index
+
+Pydantic v2 compiles validators, and FastAPI its routes, when the app is
+imported, so there is nothing left to warm for them.
+
+Each step is timed. To see where a worker's startup goes:
+
+    python -m app.main --profile-startup
+
+or set STARTUP_PROFILE to print the same report on every boot.
+"""
+import asyncio
+import json
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Optional
+
+from fastapi import FastAPI
+
+from ..database import engine, run_in_db
+from .acl import room_acl
+from .config import settings
+from .security import pwd_context
+
+ALEMBIC_DIR = Path(__file__).resolve().parents[2] / "alembic"
+
+
+class StartupProfile:
+    """Seconds spent importing the app and in each startup step"""
+
+    def __init__(self, import_seconds: Optional[float] = None):
+        self.import_seconds = import_seconds
+        self.steps: List[dict] = []
+
+    @contextmanager
+    def step(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append({"step": name, "seconds": round(time.perf_counter() - started, 4)})
+
+    def report(self) -> dict:
+        startup = sum(step["seconds"] for step in self.steps)
+        return {
+            "import_seconds": None if self.import_seconds is None else round(self.import_seconds, 4),
+            "startup_seconds": round(startup, 4),
+            "steps": self.steps,
+        }
+
+
+def check_schema() -> None:
+    """
+    Compare the database's Alembic revision with the migrations shipped
+    with the code. Raises RuntimeError on a mismatch if DB_REQUIRE_HEAD.
+    """
+    # Only needed here, so kept off the import path of the app
+    from alembic.runtime.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+
+    expected = set(ScriptDirectory(str(ALEMBIC_DIR)).get_heads())
+    with engine.connect() as conn:
+        current = set(MigrationContext.configure(conn).get_current_heads())
+    if current == expected:
+        return
+    message = (
+        f"Database is at revision {', '.join(sorted(current)) or 'none'}, "
+        f"the code expects {', '.join(sorted(expected))}; run `alembic upgrade head`"
+    )
+    if settings.DB_REQUIRE_HEAD:
+        raise RuntimeError(message)
+    print(f"Warning: {message}")
+
+
+async def warm_pool(count: int = settings.DB_POOL_WARM_CONNECTIONS) -> int:
+    """Open up to `count` pooled connections at once; returns how many"""
+    size = getattr(engine.pool, "size", None)
+    if count <= 0 or not callable(size):
+        # NullPool (PgBouncer mode) keeps nothing to warm
+        return 0
+    connections = await asyncio.gather(
+        *(run_in_db(engine.connect) for _ in range(min(count, size())))
+    )
+    for conn in connections:
+        # Back to the pool, still open
+        conn.close()
+    return len(connections)
+
+
+async def warm_caches(app: FastAPI) -> None:
+    app.openapi()
+    pwd_context.handler("bcrypt").get_backend()
+    # Room access checks answer from memory from the first request
+    try:
+        await room_acl.warm()
+    except Exception as e:
+        print(f"Error warming room access index: {e}")
+
+
+async def prepare(app: FastAPI, profile: StartupProfile) -> None:
+    """The database and cache steps of startup, before anything is served"""
+    with profile.step("schema"):
+        await run_in_db(check_schema)
+    with profile.step("pool"):
+        await warm_pool()
+    with profile.step("caches"):
+        await warm_caches(app)
+
+
+async def profile_startup(app: FastAPI) -> None:
+    """Run the app's startup and shutdown once and print the profile"""
+    async with app.router.lifespan_context(app):
+        pass
+    print(json.dumps(app.state.startup_profile.report(), indent=2))
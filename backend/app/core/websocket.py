@@ -1,108 +1,376 @@
-from typing import Dict, List, Set
-from fastapi import WebSocket, status, Depends
+from typing import List, Optional
+from fastapi import WebSocket, status
 from sqlalchemy.orm import Session
-import json
-from jose import jwt
+import asyncio
+import time
+import uuid
 
-from .. import models, schemas
+from .. import crud, models
 from ..core import security
-from ..database import get_db
+from ..core.acl import room_acl
+from ..core.broker import Broker, create_broker
+from ..core.codec import Codec, Frame, json_codec
+from ..core.coalesce import JoinLeaveDebouncer, TypingDigests
+from ..core.config import settings
+from ..core.fanout import Connection, ConnectionWriter, FanoutStats, FrameQueue, SlowConsumerPolicy, StreamQueue
+from ..core.message_cache import message_cache
+from ..core.metrics import registry, ws_reaped, ws_replays
+from ..core.presence import PresenceService
+from ..core.registry import ConnectionRecord, ConnectionRegistry
+from ..core.replay import ReplayBuffers
 
 class ConnectionManager:
-    def __init__(self):
-        # room_id -> set of WebSocket connections
-        self.active_connections: Dict[str, Set[WebSocket]] = {}
-        # WebSocket -> user mapping
-        self.connection_users: Dict[WebSocket, models.User] = {}
-        # user_id -> set of WebSocket connections
-        self.user_connections: Dict[int, Set[WebSocket]] = {}
-
-    async def connect(self, websocket: WebSocket, room_id: str, user: models.User):
-        await websocket.accept()
-        
-        # Add connection to the room
-        if room_id not in self.active_connections:
-            self.active_connections[room_id] = set()
-        self.active_connections[room_id].add(websocket)
-        
-        # Track user connections
-        self.connection_users[websocket] = user
-        if user.id not in self.user_connections:
-            self.user_connections[user.id] = set()
-        self.user_connections[user.id].add(websocket)
-        
-        # Notify others in the room that user has joined
-        await self.broadcast_message(
-            room_id=room_id,
-            message={
-                "type": "user_joined",
-                "user_id": user.id,
-                "user_name": user.full_name
-            },
-            exclude=[websocket]
+    def __init__(
+        self,
+        max_queue: int = settings.WS_SEND_QUEUE_SIZE,
+        policy: SlowConsumerPolicy = SlowConsumerPolicy(settings.WS_SLOW_CONSUMER_POLICY),
+        broker: Optional[Broker] = None,
+        max_rooms: int = settings.WS_MAX_ROOMS_PER_CONNECTION,
+    ):
+        # WebSockets, SSE streams and long polls, by connection, room and user
+        self.connections = ConnectionRegistry()
+        self.max_queue = max_queue
+        self.policy = policy
+        # Rooms one multiplexed connection may join
+        self.max_rooms = max_rooms
+        self.stats = FanoutStats()
+        # Recent room events, replayed to clients that reconnect
+        self.replay = ReplayBuffers()
+        # Typing digests and debounced join/leave announcements
+        self.typing = TypingDigests(settings.WS_TYPING_DIGEST_MS / 1000, self.broadcast_message)
+        self.join_leave = JoinLeaveDebouncer(settings.WS_PRESENCE_GRACE_MS / 1000, self.broadcast_message)
+        # Relays room and direct messages to the other backend processes
+        self.broker = broker if broker is not None else create_broker(settings.BROKER_URL)
+        self.node_id = uuid.uuid4().hex
+        self._broker_started = False
+        # Heartbeats, idle reaping and who is online
+        self.presence = PresenceService(self)
+
+    async def start(self):
+        """Subscribe to events published by other processes"""
+        if not self._broker_started:
+            await self.broker.start(self._on_broker_event)
+            self._broker_started = True
+        self.presence.start()
+
+    async def stop(self):
+        self.typing.stop()
+        self.join_leave.stop()
+        await self.presence.stop()
+        if self._broker_started:
+            await self.broker.stop()
+            self._broker_started = False
+
+    async def _publish(self, kind: str, target, message: dict):
+        if not self._broker_started:
+            return
+        try:
+            await self.broker.publish({
+                "origin": self.node_id,
+                "kind": kind,
+                "target": target,
+                "message": message,
+            })
+        except Exception as e:
+            print(f"Error publishing to broker: {e}")
+
+    async def _on_broker_event(self, envelope: dict):
+        if envelope.get("origin") == self.node_id:
+            return
+        if envelope["message"].get("content_omitted"):
+            # Too large for the broker; read the content back
+            envelope["message"] = await self._fill_content(envelope["message"])
+            if envelope["message"] is None:
+                return
+        if envelope["kind"] == "room":
+            if message_cache.process_local and envelope["message"].get("type") in ("message", "read"):
+                # Written by another worker: this one's cached page is stale
+                message_cache.invalidate([envelope["target"]])
+            self._deliver_to_room(envelope["target"], envelope["message"])
+            await self.join_leave.on_remote(envelope["target"], envelope["message"])
+        elif envelope["kind"] == "user":
+            self._deliver_to_user(envelope["target"], envelope["message"])
+        elif envelope["kind"] == "revoke":
+            self._revoke(envelope["target"], envelope["message"]["user_id"])
+
+    async def _fill_content(self, message: dict) -> Optional[dict]:
+        row = await crud.message.aget(None, id=message["id"])
+        if row is None:
+            return None
+        filled = {key: value for key, value in message.items() if key != "content_omitted"}
+        filled["content"] = row.content
+        return filled
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        room_id: Optional[str],
+        user: models.User,
+        last_id: Optional[int] = None,
+        codec: Codec = json_codec,
+        subprotocol: Optional[str] = None,
+    ) -> bool:
+        """
+        Accept a WebSocket and join it to a room, or with room_id=None to
+        none yet: a multiplexed connection joins rooms later with join().
+        Replay works as in join().
+
+        `codec` and `subprotocol` come from codec.negotiate().
+        """
+        await websocket.accept(subprotocol=subprotocol)
+        writer = ConnectionWriter(
+            websocket,
+            max_queue=self.max_queue,
+            policy=self.policy,
+            on_error=self.disconnect,
+            codec=codec,
         )
+        self._register(websocket, writer, user)
+        if room_id is None:
+            return True
+        return await self.join(websocket, room_id, user, last_id=last_id)
 
-    def disconnect(self, websocket: WebSocket, room_id: str):
-        if room_id in self.active_connections and websocket in self.active_connections[room_id]:
-            self.active_connections[room_id].remove(websocket)
-            
-        # Clean up user tracking
-        user = self.connection_users.pop(websocket, None)
-        if user and user.id in self.user_connections:
-            self.user_connections[user.id].discard(websocket)
-            if not self.user_connections[user.id]:
-                del self.user_connections[user.id]
-
-    async def broadcast_message(self, room_id: str, message: dict, exclude: List[WebSocket] = None):
-        if room_id not in self.active_connections:
+    async def subscribe(
+        self,
+        stream: StreamQueue,
+        room_id: Optional[str],
+        user: models.User,
+        last_id: Optional[int] = None,
+        announce: bool = True,
+    ) -> bool:
+        """
+        Attach an SSE stream or long poll to a room, or with room_id=None
+        to the user's direct events only. It receives the same frames as
+        the room's WebSockets; replay works as in join(). Long polls pass
+        announce=False so each poll is not a join and a leave.
+        """
+        self._register(stream, stream, user, heartbeat=False)
+        if room_id is None:
+            return True
+        return await self.join(stream, room_id, user, last_id=last_id, announce=announce)
+
+    def _register(self, connection: Connection, writer: FrameQueue, user: models.User, heartbeat: bool = True):
+        _, first = self.connections.add(connection, writer, user, heartbeat=heartbeat)
+        self.presence.connected(user.id, first)
+
+    async def join(
+        self,
+        connection: Connection,
+        room_id: str,
+        user: models.User,
+        last_id: Optional[int] = None,
+        announce: bool = True,
+    ) -> bool:
+        """
+        Add a connection to a room. A reconnecting client passes the newest
+        message id it has as `last_id`; what it missed is queued ahead of
+        any live event when the room's replay buffer reaches back that far.
+        Returns False if it does not, in which case the caller replays from
+        the database.
+
+        Raises ValueError if the connection is gone or already in
+        max_rooms rooms.
+        """
+        record = self.connections.get(connection)
+        if record is None:
+            raise ValueError("Connection is closed")
+        if room_id in record.rooms:
+            return True
+        if len(record.rooms) >= self.max_rooms:
+            raise ValueError(f"At most {self.max_rooms} rooms per connection")
+        self.connections.join(record, room_id)
+
+        replayed = last_id is None
+        if not replayed:
+            frames = self.replay.since(room_id, last_id)
+            if frames is not None:
+                self.send_frames(connection, frames)
+                ws_replays.labels("buffer").inc()
+                replayed = True
+
+        # Notify others in the room that user has joined, unless they
+        # already know: another tab, or a reconnect within the grace window
+        if announce:
+            await self.join_leave.joined(room_id, user, exclude=[connection])
+        return replayed
+
+    def leave(self, connection: Connection, room_id: str, announce: bool = True) -> bool:
+        """
+        Take a connection out of one room and, once debounced, tell the
+        room. Returns False if it was not in it.
+        """
+        record = self.connections.get(connection)
+        if record is None or room_id not in record.rooms:
+            return False
+        self._leave(record, room_id, announce)
+        return True
+
+    def _leave(self, record: ConnectionRecord, room_id: str, announce: bool):
+        if self.connections.leave(record, room_id):
+            self.stats.discard(room_id)
+        if announce:
+            self.join_leave.left(room_id, record.user_id, record.user_name)
+
+    def send_frames(self, connection: Connection, frames: List[Frame]):
+        """Queue frames for one connection"""
+        record = self.connections.get(connection)
+        if record is not None:
+            for frame in frames:
+                record.writer.enqueue(frame)
+
+    def disconnect(self, connection: Connection, announce: bool = True):
+        """
+        Drop a connection from its rooms, announcing the leaves once
+        debounced, and stop its writer. Safe to call more than once and
+        from a cancelled handler. Long polls pass announce=False.
+        """
+        record = self.connections.get(connection)
+        if record is None:
+            return
+        for room_id in record.rooms:
+            self._leave(record, room_id, announce)
+        record.writer.close()
+        last = self.connections.remove(record)
+        self.presence.disconnected(record.user_id, last)
+
+    async def revoke(self, room_id: str, user_id: int):
+        """
+        A user lost access to a room: forget their cached memberships and
+        take their connections out of it, here and in every other process.
+        """
+        self._revoke(room_id, user_id)
+        await self._publish("revoke", room_id, {"user_id": user_id})
+
+    def _revoke(self, room_id: str, user_id: int):
+        room_acl.forget_member(user_id)
+        frame = Frame({"type": "unsubscribed", "room_id": room_id, "reason": "revoked"})
+        for record in list(self.connections.user(user_id)):
+            if room_id in record.rooms:
+                self._leave(record, room_id, announce=True)
+                record.writer.enqueue(frame)
+
+    def reap(self, websocket: WebSocket):
+        """Drop a connection that stopped answering pings, then close it"""
+        ws_reaped.inc()
+        self.disconnect(websocket)
+        asyncio.create_task(self._close(websocket, status.WS_1001_GOING_AWAY))
+
+    async def _close(self, websocket: WebSocket, code: int):
+        try:
+            await asyncio.wait_for(websocket.close(code=code), timeout=5)
+        except Exception:
+            # Most likely already gone; its receive loop cleans up the rest
+            pass
+
+    async def broadcast_message(
+        self,
+        room_id: str,
+        message: dict,
+        exclude: List[Connection] = None,
+        coalesce_key: Optional[str] = None,
+    ):
+        """
+        Queue a message for every connection in the room, in this process
+        and, through the broker, in every other one.
+
+        The event is wrapped in a single Frame handed to each connection's
+        writer: it is encoded once per wire format rather than once per
+        recipient, and the caller never waits on a slow socket.
+        """
+        self._deliver_to_room(room_id, message, exclude, coalesce_key)
+        await self._publish("room", room_id, message)
+
+    def _deliver_to_room(
+        self,
+        room_id: str,
+        message: dict,
+        exclude: List[Connection] = None,
+        coalesce_key: Optional[str] = None,
+    ):
+        members = self.connections.rooms.get(room_id)
+        recorded = message.get("type") in ("message", "read")
+        if not members and not recorded:
+            return
+
+        if message.get("room_id") != room_id:
+            # Tagged so connections joined to several rooms can tell them apart
+            message = dict(message, room_id=room_id)
+
+        frame = Frame(message)
+        if recorded:
+            # Kept even without local listeners, so a client reconnecting
+            # here can catch up on what other workers delivered
+            self.replay.record(room_id, message, frame)
+        if not members:
             return
             
-        if exclude is None:
-            exclude = []
-            
-        for connection in self.active_connections[room_id]:
-            if connection not in exclude:
-                try:
-                    await connection.send_json(message)
-                except Exception as e:
-                    print(f"Error sending message: {e}")
-                    self.disconnect(connection, room_id)
+        excluded = set(exclude) if exclude else ()
+
+        stats = self.stats.for_room(room_id)
+        stats.broadcasts += 1
+        now = time.perf_counter()
+        for record in members:
+            if record.connection not in excluded:
+                record.writer.enqueue(frame, key=coalesce_key, stats=stats, now=now)
 
     async def send_direct_message(self, user_id: int, message: dict):
         """Send a message to all connections of a specific user"""
-        if user_id not in self.user_connections:
+        self._deliver_to_user(user_id, message)
+        await self._publish("user", user_id, message)
+
+    def _deliver_to_user(self, user_id: int, message: dict):
+        records = self.connections.users.get(user_id)
+        if not records:
             return
-            
-        for connection in self.user_connections[user_id]:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                print(f"Error sending direct message: {e}")
-                # Find and remove the connection from all rooms
-                for room_id in list(self.active_connections.keys()):
-                    self.disconnect(connection, room_id)
+
+        frame = Frame(message)
+        for record in records:
+            record.writer.enqueue(frame)
+
+    def get_room_stats(self, room_id: str) -> Optional[dict]:
+        """Fan-out latency and queue-depth counters for a room"""
+        stats = self.stats.rooms.get(room_id)
+        if stats is None:
+            return None
+        result = stats.as_dict()
+        members = self.connections.room(room_id)
+        result["members"] = len(members)
+        result["queue_depth"] = sum(len(record.writer.queue) for record in members)
+        return result
 
     async def authenticate_user(
         self, 
-        db: Session, 
+        db: Optional[Session], 
         token: str
-    ) -> models.User:
-        """Authenticate user from JWT token"""
+    ) -> Optional[security.UserSnapshot]:
+        """
+        Authenticate user from JWT token, sharing the request auth cache.
+        Cache misses query on the database executor; pass db=None to use a
+        short-lived session.
+        """
         if not token:
             return None
-            
-        try:
-            payload = jwt.decode(
-                token, 
-                security.SECRET_KEY, 
-                algorithms=[security.ALGORITHM]
-            )
-            user_id: str = payload.get("sub")
-            if user_id is None:
-                return None
-                
-            user = db.query(models.User).filter(models.User.id == int(user_id)).first()
-            return user if user and user.is_active else None
-            
-        except jwt.JWTError:
+
+        user_id = security.decode_token_user_id(token)
+        if user_id is None:
             return None
+
+        user = await security.get_user_snapshot(db, user_id)
+        return user if user and user.is_active else None
+
+
+manager = ConnectionManager()
+
+# Evaluated on scrape, so connects and broadcasts pay nothing for them
+def _count_writers(kind: type) -> int:
+    return sum(1 for record in list(manager.connections.records.values()) if isinstance(record.writer, kind))
+
+registry.gauge("ws_connections", "Open WebSocket connections", lambda: _count_writers(ConnectionWriter))
+registry.gauge("stream_connections", "Open SSE streams and pending long polls", lambda: _count_writers(StreamQueue))
+registry.gauge("ws_rooms", "Rooms with at least one connection", lambda: len(manager.connections.rooms))
+registry.gauge("ws_users", "Users with at least one connection", lambda: len(manager.connections.users))
+registry.gauge(
+    "ws_queued_frames",
+    "Frames waiting in connection send queues",
+    lambda: sum(len(record.writer.queue) for record in list(manager.connections.records.values())),
+)
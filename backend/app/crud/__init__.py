@@ -1,6 +1,8 @@
 from .base import CRUDBase
 from .crud_user import user
 from .crud_message import message
+from .crud_read_cursor import read_cursor
+from .crud_room import room, room_member
 
 # For a new basic CRUD you will need to import and add it here
-__all__ = ["CRUDBase", "user", "message"]
+__all__ = ["CRUDBase", "user", "message", "read_cursor", "room", "room_member"]
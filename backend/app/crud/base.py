@@ -1,7 +1,9 @@
-from typing import Any, Dict, Generic, List, Optional, Type, TypeVar, Union
+from typing import Any, Callable, Dict, Generic, List, Optional, Type, TypeVar, Union
 from pydantic import BaseModel
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
 
+from ..database import run_in_db, run_with_session
 from ..models.base import BaseModel as Base
 
 ModelType = TypeVar("ModelType", bound=Base)
@@ -19,14 +21,36 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         """
         self.model = model
 
+    async def _run(self, fn: Callable[..., Any], db: Optional[Session], **kwargs: Any) -> Any:
+        """
+        Run a sync CRUD method off the event loop. With db=None the call
+        gets its own session, so long-lived sockets don't pin a connection.
+        """
+        if db is None:
+            return await run_with_session(fn, **kwargs)
+        return await run_in_db(fn, db, **kwargs)
+
+    def _insert(self, db: Session, model: Any = None):
+        """Dialect-specific INSERT, for ON CONFLICT upserts"""
+        insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+        return insert(model if model is not None else self.model)
+
     def get(self, db: Session, id: Any) -> Optional[ModelType]:
         return db.query(self.model).filter(self.model.id == id).first()
 
+    async def aget(self, db: Optional[Session], id: Any) -> Optional[ModelType]:
+        return await self._run(self.get, db, id=id)
+
     def get_multi(
         self, db: Session, *, skip: int = 0, limit: int = 100
     ) -> List[ModelType]:
         return db.query(self.model).offset(skip).limit(limit).all()
 
+    async def aget_multi(
+        self, db: Optional[Session], *, skip: int = 0, limit: int = 100
+    ) -> List[ModelType]:
+        return await self._run(self.get_multi, db, skip=skip, limit=limit)
+
     def create(self, db: Session, *, obj_in: CreateSchemaType) -> ModelType:
         obj_in_data = obj_in.dict()
         db_obj = self.model(**obj_in_data)
@@ -35,6 +59,9 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         db.refresh(db_obj)
         return db_obj
 
+    async def acreate(self, db: Optional[Session], *, obj_in: CreateSchemaType) -> ModelType:
+        return await self._run(self.create, db, obj_in=obj_in)
+
     def update(
         self,
         db: Session,
@@ -1,13 +1,41 @@
-from datetime import datetime
-from typing import List, Optional
+import base64
+import re
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, case, column, func, insert, inspect, literal_column, or_, select, table, tuple_, update
+from sqlalchemy.orm import Query, Session, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 
-from ..models import Message
+from ..core.archive import archive_reader
+from ..core.config import settings
+from ..core.message_cache import CachedMessage, message_cache, serialize
+from ..models import Message, ReadCursor, RoomMember, User
+from ..models.search import SEARCH_CONFIG
 from ..schemas.message import MessageCreate, MessageUpdate
 from .base import CRUDBase
+from .crud_read_cursor import read_cursor
+from .crud_room import room_member
+
+# Widens the "changed since" window of a sync
+SYNC_SLACK = timedelta(seconds=1)
 
 class CRUDMessage(CRUDBase[Message, MessageCreate, MessageUpdate]):
+    def _query(self, db: Session, *, load_users: bool = True) -> Query:
+        """
+        Base message query. Senders and recipients are loaded in bulk with
+        one IN query each instead of a lazy SELECT per message.
+        """
+        query = db.query(self.model)
+        if load_users:
+            query = query.options(
+                selectinload(Message.sender), selectinload(Message.recipient)
+            )
+        return query
+
+    def get(self, db: Session, id: int) -> Optional[Message]:
+        return self._query(db).filter(Message.id == id).first()
+
     def create_with_sender(
         self, db: Session, *, obj_in: MessageCreate, sender_id: int
     ) -> Message:
@@ -19,27 +47,505 @@ class CRUDMessage(CRUDBase[Message, MessageCreate, MessageUpdate]):
             is_read=False,
         )
         db.add(db_obj)
+        db.flush()
+        # Inbox counters change in the same transaction as the insert
+        room_member.record_messages(db, rows=[{
+            "id": db_obj.id,
+            "room_id": db_obj.room_id,
+            "sender_id": db_obj.sender_id,
+            "recipient_id": db_obj.recipient_id,
+        }])
         db.commit()
         db.refresh(db_obj)
+        # Loaded here, so serializing the response does not lazy-load them
+        # on the event loop
+        self._attach_users(db, [db_obj])
+        self._remember(db, [db_obj])
         return db_obj
+
+    def create_many(self, db: Session, *, rows: List[dict]) -> List[Message]:
+        """
+        Insert many messages in one multi-row INSERT ... RETURNING and a
+        single commit, together with the inbox counters. Timestamps come
+        from the database clock, as for single inserts. Returns the new
+        messages in the order of `rows`, detached from the session.
+        """
+        result = db.execute(
+            insert(Message).returning(
+                Message.id, Message.created_at, Message.updated_at, sort_by_parameter_order=True
+            ),
+            rows,
+        )
+        messages = [
+            Message(id=message_id, created_at=created_at, updated_at=updated_at, read_at=None, **row)
+            for row, (message_id, created_at, updated_at) in zip(rows, result.all())
+        ]
+        room_member.record_messages(
+            db, rows=[dict(row, id=message.id) for row, message in zip(rows, messages)]
+        )
+        db.commit()
+        self._remember(db, messages)
+        return messages
+
+    def _remember(self, db: Session, messages: List[Message]) -> None:
+        """Push committed messages onto the recent-message cache of their rooms"""
+        by_room: Dict[str, List[Message]] = {}
+        for message in messages:
+            by_room.setdefault(message.room_id, []).append(message)
+        held = [room_id for room_id in by_room if message_cache.holds(room_id)]
+        # Rooms not held still void any fill that read them before this commit
+        message_cache.invalidate([room_id for room_id in by_room if room_id not in held])
+        if not held:
+            return
+        cached = [message for room_id in held for message in by_room[room_id]]
+        self._attach_users(db, [m for m in cached if "sender" in inspect(m).unloaded])
+        for room_id in held:
+            message_cache.push(room_id, [serialize(message) for message in by_room[room_id]])
+
+    async def acreate_with_sender(
+        self, db: Optional[Session], *, obj_in: MessageCreate, sender_id: int
+    ) -> Message:
+        return await self._run(
+            self.create_with_sender, db, obj_in=obj_in, sender_id=sender_id
+        )
     
     def get_multi_by_room(
         self, db: Session, *, room_id: str, skip: int = 0, limit: int = 100
     ) -> List[Message]:
         return (
-            db.query(self.model)
+            self._query(db)
             .filter(Message.room_id == room_id)
             .order_by(Message.created_at.desc())
             .offset(skip)
             .limit(limit)
             .all()
         )
+
+    def encode_cursor(self, message: Message) -> str:
+        """Opaque cursor anchored on a message of the page"""
+        return base64.urlsafe_b64encode(f"m:{message.id}".encode()).decode().rstrip("=")
+
+    def decode_cursor(self, cursor: str) -> int:
+        """Message id behind a cursor; raises ValueError if it is malformed"""
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            prefix, _, message_id = base64.urlsafe_b64decode(padded).decode().partition(":")
+            if prefix != "m":
+                raise ValueError
+            return int(message_id)
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError(f"Invalid cursor: {cursor!r}")
+
+    def get_page_by_room(
+        self,
+        db: Session,
+        *,
+        room_id: str,
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+        limit: int = 50,
+        load_users: bool = True,
+    ) -> List[Message]:
+        """
+        Keyset page of room history, newest first.
+
+        `before` returns messages older than the cursor and `after` newer
+        ones. When the database runs out of older history the page carries
+        on into archived months, read back from their files on demand.
+        """
+        messages = self._get_live_page(
+            db, room_id=room_id, before=before, after=after, limit=limit, load_users=load_users
+        )
+        if len(messages) >= limit or not archive_reader.archives(db):
+            return messages
+
+        archived = self._get_archived_page(
+            db, room_id=room_id, before=before, after=after, limit=limit, live=messages,
+            load_users=load_users,
+        )
+        if load_users:
+            self._attach_users(db, [m for m in archived if inspect(m).transient])
+        return archived
+
+    def _get_archived_page(
+        self,
+        db: Session,
+        *,
+        room_id: str,
+        before: Optional[str],
+        after: Optional[str],
+        limit: int,
+        live: List[Message],
+        load_users: bool,
+    ) -> List[Message]:
+        """Complete a short live page from the archives, or page inside them"""
+        cursor = before or after
+        anchor_id = self.decode_cursor(cursor) if cursor is not None else None
+        anchor_created_at = None
+        if anchor_id is not None and not live:
+            anchor_created_at = db.scalar(select(Message.created_at).where(Message.id == anchor_id))
+
+        if after and not before:
+            # Archives only hold history older than the database, so there
+            # is nothing to add unless the anchor itself is archived
+            if live or anchor_created_at is not None:
+                return live
+            anchor = archive_reader.find(db, room_id=room_id, message_id=anchor_id)
+            if anchor is None:
+                return live
+            page = archive_reader.page_after(
+                db, room_id=room_id, after=(anchor.created_at, anchor.id), limit=limit
+            )
+            if len(page) < limit:
+                oldest_live = (
+                    self._query(db, load_users=load_users)
+                    .filter(Message.room_id == room_id)
+                    .order_by(Message.created_at.asc(), Message.id.asc())
+                    .limit(limit - len(page))
+                    .all()
+                )
+                oldest_live.reverse()
+                page = oldest_live + page
+            return page
+
+        if live:
+            key = (live[-1].created_at, live[-1].id)
+        elif anchor_created_at is not None:
+            key = (anchor_created_at, anchor_id)
+        elif anchor_id is not None:
+            anchor = archive_reader.find(db, room_id=room_id, message_id=anchor_id)
+            if anchor is None:
+                return live
+            key = (anchor.created_at, anchor.id)
+        else:
+            key = None
+        return live + archive_reader.page_before(
+            db, room_id=room_id, before=key, limit=limit - len(live)
+        )
+
+    def _attach_users(self, db: Session, messages: List[Message]) -> None:
+        """Load senders/recipients for messages outside the session, in one query"""
+        user_ids = {m.sender_id for m in messages}
+        user_ids.update(m.recipient_id for m in messages if m.recipient_id is not None)
+        if not user_ids:
+            return
+        users = {user.id: user for user in db.query(User).filter(User.id.in_(user_ids))}
+        for message in messages:
+            # No backref events, so the transient message never joins the session
+            set_committed_value(message, "sender", users.get(message.sender_id))
+            set_committed_value(message, "recipient", users.get(message.recipient_id))
+
+    def _get_live_page(
+        self,
+        db: Session,
+        *,
+        room_id: str,
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+        limit: int = 50,
+        load_users: bool = True,
+    ) -> List[Message]:
+        """
+        Keyset page of the history still in the database. Pages seek on
+        (room_id, created_at, id); the anchor's key is read by primary key
+        so the comparison uses the stored value itself.
+        """
+        query = self._query(db, load_users=load_users).filter(Message.room_id == room_id)
+        cursor = before or after
+        if cursor is not None:
+            anchor_id = self.decode_cursor(cursor)
+            anchor_created_at = (
+                select(Message.created_at).where(Message.id == anchor_id).scalar_subquery()
+            )
+            key = tuple_(Message.created_at, Message.id)
+            anchor = tuple_(anchor_created_at, anchor_id)
+            query = query.filter(key < anchor if before else key > anchor)
+
+        if after and not before:
+            # Walk forward from the anchor, then return newest first
+            messages = (
+                query.order_by(Message.created_at.asc(), Message.id.asc())
+                .limit(limit)
+                .all()
+            )
+            messages.reverse()
+            return messages
+
+        return (
+            query.order_by(Message.created_at.desc(), Message.id.desc())
+            .limit(limit)
+            .all()
+        )
+
+    async def aget_page_by_room(
+        self,
+        db: Optional[Session],
+        *,
+        room_id: str,
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+        limit: int = 50,
+    ) -> List[Message]:
+        return await self._run(
+            self.get_page_by_room, db, room_id=room_id, before=before, after=after, limit=limit
+        )
+
+    def get_compact_page_by_room(
+        self,
+        db: Session,
+        *,
+        room_id: str,
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+        limit: int = 50,
+    ) -> Tuple[List[Message], List[User]]:
+        """
+        Keyset page plus each distinct sender/recipient once, in exactly
+        two queries regardless of page size.
+        """
+        messages = self.get_page_by_room(
+            db, room_id=room_id, before=before, after=after, limit=limit, load_users=False
+        )
+        user_ids = {m.sender_id for m in messages}
+        user_ids.update(m.recipient_id for m in messages if m.recipient_id is not None)
+        users = db.query(User).filter(User.id.in_(user_ids)).all() if user_ids else []
+        return messages, users
+
+    def get_recent_page(self, db: Session, *, room_id: str, limit: int = 50) -> List[CachedMessage]:
+        """
+        First page of room history, serialized, after a recent-message cache
+        miss. Reads a full cache-sized page so the room can be cached.
+        """
+        token = message_cache.begin_fill(room_id)
+        size = max(limit, message_cache.size)
+        entries = [serialize(m) for m in self.get_page_by_room(db, room_id=room_id, limit=size)]
+        message_cache.fill(room_id, token, entries, complete=len(entries) < size)
+        return entries[:limit]
+
+    async def aget_recent_page(
+        self, db: Optional[Session], *, room_id: str, limit: int = 50
+    ) -> List[CachedMessage]:
+        return await self._run(self.get_recent_page, db, room_id=room_id, limit=limit)
+
+    async def aget_compact_page_by_room(
+        self,
+        db: Optional[Session],
+        *,
+        room_id: str,
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+        limit: int = 50,
+    ) -> Tuple[List[Message], List[User]]:
+        return await self._run(
+            self.get_compact_page_by_room, db, room_id=room_id, before=before, after=after, limit=limit
+        )
+
+    def encode_search_cursor(self, rank: float, message_id: int) -> str:
+        return base64.urlsafe_b64encode(f"s:{rank!r}:{message_id}".encode()).decode().rstrip("=")
+
+    def decode_search_cursor(self, cursor: str) -> Tuple[float, int]:
+        """(rank, message id) behind a search cursor; raises ValueError if malformed"""
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            prefix, rank, message_id = base64.urlsafe_b64decode(padded).decode().split(":")
+            if prefix != "s":
+                raise ValueError
+            return float(rank), int(message_id)
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError(f"Invalid cursor: {cursor!r}")
+
+    def search(
+        self,
+        db: Session,
+        *,
+        user_id: int,
+        query: str,
+        room_id: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = 20,
+    ) -> List[Tuple[Message, float]]:
+        """
+        Full-text search over the rooms the user is a member of, best
+        matches first as (message, rank) pairs.
+
+        Matches come from the GIN-indexed tsvector on PostgreSQL and the
+        FTS5 table on SQLite. Only the newest SEARCH_MAX_CANDIDATES matches
+        are ranked, which bounds the cost of very common terms. Pages seek
+        on (rank, id), so `cursor` is the last hit of the previous page.
+        """
+        terms = re.findall(r"\w+", query)
+        if not terms:
+            return []
+        rooms = select(RoomMember.room_id).where(RoomMember.user_id == user_id)
+
+        if db.get_bind().dialect.name == "postgresql":
+            search_vector = literal_column("messages.search_vector")
+            tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, query)
+            rank = func.ts_rank(search_vector, tsquery)
+            matches = select(Message.id, rank.label("rank")).where(
+                search_vector.op("@@")(tsquery), Message.room_id.in_(rooms)
+            )
+            newest_first = Message.id.desc()
+        else:
+            # FTS5 query syntax is strict; search for every word as a phrase
+            fts = table("messages_fts", column("rowid"))
+            fts_query = " ".join('"' + term + '"' for term in terms)
+            # bm25() is lower for better matches
+            rank = -func.bm25(literal_column("messages_fts"))
+            matches = (
+                select(Message.id, rank.label("rank"))
+                .select_from(fts)
+                .join(Message, Message.id == fts.c.rowid)
+                .where(literal_column("messages_fts").op("MATCH")(fts_query), Message.room_id.in_(rooms))
+            )
+            # Ordering on the FTS rowid lets FTS5 walk its index backwards
+            newest_first = fts.c.rowid.desc()
+        if room_id is not None:
+            matches = matches.where(Message.room_id == room_id)
+        hits = matches.order_by(newest_first).limit(settings.SEARCH_MAX_CANDIDATES).subquery()
+
+        page = db.query(Message, hits.c.rank).join(hits, hits.c.id == Message.id)
+        if cursor is not None:
+            after_rank, after_id = self.decode_search_cursor(cursor)
+            page = page.filter(
+                or_(hits.c.rank < after_rank, and_(hits.c.rank == after_rank, hits.c.id < after_id))
+            )
+        rows = page.order_by(hits.c.rank.desc(), hits.c.id.desc()).limit(limit).all()
+        return [(message, rank) for message, rank in rows]
+
+    async def asearch(
+        self,
+        db: Optional[Session],
+        *,
+        user_id: int,
+        query: str,
+        room_id: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = 20,
+    ) -> List[Tuple[Message, float]]:
+        return await self._run(
+            self.search, db, user_id=user_id, query=query, room_id=room_id, cursor=cursor, limit=limit
+        )
+
+    def get_changes(
+        self,
+        db: Session,
+        *,
+        user_id: int,
+        marks: Dict[str, int],
+        since: Optional[datetime] = None,
+        limit: int = settings.SYNC_MAX_MESSAGES,
+    ) -> Tuple[List[dict], List[User], datetime]:
+        """
+        What changed in each room since the client last saw message
+        `marks[room_id]` (0 for nothing): newer messages, already seen
+        messages changed since (edits, read flags) and other members' read
+        cursors that moved. Changes are "since" the `since` time a previous
+        sync returned, or failing that the last seen message's timestamp.
+
+        Returns per-room change sets, every user they mention once, and the
+        time to pass as `since` next. A room with more than `limit` new or
+        changed messages is cut short and flagged `has_more`; the client
+        should reload its history instead.
+
+        At most six queries however many rooms are asked for.
+        """
+        synced_at = db.scalar(select(func.now()))
+        room_ids = list(marks)
+
+        if since is not None:
+            since_by_room = {room_id: since for room_id, mark in marks.items() if mark > 0}
+        else:
+            seen = [mark for mark in marks.values() if mark > 0]
+            anchors = dict(
+                db.execute(select(Message.id, Message.created_at).where(Message.id.in_(seen))).all()
+            ) if seen else {}
+            since_by_room = {
+                room_id: anchors[mark] for room_id, mark in marks.items() if mark in anchors
+            }
+        # A second of slack: SQLite keeps whole seconds, and sending a change
+        # twice is harmless while missing one is not
+        since_by_room = {room_id: changed - SYNC_SLACK for room_id, changed in since_by_room.items()}
+
+        def numbered(order_by, *criteria):
+            # At most limit + 1 rows per room, the extra one meaning has_more
+            position = func.row_number().over(partition_by=Message.room_id, order_by=order_by)
+            ranked = select(Message.id, position.label("position")).where(*criteria).subquery()
+            return (
+                self._query(db, load_users=False)
+                .join(ranked, ranked.c.id == Message.id)
+                .filter(ranked.c.position <= limit + 1)
+                .order_by(Message.room_id, Message.id)
+                .all()
+            )
+
+        new_messages = numbered(
+            Message.id,
+            Message.room_id.in_(room_ids),
+            Message.id > case(marks, value=Message.room_id, else_=0),
+        )
+        updated_messages = numbered(
+            Message.updated_at.desc(),
+            or_(*[
+                and_(Message.room_id == room_id, Message.id <= marks[room_id], Message.updated_at >= changed)
+                for room_id, changed in since_by_room.items()
+            ]),
+        ) if since_by_room else []
+
+        # Rooms the client has never seen get every cursor
+        unseen = [room_id for room_id in room_ids if room_id not in since_by_room]
+        moved = [ReadCursor.room_id.in_(unseen)] if unseen else []
+        if since_by_room:
+            moved.append(and_(
+                ReadCursor.room_id.in_(list(since_by_room)),
+                ReadCursor.updated_at >= case(since_by_room, value=ReadCursor.room_id),
+            ))
+        cursors = db.query(ReadCursor).filter(
+            ReadCursor.user_id != user_id, or_(*moved)
+        ).all()
+
+        rooms = {
+            room_id: {"room_id": room_id, "messages": [], "updated": [], "read_cursors": [], "has_more": False}
+            for room_id in room_ids
+        }
+        for key, messages in (("messages", new_messages), ("updated", updated_messages)):
+            for message in messages:
+                rooms[message.room_id][key].append(message)
+            for room in rooms.values():
+                if len(room[key]) > limit:
+                    room[key] = room[key][:limit]
+                    room["has_more"] = True
+        for cursor in cursors:
+            rooms[cursor.room_id]["read_cursors"].append(cursor)
+
+        user_ids = {m.sender_id for m in new_messages + updated_messages}
+        user_ids.update(m.recipient_id for m in new_messages + updated_messages if m.recipient_id is not None)
+        users = db.query(User).filter(User.id.in_(user_ids)).all() if user_ids else []
+        return list(rooms.values()), users, synced_at
+
+    async def aget_changes(
+        self,
+        db: Optional[Session],
+        *,
+        user_id: int,
+        marks: Dict[str, int],
+        since: Optional[datetime] = None,
+        limit: int = settings.SYNC_MAX_MESSAGES,
+    ) -> Tuple[List[dict], List[User], datetime]:
+        return await self._run(self.get_changes, db, user_id=user_id, marks=marks, since=since, limit=limit)
+
+    async def aget_multi_by_room(
+        self, db: Optional[Session], *, room_id: str, skip: int = 0, limit: int = 100
+    ) -> List[Message]:
+        return await self._run(
+            self.get_multi_by_room, db, room_id=room_id, skip=skip, limit=limit
+        )
     
     def get_unread_messages(
         self, db: Session, *, recipient_id: int, skip: int = 0, limit: int = 100
     ) -> List[Message]:
         return (
-            db.query(self.model)
+            self._query(db)
             .filter(
                 Message.recipient_id == recipient_id,
                 Message.is_read == False
@@ -50,28 +556,37 @@ class CRUDMessage(CRUDBase[Message, MessageCreate, MessageUpdate]):
         )
     
     def mark_as_read(self, db: Session, *, db_obj: Message) -> Message:
-        db_obj.is_read = True
-        db_obj.read_at = datetime.utcnow()
-        db.add(db_obj)
-        db.commit()
+        """
+        Read receipt for one message. Advances the recipient's cursor in
+        the room, so every earlier message there is marked read as well.
+        """
+        read_cursor.advance_many(
+            db, user_id=db_obj.recipient_id, cursors={db_obj.room_id: db_obj.id}
+        )
         db.refresh(db_obj)
         return db_obj
+
+    async def amark_as_read(self, db: Optional[Session], *, db_obj: Message) -> Message:
+        return await self._run(self.mark_as_read, db, db_obj=db_obj)
     
     def mark_all_as_read(
         self, db: Session, *, recipient_id: int, sender_id: int
     ) -> List[Message]:
-        messages = db.query(self.model).filter(
-            Message.sender_id == sender_id,
-            Message.recipient_id == recipient_id,
-            Message.is_read == False
+        """Mark everything from sender to recipient read in one UPDATE; returns the messages marked"""
+        messages = db.scalars(
+            update(Message)
+            .where(
+                Message.sender_id == sender_id,
+                Message.recipient_id == recipient_id,
+                Message.is_read == False,
+            )
+            .values(is_read=True, read_at=datetime.utcnow())
+            .returning(Message)
+            .execution_options(synchronize_session=False)
         ).all()
-        
-        for message in messages:
-            message.is_read = True
-            message.read_at = datetime.utcnow()
-            db.add(message)
-        
+        room_ids = {message.room_id for message in messages}
         db.commit()
+        message_cache.invalidate(room_ids)
         return messages
 
 message = CRUDMessage(Message)
@@ -0,0 +1,106 @@
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from ..core.message_cache import message_cache
+from ..models import Message, ReadCursor
+from ..schemas.read_cursor import ReadReceipt
+from .base import CRUDBase
+from .crud_room import room_member
+
+class CRUDReadCursor(CRUDBase[ReadCursor, ReadReceipt, ReadReceipt]):
+    def get_by_user(
+        self, db: Session, *, user_id: int, room_ids: Optional[List[str]] = None
+    ) -> List[ReadCursor]:
+        query = db.query(ReadCursor).filter(ReadCursor.user_id == user_id)
+        if room_ids is not None:
+            query = query.filter(ReadCursor.room_id.in_(room_ids))
+        return query.all()
+
+    async def aget_by_user(
+        self, db: Optional[Session], *, user_id: int, room_ids: Optional[List[str]] = None
+    ) -> List[ReadCursor]:
+        return await self._run(self.get_by_user, db, user_id=user_id, room_ids=room_ids)
+
+    def advance_many(
+        self, db: Session, *, user_id: int, cursors: Dict[str, int]
+    ) -> List[ReadCursor]:
+        """
+        Move the user's cursors in several rooms forward (never back) and
+        mark the messages they cover as read. Returns only the cursors that
+        moved, so duplicate and stale receipts are not announced again.
+
+        Runs as a fixed number of statements however many messages or rooms
+        are involved: one lookup of each room's newest id (cursors are
+        clamped to it), one multi-row upsert returning the cursors it
+        changed, one set-based UPDATE of `messages.is_read` and the inbox
+        unread recount.
+        """
+        if not cursors:
+            return []
+        room_ids = list(cursors)
+        newest = dict(
+            db.execute(
+                select(Message.room_id, func.max(Message.id))
+                .where(Message.room_id.in_(room_ids))
+                .group_by(Message.room_id)
+            ).all()
+        )
+        rows = [
+            {"user_id": user_id, "room_id": room_id, "last_read_message_id": min(message_id, newest[room_id])}
+            for room_id, message_id in cursors.items()
+            if room_id in newest
+        ]
+        if not rows:
+            return []
+        stmt = self._insert(db).values(rows)
+        moved = db.scalars(
+            stmt.on_conflict_do_update(
+                index_elements=["user_id", "room_id"],
+                set_={
+                    "last_read_message_id": stmt.excluded.last_read_message_id,
+                    "updated_at": func.now(),
+                },
+                where=ReadCursor.last_read_message_id < stmt.excluded.last_read_message_id,
+            ).returning(ReadCursor)
+        ).all()
+        if not moved:
+            db.commit()
+            return []
+        moved_rooms = [cursor.room_id for cursor in moved]
+        cursor_id = (
+            select(ReadCursor.last_read_message_id)
+            .where(ReadCursor.user_id == user_id, ReadCursor.room_id == Message.room_id)
+            .scalar_subquery()
+        )
+        marked = db.execute(
+            update(Message)
+            .where(
+                Message.recipient_id == user_id,
+                Message.room_id.in_(moved_rooms),
+                Message.is_read == False,
+                Message.id <= cursor_id,
+            )
+            .values(is_read=True, read_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        room_member.mark_read(db, user_id=user_id, room_ids=moved_rooms)
+        for cursor in moved:
+            # Loaded in full by RETURNING; detached so the commit does not
+            # expire them for callers whose session closes next
+            db.expunge(cursor)
+        db.commit()
+        if marked.rowcount:
+            # Cached history carries is_read; group rooms have no recipients
+            # and are left alone
+            message_cache.invalidate(moved_rooms)
+        return moved
+
+    async def aadvance_many(
+        self, db: Optional[Session], *, user_id: int, cursors: Dict[str, int]
+    ) -> List[ReadCursor]:
+        return await self._run(self.advance_many, db, user_id=user_id, cursors=cursors)
+
+read_cursor = CRUDReadCursor(ReadCursor)
@@ -0,0 +1,256 @@
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import case, func, literal, select, update
+from sqlalchemy.orm import Session
+
+from ..models import Message, ReadCursor, Room, RoomMember, RoomState
+from ..schemas.room import RoomCreate, RoomSummary
+from .base import CRUDBase
+
+class CRUDRoomMember(CRUDBase[RoomMember, RoomSummary, RoomSummary]):
+    def record_messages(self, db: Session, *, rows: List[dict]) -> None:
+        """
+        Fold newly inserted messages into room_state and room_members in
+        the caller's transaction (nothing is committed here).
+
+        Rows need id, room_id, sender_id and recipient_id; created_at
+        defaults to now. Each room in the batch costs three statements:
+        upsert its room_state, add missing members (senders, recipients),
+        and bump every member's unread counter and latest activity.
+        """
+        by_room: Dict[str, List[dict]] = defaultdict(list)
+        for row in rows:
+            by_room[row["room_id"]].append(row)
+
+        for room_id, room_rows in by_room.items():
+            last = max(room_rows, key=lambda row: row["id"])
+            last_id = last["id"]
+            last_activity = last.get("created_at") or func.now()
+
+            # Concurrent writers may commit out of id order, so the latest
+            # message only ever moves forward
+            stmt = self._insert(db, RoomState).values(
+                room_id=room_id,
+                last_message_id=last_id,
+                last_activity=last_activity,
+                message_count=len(room_rows),
+            )
+            newer = RoomState.last_message_id > stmt.excluded.last_message_id
+            db.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=["room_id"],
+                    set_={
+                        "last_message_id": case((newer, RoomState.last_message_id), else_=stmt.excluded.last_message_id),
+                        "last_activity": case((newer, RoomState.last_activity), else_=stmt.excluded.last_activity),
+                        "message_count": RoomState.message_count + stmt.excluded.message_count,
+                        "updated_at": func.now(),
+                    },
+                )
+            )
+
+            participants = {row["sender_id"] for row in room_rows}
+            participants.update(row["recipient_id"] for row in room_rows if row["recipient_id"] is not None)
+            stmt = self._insert(db).values(
+                [{"user_id": user_id, "room_id": room_id, "unread_count": 0} for user_id in sorted(participants)]
+            )
+            db.execute(stmt.on_conflict_do_nothing(index_elements=["user_id", "room_id"]))
+
+            # Everyone's unread count grows by the messages they didn't send
+            sent = Counter(row["sender_id"] for row in room_rows)
+            newer = RoomMember.last_message_id > last_id
+            db.execute(
+                update(RoomMember)
+                .where(RoomMember.room_id == room_id)
+                .values(
+                    unread_count=RoomMember.unread_count + len(room_rows)
+                    - case(dict(sent), value=RoomMember.user_id, else_=0),
+                    last_message_id=case((newer, RoomMember.last_message_id), else_=last_id),
+                    last_activity=case((newer, RoomMember.last_activity), else_=last_activity),
+                    updated_at=func.now(),
+                )
+                .execution_options(synchronize_session=False)
+            )
+
+    def mark_read(self, db: Session, *, user_id: int, room_ids: List[str]) -> None:
+        """
+        Recount the user's unread messages after their read cursors moved,
+        in the caller's transaction. Readers who never posted in a room
+        become members so it shows up in their inbox.
+        """
+        if not room_ids:
+            return
+        states = select(
+            literal(user_id),
+            RoomState.room_id,
+            literal(0),
+            RoomState.last_message_id,
+            RoomState.last_activity,
+        ).where(RoomState.room_id.in_(room_ids))
+        db.execute(
+            self._insert(db)
+            .from_select(["user_id", "room_id", "unread_count", "last_message_id", "last_activity"], states)
+            .on_conflict_do_nothing(index_elements=["user_id", "room_id"])
+        )
+
+        cursor_id = (
+            select(ReadCursor.last_read_message_id)
+            .where(ReadCursor.user_id == user_id, ReadCursor.room_id == Message.room_id)
+            .scalar_subquery()
+        )
+        unread = (
+            select(func.count(Message.id))
+            .where(
+                Message.room_id == RoomMember.room_id,
+                Message.sender_id != user_id,
+                Message.id > func.coalesce(cursor_id, 0),
+            )
+            .scalar_subquery()
+        )
+        db.execute(
+            update(RoomMember)
+            .where(RoomMember.user_id == user_id, RoomMember.room_id.in_(room_ids))
+            .values(unread_count=unread, updated_at=func.now())
+            .execution_options(synchronize_session=False)
+        )
+
+    def get_inbox(
+        self, db: Session, *, user_id: int, limit: int = 50
+    ) -> List[Tuple[RoomMember, Optional[Message]]]:
+        """
+        A user's rooms with their latest message, most recently active
+        first. One query that walks the (user_id, last_activity) index, so
+        its cost depends on `limit`, not on how many rooms the user is in.
+        """
+        return (
+            db.query(RoomMember, Message)
+            .outerjoin(Message, Message.id == RoomMember.last_message_id)
+            .filter(RoomMember.user_id == user_id)
+            .order_by(RoomMember.last_activity.desc(), RoomMember.room_id.desc())
+            .limit(limit)
+            .all()
+        )
+
+    async def aget_inbox(
+        self, db: Optional[Session], *, user_id: int, limit: int = 50
+    ) -> List[Tuple[RoomMember, Optional[Message]]]:
+        return await self._run(self.get_inbox, db, user_id=user_id, limit=limit)
+
+    def add(self, db: Session, *, room_id: str, user_ids: List[int]) -> None:
+        """Make users members of a room, in the caller's transaction"""
+        if not user_ids:
+            return
+        stmt = self._insert(db).values(
+            [{"user_id": user_id, "room_id": room_id, "unread_count": 0} for user_id in sorted(set(user_ids))]
+        )
+        db.execute(stmt.on_conflict_do_nothing(index_elements=["user_id", "room_id"]))
+
+    def invite(self, db: Session, *, room_id: str, user_ids: List[int]) -> None:
+        self.add(db, room_id=room_id, user_ids=user_ids)
+        db.commit()
+
+    async def ainvite(self, db: Optional[Session], *, room_id: str, user_ids: List[int]) -> None:
+        await self._run(self.invite, db, room_id=room_id, user_ids=user_ids)
+
+    def remove(self, db: Session, *, room_id: str, user_id: int) -> bool:
+        """Take a user out of a room; False if they were not in it"""
+        removed = (
+            db.query(RoomMember)
+            .filter(RoomMember.room_id == room_id, RoomMember.user_id == user_id)
+            .delete(synchronize_session=False)
+        )
+        db.commit()
+        return bool(removed)
+
+    async def aremove(self, db: Optional[Session], *, room_id: str, user_id: int) -> bool:
+        return await self._run(self.remove, db, room_id=room_id, user_id=user_id)
+
+    def get_private_room_ids(self, db: Session, *, user_id: int) -> List[str]:
+        """The private rooms a user belongs to"""
+        return list(
+            db.scalars(
+                select(RoomMember.room_id)
+                .join(Room, Room.room_id == RoomMember.room_id)
+                .where(RoomMember.user_id == user_id, Room.is_private.is_(True))
+            )
+        )
+
+    async def aget_private_room_ids(self, db: Optional[Session], *, user_id: int) -> List[str]:
+        return await self._run(self.get_private_room_ids, db, user_id=user_id)
+
+class CRUDRoom(CRUDBase[Room, RoomCreate, RoomCreate]):
+    def get_by_room_id(self, db: Session, *, room_id: str) -> Optional[Room]:
+        return db.query(Room).filter(Room.room_id == room_id).first()
+
+    async def aget_by_room_id(self, db: Optional[Session], *, room_id: str) -> Optional[Room]:
+        return await self._run(self.get_by_room_id, db, room_id=room_id)
+
+    def create_with_members(self, db: Session, *, obj_in: RoomCreate, created_by: int) -> Optional[Room]:
+        """Create a room with its creator and `member_ids` as members; None if it exists"""
+        if not self._claim(db, obj_in.room_id, created_by, obj_in.is_private):
+            return None
+        room_member.add(db, room_id=obj_in.room_id, user_ids=[created_by, *obj_in.member_ids])
+        db.commit()
+        return self.get_by_room_id(db, room_id=obj_in.room_id)
+
+    async def acreate_with_members(
+        self, db: Optional[Session], *, obj_in: RoomCreate, created_by: int
+    ) -> Optional[Room]:
+        return await self._run(self.create_with_members, db, obj_in=obj_in, created_by=created_by)
+
+    def claim(self, db: Session, *, room_id: str, user_id: int, is_private: bool) -> bool:
+        """
+        Create a room on first use, with the user as its only member.
+        Returns whether the room is private, whoever created it.
+        """
+        if self._claim(db, room_id, user_id, is_private):
+            room_member.add(db, room_id=room_id, user_ids=[user_id])
+            db.commit()
+            return is_private
+        db.commit()
+        return self.get_by_room_id(db, room_id=room_id).is_private
+
+    async def aclaim(self, db: Optional[Session], *, room_id: str, user_id: int, is_private: bool) -> bool:
+        return await self._run(self.claim, db, room_id=room_id, user_id=user_id, is_private=is_private)
+
+    def _claim(self, db: Session, room_id: str, user_id: int, is_private: bool) -> bool:
+        # ON CONFLICT DO NOTHING, so concurrent claims settle on one creator
+        result = db.execute(
+            self._insert(db)
+            .values(room_id=room_id, is_private=is_private, created_by=user_id)
+            .on_conflict_do_nothing(index_elements=["room_id"])
+        )
+        return result.rowcount == 1
+
+    def get_access_index(
+        self, db: Session, *, limit: int
+    ) -> Tuple[Dict[str, bool], Dict[int, List[str]]]:
+        """
+        Whether each of the `limit` most recently active rooms is private,
+        and who belongs to the private ones, by user. Two queries, to warm
+        the access index at startup.
+        """
+        recent = (
+            select(Room.room_id, Room.is_private)
+            .outerjoin(RoomState, RoomState.room_id == Room.room_id)
+            .order_by(RoomState.last_activity.desc().nulls_last(), Room.id.desc())
+            .limit(limit)
+            .subquery()
+        )
+        rooms = dict(db.execute(select(recent.c.room_id, recent.c.is_private)).all())
+        members: Dict[int, List[str]] = defaultdict(list)
+        for user_id, room_id in db.execute(
+            select(RoomMember.user_id, RoomMember.room_id)
+            .join(recent, recent.c.room_id == RoomMember.room_id)
+            .where(recent.c.is_private.is_(True))
+        ):
+            members[user_id].append(room_id)
+        return rooms, dict(members)
+
+    async def aget_access_index(
+        self, db: Optional[Session], *, limit: int
+    ) -> Tuple[Dict[str, bool], Dict[int, List[str]]]:
+        return await self._run(self.get_access_index, db, limit=limit)
+
+room_member = CRUDRoomMember(RoomMember)
+room = CRUDRoom(Room)
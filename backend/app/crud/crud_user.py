@@ -1,20 +1,43 @@
-from typing import Any, Dict, Optional, Union
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Union
 
+from sqlalchemy import bindparam, select, update
 from sqlalchemy.orm import Session
 
-from ..core.security import get_password_hash, verify_password
+from ..core.message_cache import message_cache
+from ..core.security import (
+    aget_password_hash,
+    averify_password,
+    get_password_hash,
+    invalidate_user,
+    password_hasher,
+    verify_password,
+)
 from ..models import User
 from ..schemas.user import UserCreate, UserUpdate
 from .base import CRUDBase
 
+# User fields in serialized messages (schemas.User), besides the timestamps
+CACHED_USER_FIELDS = ("email", "full_name", "is_active", "is_superuser")
+
 class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
     def get_by_email(self, db: Session, *, email: str) -> Optional[User]:
         return db.query(User).filter(User.email == email).first()
+
+    async def aget_by_email(self, db: Optional[Session], *, email: str) -> Optional[User]:
+        return await self._run(self.get_by_email, db, email=email)
     
     def create(self, db: Session, *, obj_in: UserCreate) -> User:
+        return self.create_with_hash(
+            db, obj_in=obj_in, hashed_password=get_password_hash(obj_in.password)
+        )
+
+    def create_with_hash(
+        self, db: Session, *, obj_in: UserCreate, hashed_password: str
+    ) -> User:
         db_obj = User(
             email=obj_in.email,
-            hashed_password=get_password_hash(obj_in.password),
+            hashed_password=hashed_password,
             full_name=obj_in.full_name,
             is_active=obj_in.is_active,
             is_superuser=obj_in.is_superuser,
@@ -23,6 +46,14 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
         db.commit()
         db.refresh(db_obj)
         return db_obj
+
+    async def acreate(self, db: Optional[Session], *, obj_in: UserCreate) -> User:
+        """Create a user, hashing the password on the password pool"""
+        with password_hasher.admission():
+            hashed_password = await aget_password_hash(obj_in.password)
+            return await self._run(
+                self.create_with_hash, db, obj_in=obj_in, hashed_password=hashed_password
+            )
     
     def update(
         self, db: Session, *, db_obj: User, obj_in: Union[UserUpdate, Dict[str, Any]]
@@ -37,7 +68,22 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
             del update_data["password"]
             update_data["hashed_password"] = hashed_password
             
-        return super().update(db, db_obj=db_obj, obj_in=update_data)
+        # Cached history embeds senders and recipients, so it only goes
+        # stale when a field it shows changes; a rehash on login does not
+        profile_changed = any(
+            field in update_data and update_data[field] != getattr(db_obj, field)
+            for field in CACHED_USER_FIELDS
+        )
+        user = super().update(db, db_obj=db_obj, obj_in=update_data)
+        invalidate_user(user.id)
+        if profile_changed:
+            message_cache.clear()
+        return user
+
+    def remove(self, db: Session, *, id: int) -> User:
+        user = super().remove(db, id=id)
+        invalidate_user(id)
+        return user
     
     def authenticate(self, db: Session, *, email: str, password: str) -> Optional[User]:
         user = self.get_by_email(db, email=email)
@@ -46,6 +92,50 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
         if not verify_password(password, user.hashed_password):
             return None
         return user
+
+    async def aauthenticate(
+        self, db: Optional[Session], *, email: str, password: str
+    ) -> Optional[User]:
+        """
+        Like authenticate(), with bcrypt on the password pool. Hashes made
+        with an outdated BCRYPT_ROUNDS are transparently replaced.
+        """
+        with password_hasher.admission():
+            user = await self.aget_by_email(db, email=email)
+            if not user:
+                return None
+            valid, new_hash = await averify_password(password, user.hashed_password)
+            if not valid:
+                return None
+            if new_hash:
+                user = await self._run(
+                    self.update, db, db_obj=user, obj_in={"hashed_password": new_hash}
+                )
+            return user
+    
+    def update_last_seen(self, db: Session, *, seen: Dict[int, datetime]) -> None:
+        """Write many users' last-seen times in one executemany"""
+        users = User.__table__
+        stmt = (
+            update(users)
+            .where(users.c.id == bindparam("b_id"))
+            # Presence is not a profile change: keep updated_at as it is
+            .values(last_seen_at=bindparam("b_seen"), updated_at=users.c.updated_at)
+        )
+        db.execute(stmt, [{"b_id": user_id, "b_seen": at} for user_id, at in seen.items()])
+        db.commit()
+
+    async def aupdate_last_seen(self, db: Optional[Session], *, seen: Dict[int, datetime]) -> None:
+        await self._run(self.update_last_seen, db, seen=seen)
+
+    def get_last_seen(self, db: Session, *, user_ids: List[int]) -> Dict[int, Optional[datetime]]:
+        rows = db.execute(select(User.id, User.last_seen_at).where(User.id.in_(user_ids)))
+        return {user_id: last_seen_at for user_id, last_seen_at in rows}
+
+    async def aget_last_seen(
+        self, db: Optional[Session], *, user_ids: List[int]
+    ) -> Dict[int, Optional[datetime]]:
+        return await self._run(self.get_last_seen, db, user_ids=user_ids)
     
     def is_active(self, user: User) -> bool:
         return user.is_active
@@ -1,19 +1,96 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, exc
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
-from typing import Generator
-import os
-from dotenv import load_dotenv
+from sqlalchemy.pool import NullPool, QueuePool
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Generator, TypeVar
+import asyncio
+import time
 
-load_dotenv()
+from .core.config import settings
+from .core.metrics import Histogram, instrument_engine, registry
 
-SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
+SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
+
+# Time spent waiting for a pooled connection, in seconds
+pool_wait_seconds = Histogram(buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30))
+pool_timeouts = 0
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waits"""
+
+    def _do_get(self):
+        global pool_timeouts
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            pool_timeouts += 1
+            raise
+        finally:
+            pool_wait_seconds.observe(time.perf_counter() - started)
+
+def _engine_options(url: str) -> dict:
+    if url.startswith("sqlite"):
+        return {"connect_args": {"check_same_thread": False}}
+
+    options: dict = {"pool_pre_ping": settings.DB_POOL_PRE_PING, "connect_args": {}}
+    if settings.DB_PGBOUNCER_MODE:
+        # PgBouncer does the pooling. psycopg2 never creates server-side
+        # prepared statements, so transaction pooling is safe as is.
+        options["poolclass"] = NullPool
+    else:
+        options.update(
+            poolclass=InstrumentedQueuePool,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+        )
+        if settings.DB_STATEMENT_TIMEOUT_MS:
+            options["connect_args"]["options"] = (
+                f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"
+            )
+    return options
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_engine_options(SQLALCHEMY_DATABASE_URL))
+instrument_engine(engine)
+
+if (
+    settings.DB_PGBOUNCER_MODE
+    and settings.DB_STATEMENT_TIMEOUT_MS
+    and not SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+):
+    # PgBouncer rejects startup options and shares server sessions, so the
+    # timeout is set per transaction instead
+    @event.listens_for(engine, "begin")
+    def _set_statement_timeout(conn):
+        conn.exec_driver_sql(
+            f"SET LOCAL statement_timeout = {int(settings.DB_STATEMENT_TIMEOUT_MS)}"
+        )
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in SQLALCHEMY_DATABASE_URL else {}
-)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def pool_status() -> dict:
+    """Live connection pool gauges plus the checkout wait histogram"""
+    pool = engine.pool
+    status = {"pool": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        gauge = getattr(pool, name, None)
+        if callable(gauge):
+            status[name] = gauge()
+    status["timeouts"] = pool_timeouts
+    status["wait_seconds"] = pool_wait_seconds.snapshot()
+    return status
+
+def _pool_gauges() -> dict:
+    status = pool_status()
+    return {(name,): status[name] for name in ("size", "checkedin", "checkedout", "overflow") if name in status}
+
+registry.gauge("db_pool_connections", "Connection pool gauges", _pool_gauges, ("state",))
+registry.gauge("db_pool_timeouts", "Pool checkouts that timed out", lambda: pool_timeouts)
+
 Base = declarative_base()
 
 def get_db() -> Generator[Session, None, None]:
@@ -22,3 +99,28 @@ def get_db() -> Generator[Session, None, None]:
         yield db
     finally:
         db.close()
+
+T = TypeVar("T")
+
+# Blocking SQLAlchemy calls made from async code run here instead of on the
+# event loop, and are bounded separately from FastAPI's shared threadpool
+db_executor = ThreadPoolExecutor(
+    max_workers=settings.DB_EXECUTOR_WORKERS,
+    thread_name_prefix="db",
+)
+
+async def run_in_db(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking database call on the database executor"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, partial(fn, *args, **kwargs))
+
+async def run_with_session(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run fn(db, ...) on the database executor with its own short-lived session"""
+    def call() -> T:
+        db = SessionLocal()
+        try:
+            return fn(db, *args, **kwargs)
+        finally:
+            db.close()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, call)
@@ -1,17 +1,49 @@
+import time
+
+_import_started = time.perf_counter()
+
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-import uvicorn
+from fastapi.responses import PlainTextResponse
+import asyncio
 
+from .core import startup
 from .core.config import settings
+from .core.metrics import MetricsMiddleware, registry
 from .api.v1.api import api_router
-from .database import Base, engine
+from .core.pipeline import message_pipeline
+from .core.websocket import manager
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Tables are created by `alembic upgrade head`, never here: startup only
+# checks the revision (see core/startup.py)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    profile = app.state.startup_profile = startup.StartupProfile(IMPORT_SECONDS)
+    await startup.prepare(app, profile)
+    # Join the cross-process broker so rooms span every worker
+    with profile.step("broker"):
+        await manager.start()
+    if settings.MESSAGE_PIPELINE_ENABLED:
+        with profile.step("pipeline"):
+            await message_pipeline.start()
+    partitions = None
+    if settings.MESSAGE_PARTITIONING:
+        from .core.partitions import maintain_partitions
+        partitions = asyncio.create_task(maintain_partitions())
+    if settings.STARTUP_PROFILE:
+        print(f"Startup profile: {profile.report()}")
+    yield
+    if partitions is not None:
+        partitions.cancel()
+    # Drain queued messages before the broker goes away
+    await message_pipeline.stop()
+    await manager.stop()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
+    lifespan=lifespan,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     docs_url="/docs",
     redoc_url="/redoc"
@@ -25,8 +57,13 @@ if settings.BACKEND_CORS_ORIGINS:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        # History paging cursors
+        expose_headers=["X-Cursor-Before", "X-Cursor-After"],
     )
 
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # Include API router
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
@@ -35,6 +72,26 @@ app.include_router(api_router, prefix=settings.API_V1_STR)
 async def health_check():
     return {"status": "ok"}
 
+if settings.METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        """Prometheus text exposition of the in-process metrics"""
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+IMPORT_SECONDS = time.perf_counter() - _import_started
+
 # For development
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
+    import argparse
+
+    parser = argparse.ArgumentParser(description=settings.PROJECT_NAME)
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="run startup once, print where the time went and exit",
+    )
+    if parser.parse_args().profile_startup:
+        asyncio.run(startup.profile_startup(app))
+    else:
+        import uvicorn
+        uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
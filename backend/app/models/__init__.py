@@ -1,6 +1,10 @@
 from .base import BaseModel
 from .user import User
 from .message import Message
+from .read_cursor import ReadCursor
+from .room import Room, RoomMember, RoomState
+from .archive import MessageArchive
+from . import search  # noqa: F401 - full-text index DDL
 
 # Import all models here so they are registered with SQLAlchemy
-__all__ = ["BaseModel", "User", "Message"]
+__all__ = ["BaseModel", "User", "Message", "ReadCursor", "Room", "RoomMember", "RoomState", "MessageArchive"]
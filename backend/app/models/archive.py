@@ -0,0 +1,16 @@
+from sqlalchemy import Column, String, Integer, DateTime
+from .base import BaseModel
+from ..database import Base
+
+class MessageArchive(BaseModel, Base):
+    """A month of messages moved out of the database into a compressed file"""
+    __tablename__ = "message_archives"
+    
+    partition_name = Column(String, unique=True, nullable=False)
+    # created_at range covered, [range_start, range_end)
+    range_start = Column(DateTime(timezone=True), nullable=False)
+    range_end = Column(DateTime(timezone=True), nullable=False)
+    min_id = Column(Integer, nullable=True)
+    max_id = Column(Integer, nullable=True)
+    row_count = Column(Integer, nullable=False, default=0)
+    path = Column(String, nullable=False)
@@ -1,10 +1,24 @@
-from sqlalchemy import Column, String, Integer, ForeignKey, Boolean, DateTime
+from sqlalchemy import Column, String, Integer, ForeignKey, Boolean, DateTime, Index, text
 from sqlalchemy.orm import relationship
 from .base import BaseModel
 from ..database import Base
 
 class Message(BaseModel, Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # Keyset pagination of room history by (created_at, id)
+        Index("ix_messages_room_created_id", "room_id", "created_at", "id"),
+        # Delta sync: messages past a room's mark, and ones changed since
+        Index("ix_messages_room_id_id", "room_id", "id"),
+        Index("ix_messages_room_updated", "room_id", "updated_at"),
+        # Unread messages per recipient, for read cursors and unread lookups
+        Index(
+            "ix_messages_unread",
+            "recipient_id", "room_id", "id",
+            postgresql_where=text("NOT is_read"),
+            sqlite_where=text("NOT is_read"),
+        ),
+    )
     
     content = Column(String, nullable=False)
     sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
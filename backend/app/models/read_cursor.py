@@ -0,0 +1,14 @@
+from sqlalchemy import Column, String, Integer, ForeignKey, UniqueConstraint
+from .base import BaseModel
+from ..database import Base
+
+class ReadCursor(BaseModel, Base):
+    """Newest message a user has read in a room; everything up to it is read"""
+    __tablename__ = "read_cursors"
+    __table_args__ = (
+        UniqueConstraint("user_id", "room_id", name="uq_read_cursors_user_room"),
+    )
+    
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    room_id = Column(String, nullable=False)
+    last_read_message_id = Column(Integer, nullable=False)
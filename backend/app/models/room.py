@@ -0,0 +1,42 @@
+from sqlalchemy import Boolean, Column, String, Integer, ForeignKey, DateTime, Index, UniqueConstraint
+from .base import BaseModel
+from ..database import Base
+
+class Room(BaseModel, Base):
+    """
+    Who may use a room. Public rooms are open to every user; private ones
+    only to their members (room_members rows). Rooms are created
+    explicitly, or claimed by the first user to join or post in them.
+    """
+    __tablename__ = "rooms"
+    
+    room_id = Column(String, unique=True, index=True, nullable=False)
+    is_private = Column(Boolean, nullable=False, default=True)
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+
+class RoomState(BaseModel, Base):
+    """Latest activity in a room, kept up to date as messages are written"""
+    __tablename__ = "room_state"
+    
+    room_id = Column(String, unique=True, index=True, nullable=False)
+    last_message_id = Column(Integer, nullable=True)
+    last_activity = Column(DateTime(timezone=True), nullable=True)
+    message_count = Column(Integer, nullable=False, default=0)
+
+class RoomMember(BaseModel, Base):
+    """
+    A user's membership of a room, and their view of it for the inbox: a
+    copy of the room's latest activity plus the user's unread counter.
+    """
+    __tablename__ = "room_members"
+    __table_args__ = (
+        UniqueConstraint("user_id", "room_id", name="uq_room_members_user_room"),
+        # Inbox: a user's rooms, most recently active first
+        Index("ix_room_members_inbox", "user_id", "last_activity", "room_id"),
+    )
+    
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    room_id = Column(String, nullable=False)
+    unread_count = Column(Integer, nullable=False, default=0)
+    last_message_id = Column(Integer, nullable=True)
+    last_activity = Column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,53 @@
+"""
+Full-text search index over message content.
+
+PostgreSQL keeps a `search_vector` tsvector column, filled by a trigger on
+insert/update and indexed with GIN. SQLite keeps an FTS5 table mirroring
+`messages.content`, synced by triggers. Neither lives on the ORM model, as
+both are dialect-specific; migration 0005 creates them for existing
+databases and the listener below for tables made with create_all().
+"""
+from sqlalchemy import DDL, event
+
+from .message import Message
+
+SEARCH_CONFIG = "english"
+
+POSTGRES_DDL = [
+    "ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    f"""
+    CREATE OR REPLACE TRIGGER messages_search_vector_update
+    BEFORE INSERT OR UPDATE OF content ON messages
+    FOR EACH ROW EXECUTE FUNCTION
+    tsvector_update_trigger(search_vector, 'pg_catalog.{SEARCH_CONFIG}', content)
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_messages_search_vector ON messages USING gin (search_vector)",
+]
+
+SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts
+    USING fts5(content, content='messages', content_rowid='id')
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+        INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+]
+
+for statement in POSTGRES_DDL:
+    event.listen(Message.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+for statement in SQLITE_DDL:
+    event.listen(Message.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
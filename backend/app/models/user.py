@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Boolean
+from sqlalchemy import Column, String, Boolean, DateTime
 from sqlalchemy.orm import relationship
 from passlib.context import CryptContext
 from ..database import Base
@@ -14,6 +14,8 @@ class User(BaseModel, Base):
     full_name = Column(String, nullable=False)
     is_active = Column(Boolean(), default=True)
     is_superuser = Column(Boolean(), default=False)
+    # Written in batches by the presence service
+    last_seen_at = Column(DateTime(timezone=True), nullable=True)
     
     # Relationships
     sent_messages = relationship("Message", back_populates="sender", foreign_keys="Message.sender_id")
@@ -1,2 +1,7 @@
 from .user import User, UserCreate, UserInDB, UserUpdate, Token, TokenData, UserInResponse
-from .message import Message, MessageCreate, MessageInDB, MessageInResponse
+from .message import Message, MessageCreate, MessageInDB, MessageInResponse, MessagePage, MessageSearchHit, MessageSearchPage
+from .read_cursor import ReadCursor, ReadReceipt, ReadReceiptBatch
+from .room import Room, RoomCreate, RoomFanoutStats, RoomMemberAdd, RoomSummary
+from .sync import RoomChanges, SyncRequest, SyncResponse
+from .ws import ChatEvent, ClientEvent, PongEvent, ReadEvent, TypingEvent
+from .presence import PresenceQuery, UserPresence
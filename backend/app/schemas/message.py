@@ -35,6 +35,26 @@ class Message(MessageInDBBase):
 class MessageInResponse(BaseModel):
     message: Message
 
+class MessagePage(BaseModel):
+    """
+    Compact history page: messages carry only user ids and each distinct
+    user is sent once in `users`.
+    """
+    messages: List[MessageInDBBase]
+    users: List['User']
+    before: Optional[str] = None
+    after: Optional[str] = None
+
+class MessageSearchHit(BaseModel):
+    message: MessageInDBBase
+    rank: float
+
+class MessageSearchPage(BaseModel):
+    """Best matches first; pass `next` back as `cursor` for more"""
+    hits: List[MessageSearchHit]
+    next: Optional[str] = None
+
 # Update forward refs after all models are defined
 from .user import User  # noqa
 Message.update_forward_refs()
+MessagePage.update_forward_refs()
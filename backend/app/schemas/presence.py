@@ -0,0 +1,11 @@
+from datetime import datetime
+from typing import List, Optional
+from pydantic import BaseModel, Field
+
+class PresenceQuery(BaseModel):
+    user_ids: List[int] = Field(..., min_length=1, max_length=500)
+
+class UserPresence(BaseModel):
+    user_id: int
+    online: bool
+    last_seen_at: Optional[datetime] = None
@@ -0,0 +1,20 @@
+from datetime import datetime
+from typing import List, Optional
+from pydantic import BaseModel, Field
+
+class ReadReceipt(BaseModel):
+    room_id: str
+    message_id: int
+
+class ReadReceiptBatch(BaseModel):
+    """Receipts for several rooms; only the newest per room is applied"""
+    receipts: List[ReadReceipt] = Field(..., min_length=1, max_length=500)
+
+class ReadCursor(BaseModel):
+    user_id: int
+    room_id: str
+    last_read_message_id: int
+    updated_at: Optional[datetime]
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,46 @@
+from datetime import datetime
+from typing import List, Optional
+from pydantic import BaseModel, Field
+
+from .message import MessageInDBBase
+
+class RoomSummary(BaseModel):
+    """One inbox entry: a room the user takes part in"""
+    room_id: str
+    unread_count: int
+    last_activity: Optional[datetime]
+    last_message: Optional[MessageInDBBase] = None
+
+    class Config:
+        from_attributes = True
+
+class RoomCreate(BaseModel):
+    room_id: str = Field(..., min_length=1, max_length=255)
+    is_private: bool = True
+    # Members besides the creator, who always is one
+    member_ids: List[int] = Field(default_factory=list, max_length=500)
+
+class RoomMemberAdd(BaseModel):
+    user_id: int
+
+class Room(BaseModel):
+    room_id: str
+    is_private: bool
+    created_by: Optional[int]
+    created_at: Optional[datetime]
+
+    class Config:
+        from_attributes = True
+
+class RoomFanoutStats(BaseModel):
+    """Fan-out counters for a room's connections in one worker"""
+    broadcasts: int
+    frames_sent: int
+    frames_dropped: int
+    frames_coalesced: int
+    slow_disconnects: int
+    max_queue_depth: int
+    latency_p50_ms: float
+    latency_p99_ms: float
+    members: int
+    queue_depth: int
@@ -0,0 +1,32 @@
+from datetime import datetime
+from typing import Dict, List, Optional
+from pydantic import BaseModel, Field
+
+from .message import MessageInDBBase
+from .read_cursor import ReadCursor
+from .user import User
+
+class SyncRequest(BaseModel):
+    """
+    Per-room high-water marks: the newest message id the client has for
+    each room (0 for none). Pass the previous response's `synced_at` as
+    `since` to get exactly the changes made after it.
+    """
+    rooms: Dict[str, int] = Field(..., min_length=1, max_length=200)
+    since: Optional[datetime] = None
+
+class RoomChanges(BaseModel):
+    room_id: str
+    # Newer than the mark, oldest first
+    messages: List[MessageInDBBase]
+    # At or below the mark and changed since (edits, read flags)
+    updated: List[MessageInDBBase]
+    # Other members' cursors that moved
+    read_cursors: List[ReadCursor]
+    # Too much changed to send at once: reload the room's history
+    has_more: bool
+
+class SyncResponse(BaseModel):
+    rooms: List[RoomChanges]
+    users: List[User]
+    synced_at: datetime
@@ -0,0 +1,42 @@
+from typing import Annotated, Literal, Optional, Union
+from pydantic import BaseModel, Field
+
+class ChatEvent(BaseModel):
+    type: Literal["message"]
+    content: str = Field(..., min_length=1, max_length=1000)
+    recipient_id: Optional[int] = None
+    # The target room on a multiplexed connection (see SubscribeEvent)
+    room_id: Optional[str] = None
+
+class ReadEvent(BaseModel):
+    type: Literal["read"]
+    message_id: int
+    room_id: Optional[str] = None
+
+class TypingEvent(BaseModel):
+    type: Literal["typing"]
+    is_typing: bool
+    room_id: Optional[str] = None
+
+class SubscribeEvent(BaseModel):
+    """
+    Join another room on the same connection. `last_id` replays what was
+    missed, as on connect.
+    """
+    type: Literal["subscribe"]
+    room_id: str = Field(..., min_length=1, max_length=255)
+    last_id: Optional[int] = None
+
+class UnsubscribeEvent(BaseModel):
+    type: Literal["unsubscribe"]
+    room_id: str
+
+class PongEvent(BaseModel):
+    """Answer to the server's `ping`"""
+    type: Literal["pong"]
+
+# A frame sent by a client over the WebSocket, told apart by `type`
+ClientEvent = Annotated[
+    Union[ChatEvent, ReadEvent, TypingEvent, PongEvent, SubscribeEvent, UnsubscribeEvent],
+    Field(discriminator="type"),
+]
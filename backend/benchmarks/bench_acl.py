@@ -0,0 +1,140 @@
+"""
+Room access checks: the warmed in-memory index against one membership
+query per check.
+
+Seeds --rooms rooms, half of them private with --members members each,
+warms the index the way startup does and runs --checks random (user,
+room) checks, mostly by members. Run from the backend directory:
+
+    DATABASE_URL=sqlite:///./bench.db python -m benchmarks.bench_acl --rooms 2000
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from sqlalchemy import delete, insert, select
+
+from app import models
+from app.core.acl import RoomACL
+from app.database import SessionLocal
+from benchmarks.bench_event_loop import ensure_sender
+from benchmarks.check_query_counts import count_queries
+
+PREFIX = "bench-acl-"
+
+
+def seed(db, user_ids, rooms: int, members: int) -> list:
+    """Rooms as (room_id, is_private, member ids)"""
+    db.execute(delete(models.RoomMember).where(models.RoomMember.room_id.like(PREFIX + "%")))
+    db.execute(delete(models.Room).where(models.Room.room_id.like(PREFIX + "%")))
+    seeded = []
+    for i in range(rooms):
+        is_private = i % 2 == 0
+        member_ids = random.sample(user_ids, min(members, len(user_ids))) if is_private else []
+        seeded.append((f"{PREFIX}{i}", is_private, member_ids))
+    db.execute(insert(models.Room), [
+        {"room_id": room_id, "is_private": is_private} for room_id, is_private, _ in seeded
+    ])
+    rows = [
+        {"user_id": user_id, "room_id": room_id, "unread_count": 0}
+        for room_id, _, member_ids in seeded
+        for user_id in member_ids
+    ]
+    if rows:
+        db.execute(insert(models.RoomMember), rows)
+    db.commit()
+    return seeded
+
+
+def ensure_users(db, count: int) -> list:
+    ensure_sender()
+    emails = [f"bench-acl-{i}@example.com" for i in range(count)]
+    existing = set(db.scalars(select(models.User.email).where(models.User.email.in_(emails))))
+    missing = [email for email in emails if email not in existing]
+    if missing:
+        db.execute(insert(models.User), [
+            {"email": email, "hashed_password": "!", "full_name": email.split("@")[0]} for email in missing
+        ])
+        db.commit()
+    return list(db.scalars(select(models.User.id).where(models.User.email.in_(emails))))
+
+
+def sample_checks(seeded: list, user_ids: list, checks: int) -> list:
+    pairs = []
+    for _ in range(checks):
+        room_id, is_private, member_ids = random.choice(seeded)
+        # Nine in ten checks are by a member, as on a healthy server
+        if is_private and random.random() < 0.9:
+            pairs.append((random.choice(member_ids), room_id))
+        else:
+            pairs.append((random.choice(user_ids), room_id))
+    return pairs
+
+
+def query_check(db, user_id: int, room_id: str) -> bool:
+    """What each request would do without the index"""
+    room = db.execute(select(models.Room.is_private).where(models.Room.room_id == room_id)).first()
+    if room is None or not room.is_private:
+        return True
+    return db.execute(
+        select(models.RoomMember.id).where(
+            models.RoomMember.room_id == room_id, models.RoomMember.user_id == user_id
+        )
+    ).first() is not None
+
+
+async def index_checks(pairs: list, rooms: int) -> dict:
+    acl = RoomACL(maxsize=rooms * 10, ttl=3600)
+    started = time.perf_counter()
+    await acl.warm(limit=rooms * 2)
+    warm_s = time.perf_counter() - started
+    with count_queries() as counter:
+        started = time.perf_counter()
+        allowed = [await acl.check(user_id, room_id) for user_id, room_id in pairs]
+        elapsed = time.perf_counter() - started
+    return {
+        "mode": "index",
+        "warm_s": warm_s,
+        "check_us": elapsed / len(pairs) * 1e6,
+        "queries_per_check": counter["statements"] / len(pairs),
+        "allowed": sum(allowed),
+    }
+
+
+def query_checks(db, pairs: list) -> dict:
+    with count_queries() as counter:
+        started = time.perf_counter()
+        allowed = [query_check(db, user_id, room_id) for user_id, room_id in pairs]
+        elapsed = time.perf_counter() - started
+    return {
+        "mode": "query",
+        "check_us": elapsed / len(pairs) * 1e6,
+        "queries_per_check": counter["statements"] / len(pairs),
+        "allowed": sum(allowed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=2000)
+    parser.add_argument("--members", type=int, default=20, help="members per private room")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--checks", type=int, default=20000)
+    args = parser.parse_args()
+    random.seed(args.rooms)
+
+    db = SessionLocal()
+    try:
+        user_ids = ensure_users(db, args.users)
+        seeded = seed(db, user_ids, args.rooms, args.members)
+        pairs = sample_checks(seeded, user_ids, args.checks)
+        results = [query_checks(db, pairs), asyncio.run(index_checks(pairs, args.rooms))]
+    finally:
+        db.close()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Encode cost per recipient of a room broadcast, and decode cost per
+incoming frame, for each wire codec.
+
+`per_recipient` re-encodes the event for every connection, as
+`send_json` does; the codec rows share one Frame across the room. The
+`delivery` section pushes broadcasts through ConnectionManager to fake
+sockets and times each until every socket has written it.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_codec --members 1000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from app import schemas
+from app.core import codec as wire
+from app.core.websocket import ConnectionManager
+from benchmarks.bench_fanout import FakeUser, FakeWebSocket
+
+EVENT = {
+    "type": "message",
+    "id": 1234567,
+    "content": "x" * 200,
+    "recipient_id": None,
+    "sender_id": 42,
+    "created_at": "2024-05-01T12:34:56.789012",
+    "sender_name": "Ada Lovelace",
+    "is_read": False,
+}
+INCOMING = {"type": "message", "content": "x" * 200, "recipient_id": None}
+
+
+def codecs() -> dict:
+    available = {"json_stdlib": wire.JSONCodec(dumps=wire.stdlib_dumps)}
+    if wire.orjson is not None:
+        available["json_orjson"] = wire.JSONCodec()
+    if wire.msgpack is not None:
+        available["msgpack"] = wire.MessagePackCodec()
+    return available
+
+
+def per_recipient_ns(broadcast, members: int, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        broadcast()
+    return (time.perf_counter() - started) / (rounds * members) * 1e9
+
+
+def encode_costs(members: int, rounds: int) -> dict:
+    recipients = range(members)
+
+    def send_json():
+        for _ in recipients:
+            json.dumps(EVENT)
+
+    results = {"per_recipient": {"ns": per_recipient_ns(send_json, members, rounds)}}
+    for name, codec in codecs().items():
+        def shared(codec=codec):
+            frame = wire.Frame(EVENT)
+            for _ in recipients:
+                frame.encode(codec)
+
+        results[name] = {
+            "ns": per_recipient_ns(shared, members, rounds),
+            # The one encode a broadcast pays for, whatever the room size
+            "encode_once_ns": per_recipient_ns(lambda codec=codec: codec.encode(EVENT), 1, rounds * 100),
+            "frame_bytes": len(codec.encode(EVENT)),
+        }
+    if "msgpack" in results:
+        # A room where one client in ten speaks MessagePack
+        mixed = [wire.json_codec if i % 10 else wire.CODECS["chat.msgpack"] for i in recipients]
+
+        def shared_mixed():
+            frame = wire.Frame(EVENT)
+            for codec in mixed:
+                frame.encode(codec)
+
+        results["mixed_json_msgpack"] = {"ns": per_recipient_ns(shared_mixed, members, rounds)}
+    return results
+
+
+def decode_costs(iterations: int) -> dict:
+    text = json.dumps(INCOMING)
+
+    def validate_fully():
+        data = json.loads(text)
+        schemas.MessageCreate(
+            content=data["content"], room_id="room", recipient_id=data.get("recipient_id")
+        )
+
+    cases = {"json_loads_and_model": validate_fully, "json": lambda: wire.json_codec.parse(text)}
+    if wire.msgpack is not None:
+        packed = wire.msgpack.packb(INCOMING)
+        cases["msgpack"] = lambda: wire.CODECS["chat.msgpack"].parse(packed)
+
+    results = {}
+    for name, fn in cases.items():
+        started = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        results[name] = {"ns": (time.perf_counter() - started) / iterations * 1e9}
+    return results
+
+
+async def delivery(members: int, messages: int, codec: wire.Codec) -> dict:
+    manager = ConnectionManager()
+    sockets = [FakeWebSocket() for _ in range(members)]
+    for i, ws in enumerate(sockets):
+        await manager.connect(ws, "bench", FakeUser(i), codec=codec)
+    while any(manager.connections.records[ws].writer.queue for ws in sockets):
+        await asyncio.sleep(0.001)
+    for ws in sockets:
+        ws.received = 0
+
+    started = time.perf_counter()
+    for i in range(messages):
+        await manager.broadcast_message("bench", dict(EVENT, id=i))
+        while any(ws.received <= i for ws in sockets):
+            await asyncio.sleep(0)
+    elapsed = time.perf_counter() - started
+    for ws in sockets:
+        manager.disconnect(ws)
+    return {"broadcast_ms": elapsed / messages * 1000, "per_recipient_us": elapsed / messages / members * 1e6}
+
+
+async def main(args):
+    results = {
+        "members": args.members,
+        "encode_per_recipient": encode_costs(args.members, args.rounds),
+        "decode_per_frame": decode_costs(args.iterations),
+        "delivery": {},
+    }
+    for name, codec in codecs().items():
+        results["delivery"][name] = await delivery(args.members, args.messages, codec)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--members", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=200, help="broadcasts per encode measurement")
+    parser.add_argument("--iterations", type=int, default=100_000, help="frames per decode measurement")
+    parser.add_argument("--messages", type=int, default=50, help="broadcasts per delivery measurement")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,104 @@
+"""
+Event-loop lag while concurrent senders persist messages.
+
+Compares calling the sync CRUD method on the loop (the old WebSocket
+handler) with the awaitable variant that runs on the database executor.
+Run from the backend directory; DATABASE_URL picks the database:
+
+    DATABASE_URL=sqlite:///./bench.db python -m benchmarks.bench_event_loop
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from app import crud, models, schemas
+from app.database import SessionLocal, engine
+
+
+async def monitor_lag(interval: float, samples: list, stop: asyncio.Event):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - started - interval)
+
+
+async def sender(mode: str, sender_id: int, room_id: str, messages: int):
+    for i in range(messages):
+        message_in = schemas.MessageCreate(content=f"message {i}", room_id=room_id)
+        if mode == "sync":
+            db = SessionLocal()
+            try:
+                crud.message.create_with_sender(db, obj_in=message_in, sender_id=sender_id)
+            finally:
+                db.close()
+        else:
+            await crud.message.acreate_with_sender(None, obj_in=message_in, sender_id=sender_id)
+        await asyncio.sleep(0)
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run(mode: str, senders: int, messages: int, sender_id: int) -> dict:
+    samples: list = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_lag(0.005, samples, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        sender(mode, sender_id, f"bench-loop-{i}", messages) for i in range(senders)
+    ))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+    return {
+        "mode": mode,
+        "senders": senders,
+        "messages": senders * messages,
+        "elapsed_s": elapsed,
+        "messages_per_s": senders * messages / elapsed,
+        "loop_lag_p50_ms": percentile(samples, 50) * 1000,
+        "loop_lag_p99_ms": percentile(samples, 99) * 1000,
+        "loop_lag_max_ms": max(samples, default=0.0) * 1000,
+    }
+
+
+def ensure_sender() -> int:
+    models.BaseModel.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        user = crud.user.get_by_email(db, email="bench-loop@example.com")
+        if user is None:
+            user = models.User(
+                email="bench-loop@example.com",
+                hashed_password="!",
+                full_name="Bench Sender",
+            )
+            db.add(user)
+            db.commit()
+            db.refresh(user)
+        return user.id
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--senders", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=25, help="messages per sender")
+    args = parser.parse_args()
+
+    sender_id = ensure_sender()
+    results = [
+        asyncio.run(run(mode, args.senders, args.messages, sender_id))
+        for mode in ("sync", "executor")
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
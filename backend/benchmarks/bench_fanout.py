@@ -0,0 +1,105 @@
+"""
+Fan-out latency benchmark for ConnectionManager.broadcast_message.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_fanout --sizes 10 100 1000 5000
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from app.core.fanout import SlowConsumerPolicy
+from app.core.websocket import ConnectionManager
+
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.full_name = f"user-{user_id}"
+
+
+class FakeWebSocket:
+    """Accepts frames with a small simulated network delay"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.received = 0
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_text(self, data: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.received += 1
+
+    async def send_bytes(self, data: bytes):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.received += 1
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+async def run_room(members: int, messages: int, slow: int, policy: str) -> dict:
+    manager = ConnectionManager(policy=SlowConsumerPolicy(policy))
+    room_id = f"bench-{members}"
+    sockets = []
+    for i in range(members):
+        # A handful of clients are much slower than everyone else
+        delay = 0.05 if i < slow else 0.0
+        ws = FakeWebSocket(delay)
+        sockets.append(ws)
+        await manager.connect(ws, room_id, FakeUser(i))
+    # Let the join notifications drain and measure only the message traffic
+    while any(manager.connections.records[ws].writer.queue for ws in sockets[slow:]):
+        await asyncio.sleep(0.001)
+    manager.stats.discard(room_id)
+    for ws in sockets:
+        ws.received = 0
+
+    payload = {"type": "message", "content": "x" * 200, "sender_id": 1}
+    started = time.perf_counter()
+    enqueue_time = 0.0
+    for seq in range(messages):
+        t0 = time.perf_counter()
+        await manager.broadcast_message(room_id, dict(payload, id=seq + 1))
+        enqueue_time += time.perf_counter() - t0
+        await asyncio.sleep(0)
+
+    # Wait for the fast consumers to drain
+    fast = sockets[slow:]
+    while any(ws.received < messages for ws in fast):
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - started
+
+    stats = manager.get_room_stats(room_id)
+    for ws in sockets:
+        manager.disconnect(ws)
+    stats.update(
+        members=members,
+        elapsed_s=elapsed,
+        broadcast_call_us=enqueue_time / messages * 1e6,
+    )
+    return stats
+
+
+async def main(args):
+    results = []
+    for size in args.sizes:
+        random.seed(size)
+        results.append(await run_room(size, args.messages, args.slow, args.policy))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--slow", type=int, default=3, help="number of slow clients per room")
+    parser.add_argument("--policy", default="drop_oldest", choices=[p.value for p in SlowConsumerPolicy])
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,89 @@
+"""
+Room history paging: OFFSET vs keyset cursors at increasing depth.
+
+Seeds one room with --rows messages (use --rows 10000000 against Postgres
+for the full-size run), then times single pages at several depths.
+Run from the backend directory:
+
+    DATABASE_URL=sqlite:///./bench.db python -m benchmarks.bench_history --rows 200000
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+
+from app import crud, models
+from app.database import SessionLocal, engine
+from benchmarks.bench_event_loop import ensure_sender
+
+ROOM_ID = "bench-history"
+
+
+def seed(db, sender_id: int, rows: int, chunk: int = 50000) -> None:
+    existing = db.scalar(
+        select(func.count()).select_from(models.Message).where(models.Message.room_id == ROOM_ID)
+    )
+    start = datetime(2024, 1, 1)
+    for offset in range(existing, rows, chunk):
+        batch = [
+            {
+                "content": f"message {i}",
+                "sender_id": sender_id,
+                "room_id": ROOM_ID,
+                "is_read": False,
+                "created_at": start + timedelta(seconds=i),
+                "updated_at": start + timedelta(seconds=i),
+            }
+            for i in range(offset, min(rows, offset + chunk))
+        ]
+        db.execute(insert(models.Message), batch)
+        db.commit()
+
+
+def timed(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--depths", type=int, nargs="+", default=[0, 1000, 10000, 100000])
+    args = parser.parse_args()
+
+    sender_id = ensure_sender()
+    db = SessionLocal()
+    try:
+        seed(db, sender_id, args.rows)
+        results = []
+        for depth in args.depths:
+            if depth >= args.rows:
+                continue
+            # Anchor for the keyset page is the message just above this depth
+            anchor = crud.message.get_multi_by_room(db, room_id=ROOM_ID, skip=max(depth - 1, 0), limit=1)[0]
+            cursor = crud.message.encode_cursor(anchor)
+            offset_s = timed(lambda: crud.message.get_multi_by_room(
+                db, room_id=ROOM_ID, skip=depth, limit=args.limit
+            ))
+            keyset_s = timed(lambda: crud.message.get_page_by_room(
+                db, room_id=ROOM_ID, before=cursor if depth else None, limit=args.limit
+            ))
+            results.append({
+                "depth": depth,
+                "offset_ms": offset_s * 1000,
+                "keyset_ms": keyset_s * 1000,
+            })
+        print(json.dumps({"rows": args.rows, "dialect": engine.dialect.name, "pages": results}, indent=2))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
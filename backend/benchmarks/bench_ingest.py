@@ -0,0 +1,73 @@
+"""
+Sustained message ingest: per-row create_with_sender vs the batched
+write-behind pipeline. Run from the backend directory:
+
+    DATABASE_URL=sqlite:///./bench.db python -m benchmarks.bench_ingest --senders 50
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from app import crud, schemas
+from app.core.pipeline import MessagePipeline
+from benchmarks.bench_event_loop import ensure_sender
+
+
+async def per_row(message_in, sender_id, pipeline):
+    await crud.message.acreate_with_sender(None, obj_in=message_in, sender_id=sender_id)
+
+
+async def batched(message_in, sender_id, pipeline):
+    await pipeline.submit(obj_in=message_in, sender_id=sender_id)
+
+
+async def sender(save, index, messages, sender_id, pipeline, latencies):
+    for i in range(messages):
+        message_in = schemas.MessageCreate(content=f"message {i}", room_id=f"bench-ingest-{index}")
+        started = time.perf_counter()
+        await save(message_in, sender_id, pipeline)
+        latencies.append(time.perf_counter() - started)
+
+
+async def run(mode, senders, messages, sender_id, batch_size, linger_ms) -> dict:
+    pipeline = MessagePipeline(batch_size=batch_size, linger_ms=linger_ms)
+    await pipeline.start()
+    save = batched if mode == "pipeline" else per_row
+    latencies: list = []
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        sender(save, i, messages, sender_id, pipeline, latencies) for i in range(senders)
+    ))
+    elapsed = time.perf_counter() - started
+    await pipeline.stop()
+    latencies.sort()
+    return {
+        "mode": mode,
+        "messages": senders * messages,
+        "elapsed_s": elapsed,
+        "messages_per_s": senders * messages / elapsed,
+        "ack_p50_ms": latencies[len(latencies) // 2] * 1000,
+        "ack_p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+        "batches": pipeline.batches_flushed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--senders", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=40, help="messages per sender")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--linger-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    sender_id = ensure_sender()
+    results = [
+        asyncio.run(run(mode, args.senders, args.messages, sender_id, args.batch_size, args.linger_ms))
+        for mode in ("per_row", "pipeline")
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
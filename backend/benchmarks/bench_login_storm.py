@@ -0,0 +1,115 @@
+"""
+Message-read latency during a login storm.
+
+Storms the pooled /auth/login (or, with --legacy, the old inline bcrypt
+path on FastAPI's shared threadpool) while a reader times GET /messages/.
+Runs in-process over ASGI. From the backend directory:
+
+    BCRYPT_ROUNDS=10 DATABASE_URL=sqlite:///./bench.db python -m benchmarks.bench_login_storm
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+from fastapi import Depends
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.orm import Session
+
+from app import crud, models, schemas
+from app.core import security
+from app.database import SessionLocal, engine, get_db
+from app.main import app
+
+EMAIL = "bench-login@example.com"
+PASSWORD = "bench-password"
+ROOM_ID = "bench-login-room"
+
+
+@app.post("/bench/legacy-login")
+def legacy_login(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
+    """The pre-pool login path: bcrypt inline on the shared threadpool"""
+    user = crud.user.authenticate(db, email=form_data.username, password=form_data.password)
+    return {"ok": user is not None}
+
+
+def setup() -> None:
+    models.BaseModel.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        user = crud.user.get_by_email(db, email=EMAIL)
+        if user is None:
+            user = crud.user.create(
+                db, obj_in=schemas.UserCreate(email=EMAIL, full_name="Bench Login", password=PASSWORD)
+            )
+        if not crud.message.get_multi_by_room(db, room_id=ROOM_ID, limit=1):
+            for i in range(50):
+                crud.message.create_with_sender(
+                    db, obj_in=schemas.MessageCreate(content=f"message {i}", room_id=ROOM_ID), sender_id=user.id
+                )
+    finally:
+        db.close()
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def reader(client, headers, duration: float) -> list:
+    latencies = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = await client.get("/api/v1/messages/", params={"room_id": ROOM_ID}, headers=headers)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+async def login_loop(client, path: str, stop: asyncio.Event, counts: dict):
+    while not stop.is_set():
+        response = await client.post(path, data={"username": EMAIL, "password": PASSWORD})
+        counts[response.status_code] = counts.get(response.status_code, 0) + 1
+        if response.status_code == 503:
+            # Well-behaved clients honour Retry-After instead of hammering
+            await asyncio.sleep(float(response.headers.get("Retry-After", 1)))
+
+
+async def main(args):
+    setup()
+    token = security.create_access_token({"sub": str(crud.user.get_by_email(SessionLocal(), email=EMAIL).id)})
+    headers = {"Authorization": f"Bearer {token}"}
+    path = "/bench/legacy-login" if args.legacy else "/api/v1/auth/login"
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        baseline = await reader(client, headers, args.duration)
+
+        stop = asyncio.Event()
+        counts: dict = {}
+        storm = [asyncio.create_task(login_loop(client, path, stop, counts)) for _ in range(args.logins)]
+        await asyncio.sleep(0.2)
+        during = await reader(client, headers, args.duration)
+        stop.set()
+        await asyncio.gather(*storm)
+
+    print(json.dumps({
+        "login_path": path,
+        "concurrent_logins": args.logins,
+        "bcrypt_rounds": security.settings.BCRYPT_ROUNDS,
+        "login_status_counts": {str(k): v for k, v in sorted(counts.items())},
+        "read_p50_ms": {"baseline": percentile(baseline, 50) * 1000, "storm": percentile(during, 50) * 1000},
+        "read_p99_ms": {"baseline": percentile(baseline, 99) * 1000, "storm": percentile(during, 99) * 1000},
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=100, help="concurrent login clients")
+    parser.add_argument("--duration", type=float, default=3.0, help="seconds per phase")
+    parser.add_argument("--legacy", action="store_true", help="storm the old inline-bcrypt login path")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,87 @@
+"""
+First-page room history: database read and serialization vs the
+recent-message cache.
+
+Seeds the history benchmark room, then times the work behind one
+`GET /messages/?room_id=...` first page both ways, and the hit ratio of a
+read/write mix over --rooms rooms with Zipf-like popularity. Run from the
+backend directory:
+
+    DATABASE_URL=sqlite:///./bench.db python -m benchmarks.bench_message_cache
+"""
+import argparse
+import json
+import random
+from typing import List
+
+from pydantic import TypeAdapter
+
+from app import crud, schemas
+from app.core.message_cache import MemoryRecentMessages, serialize
+from app.database import SessionLocal, engine
+from benchmarks.bench_event_loop import ensure_sender
+from benchmarks.bench_history import ROOM_ID, seed, timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--rooms", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=100000)
+    parser.add_argument("--write-ratio", type=float, default=0.1)
+    parser.add_argument("--max-bytes", type=int, default=8 * 1024 * 1024)
+    args = parser.parse_args()
+
+    sender_id = ensure_sender()
+    db = SessionLocal()
+    try:
+        seed(db, sender_id, args.rows)
+        page = TypeAdapter(List[schemas.Message])
+
+        def from_database():
+            messages = crud.message.get_page_by_room(db, room_id=ROOM_ID, limit=args.limit)
+            return page.dump_json(messages)
+
+        cache = MemoryRecentMessages(size=args.limit)
+        token = cache.begin_fill(ROOM_ID)
+        entries = [serialize(m) for m in crud.message.get_page_by_room(db, room_id=ROOM_ID, limit=args.limit)]
+        cache.fill(ROOM_ID, token, entries, complete=False)
+
+        def from_cache():
+            return b"[" + b",".join(entry.body for entry in cache.get(ROOM_ID, args.limit)) + b"]"
+
+        database_s = timed(from_database, repeat=20)
+        cache_s = timed(from_cache, repeat=20)
+        entry = entries[0]
+    finally:
+        db.close()
+
+    # Hit ratio under a byte budget, with reads filling misses and writes
+    # pushing onto (or invalidating) rooms
+    rng = random.Random(0)
+    mix = MemoryRecentMessages(size=args.limit, max_bytes=args.max_bytes)
+    next_id = 1
+    for _ in range(args.requests):
+        room_id = f"room-{min(args.rooms - 1, int(rng.paretovariate(1.2)) - 1)}"
+        if rng.random() < args.write_ratio:
+            next_id += 1
+            if mix.holds(room_id):
+                mix.push(room_id, [entry._replace(id=next_id)])
+            else:
+                mix.invalidate([room_id])
+        elif mix.get(room_id, args.limit) is None:
+            token = mix.begin_fill(room_id)
+            mix.fill(room_id, token, [entry] * args.limit, complete=False)
+
+    print(json.dumps({
+        "rows": args.rows,
+        "dialect": engine.dialect.name,
+        "first_page_database_ms": database_s * 1000,
+        "first_page_cache_ms": cache_s * 1000,
+        "mix": mix.stats(),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
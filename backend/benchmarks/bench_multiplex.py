@@ -0,0 +1,87 @@
+"""
+Cost of a user with many conversations open: one WebSocket per room, next
+to one multiplexed WebSocket subscribed to all of them.
+
+Counts what this process allocates per user (writers, their tasks and the
+registry's bookkeeping) and how many connections, and so authentications,
+it takes. Each authentication is a token decode plus a user lookup that
+misses the auth cache after a restart.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_multiplex --users 200 --rooms 30
+"""
+import argparse
+import asyncio
+import gc
+import json
+import time
+import tracemalloc
+
+from app.core.websocket import ConnectionManager
+from benchmarks.bench_fanout import FakeUser, FakeWebSocket
+
+
+async def open_user(manager: ConnectionManager, user: FakeUser, rooms: list, layout: str) -> int:
+    """Open a user's rooms; returns the connections it took"""
+    if layout == "per_room":
+        for room_id in rooms:
+            await manager.connect(FakeWebSocket(), room_id, user)
+        return len(rooms)
+    websocket = FakeWebSocket()
+    await manager.connect(websocket, None, user)
+    for room_id in rooms:
+        await manager.join(websocket, room_id, user)
+    return 1
+
+
+async def run(layout: str, users: int, room_count: int) -> dict:
+    manager = ConnectionManager(max_rooms=room_count)
+    manager.join_leave.announce = _ignore
+    rooms = [f"room-{i}" for i in range(room_count)]
+    connections = 0
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    started = time.perf_counter()
+    for i in range(users):
+        connections += await open_user(manager, FakeUser(i), rooms, layout)
+    elapsed = time.perf_counter() - started
+    # Let the writer tasks settle into their idle wait
+    for _ in range(3):
+        await asyncio.sleep(0)
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+
+    for connection in list(manager.connections.records):
+        manager.disconnect(connection, announce=False)
+    return {
+        "layout": layout,
+        "users": users,
+        "rooms_per_user": room_count,
+        "connections_per_user": connections / users,
+        "bytes_per_user": allocated / users,
+        "open_ms_per_user": elapsed / users * 1000,
+    }
+
+
+async def _ignore(*args):
+    pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multiplexed WebSocket cost")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--rooms", type=int, default=30, help="rooms each user has open")
+    args = parser.parse_args()
+    results = [
+        asyncio.run(run(layout, args.users, args.rooms)) for layout in ("per_room", "multiplexed")
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
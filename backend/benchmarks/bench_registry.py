@@ -0,0 +1,124 @@
+"""
+Memory per idle connection in the ConnectionManager's bookkeeping, and
+the cost of dropping a connection.
+
+Registers --connections connections over --rooms rooms, one user each,
+into the ConnectionRegistry and into the parallel dicts it replaced (room
+-> connections, connection -> user, user -> connections, connection ->
+writer, connection -> last activity). Sockets, writers and users exist
+before measuring starts, so only the bookkeeping is counted.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_registry --connections 100000 --rooms 1000
+"""
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+from app.core.registry import ConnectionRegistry
+from benchmarks.bench_fanout import FakeUser
+
+
+class FakeWriter:
+    def close(self):
+        pass
+
+
+def build_dicts(sockets, users, rooms, writer) -> dict:
+    """The layout before the registry"""
+    state = {"active": {}, "users": {}, "by_user": {}, "writers": {}, "activity": {}}
+    for i, (socket, user) in enumerate(zip(sockets, users)):
+        state["active"].setdefault(rooms[i % len(rooms)], set()).add(socket)
+        state["users"][socket] = user
+        state["by_user"].setdefault(user.id, set()).add(socket)
+        state["writers"][socket] = writer
+        state["activity"][socket] = time.monotonic()
+    return state
+
+
+def drop_dicts(state: dict, socket) -> None:
+    # What _drop_connection did: visit every room, then the user maps
+    for room_id in list(state["active"].keys()):
+        members = state["active"][room_id]
+        members.discard(socket)
+        if not members:
+            del state["active"][room_id]
+    state["writers"].pop(socket).close()
+    state["activity"].pop(socket, None)
+    user = state["users"].pop(socket)
+    connections = state["by_user"][user.id]
+    connections.discard(socket)
+    if not connections:
+        del state["by_user"][user.id]
+
+
+def build_registry(sockets, users, rooms, writer) -> ConnectionRegistry:
+    registry = ConnectionRegistry()
+    for i, (socket, user) in enumerate(zip(sockets, users)):
+        record, _ = registry.add(socket, writer, user)
+        registry.join(record, rooms[i % len(rooms)])
+    return registry
+
+
+def drop_registry(registry: ConnectionRegistry, socket) -> None:
+    record = registry.get(socket)
+    for room_id in record.rooms:
+        registry.leave(record, room_id)
+    record.writer.close()
+    registry.remove(record)
+
+
+def measure(layout: str, connections: int, room_count: int, drops: int) -> dict:
+    sockets = [object() for _ in range(connections)]
+    users = [FakeUser(i) for i in range(connections)]
+    rooms = [f"room-{i}" for i in range(room_count)]
+    writer = FakeWriter()
+    build, drop = (build_dicts, drop_dicts) if layout == "dicts" else (build_registry, drop_registry)
+
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    state = build(sockets, users, rooms, writer)
+    gc.collect()
+    allocated = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    # Timed on an untraced copy: the first operations after tracing stops
+    # are skewed. Collections are kept out of the timing too.
+    del state
+    state = build(sockets, users, rooms, writer)
+    gc.collect()
+    gc.disable()
+    try:
+        started = time.perf_counter()
+        for socket in sockets[:drops]:
+            drop(state, socket)
+        elapsed = time.perf_counter() - started
+    finally:
+        gc.enable()
+    return {
+        "layout": layout,
+        "connections": connections,
+        "rooms": room_count,
+        "bytes_per_connection": allocated / connections,
+        "drop_us": elapsed / drops * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Connection bookkeeping cost")
+    parser.add_argument("--connections", type=int, default=100000)
+    parser.add_argument("--rooms", type=int, default=1000)
+    parser.add_argument("--drops", type=int, default=1000, help="connections dropped to time cleanup")
+    args = parser.parse_args()
+    results = [
+        measure(layout, args.connections, args.rooms, args.drops) for layout in ("dicts", "registry")
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Message search: ILIKE scan vs the full-text index.
+
+Seeds --rows messages of random words spread over --rooms rooms, makes
+the searching user a member of all of them, then times one page of
+results for rare, medium and common terms. Use --rows 5000000 against
+Postgres for the multi-million-row run. Run from the backend directory:
+
+    DATABASE_URL=sqlite:///./bench.db python -m benchmarks.bench_search --rows 500000
+"""
+import argparse
+import json
+import random
+import time
+
+from sqlalchemy import func, insert, select
+
+from app import crud, models
+from app.database import SessionLocal
+from benchmarks.bench_event_loop import ensure_sender
+from benchmarks.bench_history import timed
+
+ROOM_PREFIX = "bench-search-"
+VOCABULARY = 20000
+
+
+def word(rank: int) -> str:
+    return f"w{rank}"
+
+
+def zipf_word(rng: random.Random) -> str:
+    # Roughly Zipfian, so a few words are common and most are rare
+    return word(min(VOCABULARY - 1, int(rng.paretovariate(1.1)) - 1))
+
+
+def seed(db, sender_id: int, rows: int, rooms: int, chunk: int = 20000) -> None:
+    existing = db.scalar(
+        select(func.count())
+        .select_from(models.Message)
+        .where(models.Message.room_id.like(ROOM_PREFIX + "%"))
+    )
+    rng = random.Random(existing)
+    for offset in range(existing, rows, chunk):
+        batch = [
+            {
+                "content": " ".join(zipf_word(rng) for _ in range(rng.randint(3, 20))),
+                "sender_id": sender_id,
+                "room_id": f"{ROOM_PREFIX}{i % rooms}",
+                "is_read": False,
+            }
+            for i in range(offset, min(rows, offset + chunk))
+        ]
+        db.execute(insert(models.Message), batch)
+        db.commit()
+
+    member_rooms = {
+        room_id for (room_id,) in db.query(models.RoomMember.room_id).filter(
+            models.RoomMember.user_id == sender_id,
+            models.RoomMember.room_id.like(ROOM_PREFIX + "%"),
+        )
+    }
+    missing = [
+        {"user_id": sender_id, "room_id": f"{ROOM_PREFIX}{i}", "unread_count": 0}
+        for i in range(rooms)
+        if f"{ROOM_PREFIX}{i}" not in member_rooms
+    ]
+    if missing:
+        db.execute(insert(models.RoomMember), missing)
+        db.commit()
+
+
+def ilike_search(db, user_id: int, term: str, limit: int):
+    rooms = select(models.RoomMember.room_id).where(models.RoomMember.user_id == user_id)
+    return (
+        db.query(models.Message)
+        .filter(models.Message.content.ilike(f"%{term}%"), models.Message.room_id.in_(rooms))
+        .order_by(models.Message.id.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--rooms", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    sender_id = ensure_sender()
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        seed(db, sender_id, args.rows, args.rooms)
+        seed_s = time.perf_counter() - started
+
+        results = []
+        for label, term in (("common", word(0)), ("medium", word(50)), ("rare", word(5000))):
+            # Trailing space keeps "w5" from matching "w50" in the ILIKE scan
+            ilike_s = timed(lambda: ilike_search(db, sender_id, term + " ", args.limit))
+            hits = crud.message.search(db, user_id=sender_id, query=term, limit=args.limit)
+            search_s = timed(lambda: crud.message.search(db, user_id=sender_id, query=term, limit=args.limit))
+            next_s = None
+            if len(hits) == args.limit:
+                message, rank = hits[-1]
+                cursor = crud.message.encode_search_cursor(rank, message.id)
+                next_s = timed(lambda: crud.message.search(
+                    db, user_id=sender_id, query=term, cursor=cursor, limit=args.limit
+                ))
+            results.append({
+                "term": label,
+                "ilike_ms": ilike_s * 1000,
+                "fulltext_ms": search_s * 1000,
+                "fulltext_next_page_ms": next_s * 1000 if next_s is not None else None,
+                "hits": len(hits),
+            })
+    finally:
+        db.close()
+
+    print(json.dumps({"rows": args.rows, "seed_s": seed_s, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Memory per idle subscriber and fan-out time for SSE streams, next to
+WebSockets.
+
+Each subscriber joins one room and waits as it would in production: a
+WebSocket's writer task, or an SSE handler blocked in StreamQueue.wait().
+Only what this process allocates is counted; the server's per-connection
+HTTP state comes on top.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_streams --subscribers 2000
+"""
+import argparse
+import asyncio
+import gc
+import json
+import time
+import tracemalloc
+
+from app.core import codec
+from app.core.fanout import StreamQueue
+from app.core.websocket import ConnectionManager
+from benchmarks.bench_fanout import FakeUser, FakeWebSocket
+
+
+async def consume(stream: StreamQueue, received: list):
+    """What the SSE response generator does between writes"""
+    while True:
+        frames = await stream.wait(3600)
+        if frames is None:
+            return
+        received.extend(frame.encode(codec.sse_codec) for frame in frames)
+
+
+async def run(transport: str, subscribers: int) -> dict:
+    manager = ConnectionManager()
+    manager.join_leave.grace = 0
+    room_id = f"bench-{transport}"
+    received: list = []
+    consumers = []
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for i in range(subscribers):
+        user = FakeUser(i)
+        if transport == "websocket":
+            await manager.connect(FakeWebSocket(), room_id, user)
+        else:
+            stream = StreamQueue(max_queue=manager.max_queue, policy=manager.policy)
+            await manager.subscribe(stream, room_id, user, announce=False)
+            consumers.append(asyncio.create_task(consume(stream, received)))
+    # Let writers and consumers settle into their idle wait
+    for _ in range(3):
+        await asyncio.sleep(0)
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+
+    encodes = 0
+    original = codec.EventStreamCodec.encode
+
+    def counting_encode(self, event):
+        nonlocal encodes
+        encodes += 1
+        return original(self, event)
+
+    codec.EventStreamCodec.encode = counting_encode
+    try:
+        received.clear()
+        started = time.perf_counter()
+        await manager.broadcast_message(room_id, {"type": "message", "id": 1, "content": "x" * 200})
+        # SSE: until every consumer holds the frame; WebSockets: until it is queued
+        while transport == "sse" and len(received) < subscribers:
+            await asyncio.sleep(0.001)
+        elapsed = time.perf_counter() - started
+    finally:
+        codec.EventStreamCodec.encode = original
+
+    for task in consumers:
+        task.cancel()
+    return {
+        "transport": transport,
+        "subscribers": subscribers,
+        "bytes_per_idle_subscriber": allocated / subscribers,
+        "broadcast_ms": elapsed * 1000,
+        "sse_encodes_per_broadcast": encodes if transport == "sse" else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SSE subscriber cost")
+    parser.add_argument("--subscribers", type=int, default=2000)
+    args = parser.parse_args()
+    results = [
+        asyncio.run(run(transport, args.subscribers)) for transport in ("websocket", "sse")
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
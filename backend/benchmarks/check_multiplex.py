@@ -0,0 +1,66 @@
+"""
+Endpoint guard for the multiplexed WebSocket.
+
+Opens GET /ws and subscribes to more rooms in one burst than the
+connection's inbound rate limit allows frames (WS_INBOUND_BURST), the way a
+client restoring a user's open conversations does. Fails (exit status 1)
+unless every subscribe is acknowledged. Run from the backend directory:
+
+    DATABASE_URL=sqlite:///./bench.db python -m benchmarks.check_multiplex
+"""
+import json
+import sys
+import time
+
+from fastapi.testclient import TestClient
+
+from app import models
+from app.core import security
+from app.core.config import settings
+from app.database import SessionLocal, engine
+from app.main import app
+
+EMAIL = "multiplex-check@example.com"
+PREFIX = "multiplex-check-"
+
+
+def ensure_user() -> int:
+    db = SessionLocal()
+    try:
+        user = db.query(models.User).filter(models.User.email == EMAIL).first()
+        if user is None:
+            user = models.User(email=EMAIL, hashed_password="!", full_name="Multiplex Check")
+            db.add(user)
+            db.commit()
+        return user.id
+    finally:
+        db.close()
+
+
+def main() -> int:
+    models.BaseModel.metadata.create_all(bind=engine)
+    token = security.create_access_token({"sub": str(ensure_user())})
+    rooms = min(settings.WS_INBOUND_BURST + 10, settings.WS_MAX_ROOMS_PER_CONNECTION)
+    # Without the lifespan, so an unmigrated database is fine
+    client = TestClient(app)
+    with client.websocket_connect(f"{settings.API_V1_STR}/messages/ws?token={token}") as websocket:
+        for i in range(rooms):
+            websocket.send_text(json.dumps({"type": "subscribe", "room_id": f"{PREFIX}{i}"}))
+        # Once the limiter has refilled, leaving a room never joined is
+        # acknowledged too, and marks the end of the answers to the burst
+        if settings.WS_INBOUND_RATE > 0:
+            time.sleep(settings.WS_INBOUND_BURST / settings.WS_INBOUND_RATE)
+        websocket.send_text(json.dumps({"type": "unsubscribe", "room_id": f"{PREFIX}end"}))
+        answers: dict = {}
+        while True:
+            event = websocket.receive_json()
+            if event["type"] == "unsubscribed" and event["room_id"] == f"{PREFIX}end":
+                break
+            answers[event["type"]] = answers.get(event["type"], 0) + 1
+    ok = answers.get("subscribed", 0) == rooms
+    print(f"subscribe burst: {rooms} sent, answers {answers} {'ok' if ok else 'FAIL'}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
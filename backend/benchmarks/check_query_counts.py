@@ -0,0 +1,136 @@
+"""
+Query-count guard for message history serialization.
+
+Loads a 50-message page written by 10 different users and serializes it
+the way the endpoints do, failing (exit status 1) if the number of SQL
+statements grows with the page size. Also posts a message through POST
+/messages/ and fails if any statement runs on the event loop rather than
+the database executor. Run from the backend directory:
+
+    DATABASE_URL=sqlite:///./bench.db python -m benchmarks.check_query_counts
+"""
+import asyncio
+import sys
+from contextlib import contextmanager
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app import crud, models, schemas
+from app.core import security
+from app.core.config import settings
+from app.database import SessionLocal, engine
+
+ROOM_ID = "query-count-check"
+PAGE_SIZE = 50
+
+# Statements allowed per serialized page
+BUDGETS = {
+    "full_page": 3,     # messages + senders + recipients
+    "compact_page": 2,  # messages + users
+    "create_on_event_loop": 0,  # all of POST /messages/ runs on the executor
+}
+
+
+@contextmanager
+def count_queries(event_loop_only: bool = False):
+    counter = {"statements": 0}
+
+    def before_cursor_execute(*args):
+        if event_loop_only:
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                return
+        counter["statements"] += 1
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def seed(db) -> None:
+    if crud.message.get_multi_by_room(db, room_id=ROOM_ID, limit=1):
+        return
+    users = []
+    for i in range(10):
+        email = f"query-check-{i}@example.com"
+        user = crud.user.get_by_email(db, email=email)
+        if user is None:
+            user = models.User(email=email, hashed_password="!", full_name=f"Query Check {i}")
+            db.add(user)
+            db.flush()
+        users.append(user)
+    for i in range(PAGE_SIZE):
+        db.add(models.Message(
+            content=f"message {i}",
+            room_id=ROOM_ID,
+            sender_id=users[i % 10].id,
+            recipient_id=users[(i + 1) % 10].id,
+            is_read=False,
+        ))
+    db.commit()
+
+
+def check(name: str, load) -> bool:
+    db = SessionLocal()
+    try:
+        with count_queries() as counter:
+            load(db)
+    finally:
+        db.close()
+    ok = counter["statements"] <= BUDGETS[name]
+    print(f"{name}: {counter['statements']} statements (budget {BUDGETS[name]}) {'ok' if ok else 'FAIL'}")
+    return ok
+
+
+def full_page(db):
+    for message in crud.message.get_page_by_room(db, room_id=ROOM_ID, limit=PAGE_SIZE):
+        schemas.Message.model_validate(message)
+
+
+def compact_page(db):
+    messages, users = crud.message.get_compact_page_by_room(db, room_id=ROOM_ID, limit=PAGE_SIZE)
+    schemas.MessagePage.model_validate({"messages": messages, "users": users})
+
+
+def check_create() -> bool:
+    """POST /messages/, counting only statements run on the event loop thread"""
+    from app.main import app
+
+    db = SessionLocal()
+    try:
+        sender = crud.user.get_by_email(db, email="query-check-0@example.com")
+    finally:
+        db.close()
+    token = security.create_access_token({"sub": str(sender.id)})
+    # Without the lifespan, so an unmigrated database is fine
+    client = TestClient(app)
+    with count_queries(event_loop_only=True) as counter:
+        response = client.post(
+            f"{settings.API_V1_STR}/messages/",
+            json={"content": "query check", "room_id": ROOM_ID},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+    response.raise_for_status()
+    name = "create_on_event_loop"
+    ok = counter["statements"] <= BUDGETS[name]
+    print(f"{name}: {counter['statements']} statements (budget {BUDGETS[name]}) {'ok' if ok else 'FAIL'}")
+    return ok
+
+
+def main() -> int:
+    models.BaseModel.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        seed(db)
+    finally:
+        db.close()
+    results = [check("full_page", full_page), check("compact_page", compact_page), check_create()]
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
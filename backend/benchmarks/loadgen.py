@@ -0,0 +1,426 @@
+"""
+End-to-end load generator for the chat backend.
+
+`run` starts the app under uvicorn in this process (SQLite by default, or
+any DATABASE_URL such as a local Postgres) or targets a running server
+with --url, then:
+
+  1. registers and logs in --users users through /api/v1/auth,
+  2. creates --rooms public rooms and joins the users to them round-robin
+     over the room WebSocket,
+  3. has every user send messages at --rate per second for --duration
+     seconds, timing delivery to every member of the room,
+  4. pages --history-pages pages of history per user.
+
+It prints one JSON document: per-phase throughput, p50/p95/p99 latency,
+database query counts (from /metrics) and, in-process, event-loop lag.
+`compare` diffs two such documents and exits 1 on a regression:
+
+    python -m benchmarks.loadgen run --users 50 --rooms 5 --output base.json
+    python -m benchmarks.loadgen run --users 50 --rooms 5 --output new.json
+    python -m benchmarks.loadgen compare base.json new.json --threshold 0.1
+
+Keep --rate under WS_INBOUND_RATE: the server refuses the excess, counted
+as delivery errors.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+import httpx
+import websockets
+
+# bench_event_loop imports the app, which reads its settings on import;
+# main() sets the in-process defaults first, so helpers come from it lazily
+MARKER = "lg:"
+
+
+def summarize(samples: List[float], elapsed: float, errors: int = 0) -> dict:
+    """Throughput and latency percentiles (ms) of one phase"""
+    from benchmarks.bench_event_loop import percentile
+
+    return {
+        "count": len(samples),
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "throughput_per_s": len(samples) / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "p50": percentile(samples, 50) * 1000,
+            "p95": percentile(samples, 95) * 1000,
+            "p99": percentile(samples, 99) * 1000,
+        },
+    }
+
+
+def lag_summary(samples: List[float]) -> Optional[dict]:
+    from benchmarks.bench_event_loop import percentile
+
+    if not samples:
+        return None
+    return {
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "max_ms": max(samples) * 1000,
+    }
+
+
+class LocalServer:
+    """The app under uvicorn on a background thread, with a lag probe on its loop"""
+
+    def __init__(self):
+        import uvicorn
+        from alembic import command
+        from alembic.config import Config
+
+        # Bring the schema to head the way a deploy would
+        command.upgrade(Config("alembic.ini"), "head")
+        from app.main import app
+
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            self.port = probe.getsockname()[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.server = uvicorn.Server(
+            uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning", ws="websockets")
+        )
+        self.lag: List[float] = []
+        self._thread = threading.Thread(target=asyncio.run, args=(self._serve(),), daemon=True)
+
+    async def _serve(self):
+        from benchmarks.bench_event_loop import monitor_lag
+
+        stop = asyncio.Event()
+        monitor = asyncio.create_task(monitor_lag(0.01, self.lag, stop))
+        await self.server.serve()
+        stop.set()
+        await monitor
+
+    def start(self):
+        self._thread.start()
+        while not self.server.started:
+            if not self._thread.is_alive():
+                raise RuntimeError("server failed to start")
+            time.sleep(0.01)
+
+    def stop(self):
+        self.server.should_exit = True
+        self._thread.join()
+
+
+class Phase:
+    """Brackets a phase with /metrics scrapes and event-loop lag samples"""
+
+    def __init__(self, http: httpx.AsyncClient, server: Optional[LocalServer]):
+        self.http = http
+        self.server = server
+
+    async def __aenter__(self):
+        self.queries = await db_queries(self.http)
+        self.lag_from = len(self.server.lag) if self.server else 0
+        self.started = time.perf_counter()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
+        after = await db_queries(self.http)
+        self.db_queries = after - self.queries if after is not None and self.queries is not None else None
+        self.lag = lag_summary(self.server.lag[self.lag_from:]) if self.server else None
+
+    def report(self, result: dict) -> dict:
+        result["db_queries"] = self.db_queries
+        result["event_loop_lag"] = self.lag
+        return result
+
+
+async def db_queries(http: httpx.AsyncClient) -> Optional[float]:
+    response = await http.get("/metrics")
+    if response.status_code != 200:
+        return None
+    for line in response.text.splitlines():
+        if line.startswith("chat_db_query_duration_seconds_count"):
+            return float(line.split()[-1])
+    return None
+
+
+async def register_and_login(http: httpx.AsyncClient, args, phase_results: dict, server) -> List[str]:
+    run_id = random.randrange(1 << 30)
+    limit = asyncio.Semaphore(args.concurrency)
+    emails = [f"load-{run_id}-{i}@example.com" for i in range(args.users)]
+
+    async def timed(fn, samples: list, errors: list):
+        async with limit:
+            started = time.perf_counter()
+            try:
+                response = await fn()
+                response.raise_for_status()
+            except Exception:
+                errors.append(1)
+                return None
+            samples.append(time.perf_counter() - started)
+            return response
+
+    for name, call in (
+        ("register", lambda email: http.post("/api/v1/auth/register", json={
+            "email": email, "full_name": email.split("@")[0], "password": "load-password",
+        })),
+        ("login", lambda email: http.post("/api/v1/auth/login", data={
+            "username": email, "password": "load-password",
+        })),
+    ):
+        samples: list = []
+        errors: list = []
+        async with Phase(http, server) as phase:
+            responses = await asyncio.gather(*(
+                timed(lambda email=email: call(email), samples, errors) for email in emails
+            ))
+        phase_results[name] = phase.report(summarize(samples, phase.elapsed, len(errors)))
+    return [r.json()["access_token"] if r is not None else None for r in responses]
+
+
+class Client:
+    """One user's room connection: sends at a rate and times what arrives"""
+
+    def __init__(self, index: int, token: str, room_id: str, ws_url: str):
+        self.index = index
+        self.token = token
+        self.room_id = room_id
+        self.url = f"{ws_url}/api/v1/messages/ws/{room_id}?token={token}"
+        self.latencies: List[float] = []
+        self.sent = 0
+        # Messages the server refused over its inbound rate limit
+        self.refused = 0
+        self.ws = None
+
+    async def connect(self):
+        self.ws = await websockets.connect(self.url, max_queue=None)
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        try:
+            async for raw in self.ws:
+                event = json.loads(raw)
+                kind = event.get("type")
+                if kind == "message" and event.get("content", "").startswith(MARKER):
+                    sent_at = float(event["content"][len(MARKER):].split(":", 1)[0])
+                    self.latencies.append(time.perf_counter() - sent_at)
+                elif kind == "error" and event.get("reason") == "rate_limited":
+                    self.refused += 1
+                elif kind == "ping":
+                    await self.ws.send('{"type":"pong"}')
+        except websockets.ConnectionClosed:
+            pass
+
+    async def send_for(self, rate: float, duration: float):
+        deadline = time.perf_counter() + duration
+        # Stagger start times so the room does not send in lockstep
+        await asyncio.sleep(random.random() / rate)
+        while time.perf_counter() < deadline:
+            content = f"{MARKER}{time.perf_counter():.6f}:{self.index}:{self.sent}"
+            await self.ws.send(json.dumps({"type": "message", "content": content}))
+            self.sent += 1
+            pause = random.expovariate(rate)
+            await asyncio.sleep(min(pause, max(0.0, deadline - time.perf_counter())))
+
+    async def close(self):
+        await self.ws.close()
+        await self._reader
+
+
+async def exchange_messages(http, args, tokens: List[str], phase_results: dict, server):
+    ws_url = str(http.base_url).rstrip("/").replace("http", "ws", 1)
+    rooms = [f"load-room-{i}" for i in range(args.rooms)]
+    creator = {"Authorization": f"Bearer {next(t for t in tokens if t is not None)}"}
+    for room_id in rooms:
+        # Public, so every user may join; 409 if an earlier run created it
+        await http.post("/api/v1/rooms/", json={"room_id": room_id, "is_private": False}, headers=creator)
+    clients = [
+        Client(i, token, rooms[i % len(rooms)], ws_url)
+        for i, token in enumerate(tokens) if token is not None
+    ]
+    started = time.perf_counter()
+    for batch in range(0, len(clients), args.concurrency):
+        await asyncio.gather(*(c.connect() for c in clients[batch:batch + args.concurrency]))
+    phase_results["connect"] = {"count": len(clients), "elapsed_s": time.perf_counter() - started}
+
+    members: Dict[str, int] = {}
+    for client in clients:
+        members[client.room_id] = members.get(client.room_id, 0) + 1
+
+    async with Phase(http, server) as phase:
+        await asyncio.gather(*(c.send_for(args.rate, args.duration) for c in clients))
+        expected = sum(c.sent * members[c.room_id] for c in clients)
+        # Let the last broadcasts arrive
+        drain_until = time.perf_counter() + args.drain
+        while sum(len(c.latencies) for c in clients) < expected and time.perf_counter() < drain_until:
+            await asyncio.sleep(0.05)
+    for client in clients:
+        await client.close()
+
+    latencies = [sample for client in clients for sample in client.latencies]
+    sent = sum(c.sent for c in clients)
+    result = summarize(latencies, phase.elapsed, sum(c.refused for c in clients))
+    result.update(
+        sent=sent,
+        sent_per_s=sent / phase.elapsed,
+        expected_deliveries=expected,
+        delivered_ratio=len(latencies) / expected if expected else 1.0,
+        db_queries_per_message=(phase.db_queries / sent) if sent and phase.db_queries is not None else None,
+    )
+    phase_results["delivery"] = phase.report(result)
+    return clients
+
+
+async def page_history(http, args, clients: List[Client], phase_results: dict, server):
+    limit = asyncio.Semaphore(args.concurrency)
+    samples: list = []
+    errors: list = []
+
+    async def pages(client: Client):
+        headers = {"Authorization": f"Bearer {client.token}"}
+        params = {"room_id": client.room_id, "limit": 50}
+        for _ in range(args.history_pages):
+            async with limit:
+                started = time.perf_counter()
+                response = await http.get("/api/v1/messages/", params=params, headers=headers)
+                if response.status_code != 200:
+                    errors.append(1)
+                    return
+                samples.append(time.perf_counter() - started)
+            before = response.headers.get("x-cursor-before")
+            if not before:
+                return
+            params = {"room_id": client.room_id, "limit": 50, "before": before}
+
+    async with Phase(http, server) as phase:
+        await asyncio.gather(*(pages(client) for client in clients))
+    result = summarize(samples, phase.elapsed, len(errors))
+    result["db_queries_per_page"] = (
+        phase.db_queries / len(samples) if samples and phase.db_queries is not None else None
+    )
+    phase_results["history"] = phase.report(result)
+
+
+async def run(args) -> dict:
+    server = None
+    if args.url:
+        base_url = args.url
+    else:
+        server = LocalServer()
+        server.start()
+        base_url = server.url
+
+    phases: dict = {}
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as http:
+            tokens = await register_and_login(http, args, phases, server)
+            clients = await exchange_messages(http, args, tokens, phases, server)
+            await page_history(http, args, clients, phases, server)
+    finally:
+        if server is not None:
+            server.stop()
+
+    config = {
+        key: getattr(args, key)
+        for key in ("users", "rooms", "rate", "duration", "history_pages", "concurrency", "url")
+    }
+    config["database"] = os.environ.get("DATABASE_URL") if server else None
+    return {"config": config, "phases": phases}
+
+
+# Path segments compared between runs. Raw totals such as db_queries scale
+# with how much was sent, so only per-operation counts are compared.
+LOWER_IS_BETTER = {"latency_ms", "event_loop_lag", "errors", "db_queries_per_message", "db_queries_per_page"}
+HIGHER_IS_BETTER = {"throughput_per_s", "sent_per_s", "delivered_ratio"}
+
+
+def _leaves(tree: dict, prefix: str = "") -> Dict[str, float]:
+    leaves = {}
+    for key, value in tree.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            leaves.update(_leaves(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            leaves[path] = float(value)
+    return leaves
+
+
+def compare(base: dict, candidate: dict, threshold: float) -> dict:
+    """Relative change of every comparable metric; regressions beyond threshold"""
+    old = _leaves(base.get("phases", {}))
+    new = _leaves(candidate.get("phases", {}))
+    changes = {}
+    regressions = []
+    for path in sorted(old.keys() & new.keys()):
+        parts = set(path.split("."))
+        if parts & LOWER_IS_BETTER:
+            sign = 1
+        elif parts & HIGHER_IS_BETTER:
+            sign = -1
+        else:
+            continue
+        before, after = old[path], new[path]
+        if before == 0:
+            change = 0.0 if after == 0 else float("inf")
+        else:
+            change = (after - before) / abs(before)
+        regressed = sign * change > threshold
+        changes[path] = {"base": before, "candidate": after, "change": change, "regression": regressed}
+        if regressed:
+            regressions.append(path)
+    return {"threshold": threshold, "regressions": regressions, "metrics": changes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="generate load and report JSON")
+    run_parser.add_argument("--url", help="target a running server instead of starting one")
+    run_parser.add_argument("--users", type=int, default=50)
+    run_parser.add_argument("--rooms", type=int, default=5)
+    run_parser.add_argument("--rate", type=float, default=1.0, help="messages per second per user")
+    run_parser.add_argument("--duration", type=float, default=10.0, help="seconds of sending")
+    run_parser.add_argument("--drain", type=float, default=5.0, help="seconds to wait for late deliveries")
+    run_parser.add_argument("--history-pages", type=int, default=3)
+    run_parser.add_argument("--concurrency", type=int, default=20, help="parallel HTTP requests and connects")
+    run_parser.add_argument("--output", help="also write the JSON report here")
+
+    compare_parser = commands.add_parser("compare", help="diff two reports")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="relative change that counts as a regression")
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        with open(args.base) as f:
+            base = json.load(f)
+        with open(args.candidate) as f:
+            candidate = json.load(f)
+        result = compare(base, candidate, args.threshold)
+        print(json.dumps(result, indent=2))
+        sys.exit(1 if result["regressions"] else 0)
+
+    if not args.url:
+        # In-process defaults: a throwaway SQLite database and cheap hashing,
+        # so the run measures chat traffic rather than bcrypt
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/loadgen.db")
+        os.environ.setdefault("BCRYPT_ROUNDS", "4")
+    result = asyncio.run(run(args))
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
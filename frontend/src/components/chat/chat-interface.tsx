@@ -8,6 +8,34 @@ import { MessageList } from './message-list';
 import { MessageInput } from './message-input';
 import { useToast } from '@/components/ui/use-toast';
 
+// Read receipts seen within this window are sent as one
+const READ_RECEIPT_DELAY_MS = 300;
+
+// WebSocket connections that fail to open before switching to SSE
+const WS_ATTEMPTS_BEFORE_SSE = 2;
+
+// Frames replayed after a reconnect can overlap live ones, and our own
+// messages echo back: replace by id (or the optimistic copy), keeping id order
+function mergeMessage(messages: Message[], incoming: Message, pendingIds: Set<number>): Message[] {
+  const index = messages.findIndex(
+    (msg) =>
+      msg.id === incoming.id ||
+      (pendingIds.has(msg.id) && msg.sender_id === incoming.sender_id && msg.content === incoming.content)
+  );
+  if (index >= 0) {
+    pendingIds.delete(messages[index].id);
+    const next = [...messages];
+    next[index] = { ...messages[index], ...incoming, sender: messages[index].sender };
+    return next;
+  }
+  const next = [...messages, incoming];
+  const previous = messages[messages.length - 1];
+  if (previous && !pendingIds.has(previous.id) && previous.id > incoming.id) {
+    next.sort((a, b) => a.id - b.id);
+  }
+  return next;
+}
+
 type ChatInterfaceProps = {
   className?: string;
 };
@@ -23,6 +51,37 @@ export function ChatInterface({ className = '' }: ChatInterfaceProps) {
   const ws = useRef<WebSocket | null>(null);
   const { toast } = useToast();
   const typingTimeout = useRef<NodeJS.Timeout | null>(null);
+  const pendingReadId = useRef(0);
+  const sentReadId = useRef(0);
+  const readTimeout = useRef<NodeJS.Timeout | null>(null);
+  // Newest message id shown, sent on reconnect to replay what was missed
+  const lastMessageId = useRef(0);
+  const pendingIds = useRef(new Set<number>());
+
+  // Only the newest message id matters: the server advances a per-room
+  // cursor, so one receipt covers everything before it
+  const flushReadReceipt = useCallback(() => {
+    readTimeout.current = null;
+    const messageId = pendingReadId.current;
+    if (!roomId || messageId <= sentReadId.current) return;
+
+    if (ws.current && ws.current.readyState === WebSocket.OPEN) {
+      ws.current.send(JSON.stringify({ type: 'read', message_id: messageId }));
+    } else {
+      chatService
+        .markRead([{ room_id: roomId, message_id: messageId }])
+        .catch((error) => console.error('Failed to send read receipt:', error));
+    }
+    sentReadId.current = messageId;
+  }, [roomId]);
+
+  const queueReadReceipt = useCallback((messageId: number) => {
+    if (messageId <= pendingReadId.current) return;
+    pendingReadId.current = messageId;
+    if (!readTimeout.current) {
+      readTimeout.current = setTimeout(flushReadReceipt, READ_RECEIPT_DELAY_MS);
+    }
+  }, [flushReadReceipt]);
 
   // Load message history
   const loadMessages = useCallback(async () => {
@@ -32,6 +91,11 @@ export function ChatInterface({ className = '' }: ChatInterfaceProps) {
       setIsLoading(true);
       const data = await chatService.getMessages(roomId);
       setMessages(data.reverse()); // Show newest messages at the bottom
+      lastMessageId.current = data.reduce((max, msg) => Math.max(max, msg.id), 0);
+      const newestIncoming = data.filter((msg) => msg.sender_id !== user.id).pop();
+      if (newestIncoming && !newestIncoming.is_read) {
+        queueReadReceipt(newestIncoming.id);
+      }
     } catch (error) {
       console.error('Failed to load messages:', error);
       toast({
@@ -42,67 +106,114 @@ export function ChatInterface({ className = '' }: ChatInterfaceProps) {
     } finally {
       setIsLoading(false);
     }
-  }, [roomId, user, toast]);
+  }, [roomId, user, toast, queueReadReceipt]);
 
   // Set up WebSocket connection
   useEffect(() => {
     if (!roomId || !user) return;
 
+    let active = true;
+    let failedAttempts = 0;
+    let events: EventSource | null = null;
+
+    // Same events over the WebSocket and the SSE fallback
+    const handleEvent = (data: any) => {
+      if (data.type === 'message') {
+        lastMessageId.current = Math.max(lastMessageId.current, data.id);
+        const incoming: Message = {
+          id: data.id,
+          content: data.content,
+          sender_id: data.sender_id,
+          recipient_id: data.recipient_id || null,
+          room_id: roomId,
+          is_read: data.is_read ?? false,
+          created_at: data.created_at,
+          updated_at: data.created_at,
+          read_at: null,
+          sender: {
+            id: data.sender_id,
+            email: '',
+            full_name: data.sender_name,
+          },
+          recipient: null,
+        };
+        setMessages((prev) => mergeMessage(prev, incoming, pendingIds.current));
+        if (data.sender_id !== user.id && !incoming.is_read) {
+          queueReadReceipt(data.id);
+        }
+      } else if (data.type === 'ping') {
+        // Quiet sockets that do not answer are closed by the server
+        ws.current?.send(JSON.stringify({ type: 'pong' }));
+      } else if (data.type === 'resync') {
+        // More was missed than the server replays: start over
+        loadMessages();
+      } else if (data.type === 'read') {
+        if (data.user_id !== user.id) {
+          setMessages((prev) =>
+            prev.map((msg) =>
+              msg.sender_id === user.id && msg.id <= data.message_id && !msg.is_read
+                ? { ...msg, is_read: true }
+                : msg
+            )
+          );
+        }
+      } else if (data.type === 'typing') {
+        // A digest of each user's latest typing state, a few times a second
+        for (const entry of data.users ?? []) {
+          if (entry.user_id === user.id) continue;
+          if (entry.is_typing) {
+            setTypingUser(entry.user_name);
+
+            if (typingTimeout.current) {
+              clearTimeout(typingTimeout.current);
+            }
+
+            typingTimeout.current = setTimeout(() => {
+              setTypingUser(null);
+            }, 2000);
+          } else {
+            setTypingUser((current) => (current === entry.user_name ? null : current));
+          }
+        }
+      }
+    };
+
+    // Receive over Server-Sent Events; sends and read receipts already go
+    // over HTTP while there is no open WebSocket
+    const connectEventStream = () => {
+      events = new EventSource(
+        chatService.getEventStreamUrl(roomId, user.token!, lastMessageId.current)
+      );
+      events.onmessage = (event) => handleEvent(JSON.parse(event.data));
+    };
+
     const connectWebSocket = () => {
       try {
-        const wsUrl = chatService.getWebSocketUrl(roomId, user.token!);
+        const wsUrl = chatService.getWebSocketUrl(roomId, user.token!, lastMessageId.current);
         const socket = new WebSocket(wsUrl);
+        let opened = false;
 
         socket.onopen = () => {
+          opened = true;
+          failedAttempts = 0;
           console.log('WebSocket connection established');
         };
 
-        socket.onmessage = (event) => {
-          const data = JSON.parse(event.data);
-          
-          if (data.type === 'message') {
-            setMessages((prev) => [
-              ...prev,
-              {
-                id: Date.now(), // Temporary ID, will be replaced by server ID
-                content: data.content,
-                sender_id: data.sender_id,
-                recipient_id: data.recipient_id || null,
-                room_id: roomId,
-                is_read: false,
-                created_at: new Date().toISOString(),
-                updated_at: new Date().toISOString(),
-                read_at: null,
-                sender: {
-                  id: data.sender_id,
-                  email: '',
-                  full_name: data.sender_name,
-                },
-                recipient: null,
-              },
-            ]);
-          } else if (data.type === 'typing') {
-            if (data.is_typing) {
-              setTypingUser(data.user_name);
-              
-              if (typingTimeout.current) {
-                clearTimeout(typingTimeout.current);
-              }
-              
-              typingTimeout.current = setTimeout(() => {
-                setTypingUser(null);
-              }, 2000);
-            } else {
-              setTypingUser(null);
-            }
-          }
-        };
+        socket.onmessage = (event) => handleEvent(JSON.parse(event.data));
 
         socket.onclose = () => {
+          if (!active) return;
+          if (!opened && ++failedAttempts >= WS_ATTEMPTS_BEFORE_SSE) {
+            // Something between us and the server blocks WebSockets
+            console.log('WebSocket unavailable. Falling back to Server-Sent Events.');
+            ws.current = null;
+            connectEventStream();
+            return;
+          }
           console.log('WebSocket connection closed. Reconnecting...');
           // Reconnect after a delay
           setTimeout(() => {
-            connectWebSocket();
+            if (active) connectWebSocket();
           }, 3000);
         };
 
@@ -111,15 +222,6 @@ export function ChatInterface({ className = '' }: ChatInterfaceProps) {
         };
 
         ws.current = socket;
-
-        return () => {
-          if (ws.current) {
-            ws.current.close();
-          }
-          if (typingTimeout.current) {
-            clearTimeout(typingTimeout.current);
-          }
-        };
       } catch (error) {
         console.error('WebSocket connection error:', error);
       }
@@ -129,14 +231,20 @@ export function ChatInterface({ className = '' }: ChatInterfaceProps) {
     loadMessages();
 
     return () => {
+      active = false;
+      if (readTimeout.current) {
+        clearTimeout(readTimeout.current);
+        flushReadReceipt();
+      }
       if (ws.current) {
         ws.current.close();
       }
+      events?.close();
       if (typingTimeout.current) {
         clearTimeout(typingTimeout.current);
       }
     };
-  }, [roomId, user, loadMessages]);
+  }, [roomId, user, loadMessages, queueReadReceipt, flushReadReceipt]);
 
   const handleSendMessage = async (content: string) => {
     if (!user || !roomId) return;
@@ -163,23 +271,25 @@ export function ChatInterface({ className = '' }: ChatInterfaceProps) {
         recipient: null,
       };
       
+      pendingIds.current.add(tempMessage.id);
       setMessages((prev) => [...prev, tempMessage]);
       
-      // Send message via WebSocket
+      // The WebSocket persists and broadcasts the message; HTTP does the
+      // same while the socket is down. The echo replaces the optimistic copy.
       if (ws.current && ws.current.readyState === WebSocket.OPEN) {
         ws.current.send(JSON.stringify({
           type: 'message',
           content,
           room_id: roomId,
         }));
+      } else {
+        const sent = await chatService.sendMessage({
+          content,
+          room_id: roomId,
+        });
+        setMessages((prev) => mergeMessage(prev, sent, pendingIds.current));
       }
       
-      // Also send via HTTP for persistence
-      await chatService.sendMessage({
-        content,
-        room_id: roomId,
-      });
-      
     } catch (error) {
       console.error('Failed to send message:', error);
       toast({
@@ -189,6 +299,7 @@ export function ChatInterface({ className = '' }: ChatInterfaceProps) {
       });
       
       // Remove the optimistic message if sending failed
+      pendingIds.current.delete(tempMessage.id);
       setMessages((prev) => prev.filter((msg) => msg.id !== tempMessage.id));
     } finally {
       setIsSending(false);
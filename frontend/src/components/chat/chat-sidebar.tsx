@@ -1,11 +1,12 @@
 'use client';
 
-import { useState } from 'react';
+import { useEffect, useState } from 'react';
 import Link from 'next/link';
 import { useParams } from 'next/navigation';
 import { Search, Plus } from 'lucide-react';
 import { Input } from '@/components/ui/input';
 import { Button } from '@/components/ui/button';
+import { chatService } from '@/lib/api/chat';
 
 type Conversation = {
   id: string;
@@ -15,14 +16,29 @@ type Conversation = {
 };
 
 export function ChatSidebar() {
-  const [conversations] = useState<Conversation[]>([
-    { id: '1', name: 'John Doe', lastMessage: 'Hey there!', unreadCount: 2 },
-    { id: '2', name: 'Team Chat', lastMessage: 'Meeting at 3 PM', unreadCount: 0 },
-    { id: '3', name: 'Jane Smith', lastMessage: 'Did you see the docs?', unreadCount: 1 },
-  ]);
+  const [conversations, setConversations] = useState<Conversation[]>([]);
 
   const { roomId } = useParams();
 
+  // Reload when switching rooms so the unread badge of the room just read clears
+  useEffect(() => {
+    chatService
+      .getConversations()
+      .then((rooms) =>
+        setConversations(
+          rooms.map((room) => ({
+            id: room.room_id,
+            name: room.room_id.startsWith('group_')
+              ? `Group: ${room.room_id.replace('group_', '')}`
+              : room.room_id,
+            lastMessage: room.last_message?.content,
+            unreadCount: room.unread_count,
+          }))
+        )
+      )
+      .catch((error) => console.error('Failed to load conversations:', error));
+  }, [roomId]);
+
   return (
     <div className="w-80 border-r p-4 flex flex-col h-full">
       <div className="flex justify-between items-center mb-4">
@@ -22,6 +22,50 @@ export type Message = {
   } | null;
 };
 
+export type ReadReceipt = {
+  room_id: string;
+  message_id: number;
+};
+
+export type ReadCursor = {
+  user_id: number;
+  room_id: string;
+  last_read_message_id: number;
+  updated_at: string | null;
+};
+
+export type RoomSummary = {
+  room_id: string;
+  unread_count: number;
+  last_activity: string | null;
+  last_message: Omit<Message, 'sender' | 'recipient'> | null;
+};
+
+export type User = Message['sender'];
+
+export type RoomChanges = {
+  room_id: string;
+  // Newer than the room's mark, oldest first
+  messages: Omit<Message, 'sender' | 'recipient'>[];
+  // Already seen, changed since (edits, read flags)
+  updated: Omit<Message, 'sender' | 'recipient'>[];
+  read_cursors: ReadCursor[];
+  // Too much changed: reload the room's history instead
+  has_more: boolean;
+};
+
+export type SyncResponse = {
+  rooms: RoomChanges[];
+  users: User[];
+  synced_at: string;
+};
+
+export type UserPresence = {
+  user_id: number;
+  online: boolean;
+  last_seen_at: string | null;
+};
+
 export type SendMessageData = {
   content: string;
   room_id: string;
@@ -46,13 +90,38 @@ export const chatService = {
     return response.data;
   },
 
-  async getConversations() {
-    // This would be implemented based on your API
-    // For now, we'll return an empty array
-    return [];
+  // Marks everything up to each receipt's message as read, in one request
+  async markRead(receipts: ReadReceipt[]) {
+    const response = await apiClient.post<ReadCursor[]>('/messages/read', { receipts });
+    return response.data;
+  },
+
+  // Catch up on many rooms at once: `rooms` maps each room to the newest
+  // message id already shown; pass the last `synced_at` back as `since`
+  async sync(rooms: Record<string, number>, since?: string) {
+    const response = await apiClient.post<SyncResponse>('/messages/sync', { rooms, since });
+    return response.data;
+  },
+
+  // The user's rooms, most recently active first
+  async getConversations(limit: number = 50) {
+    const response = await apiClient.get<RoomSummary[]>('/rooms/', {
+      params: { limit },
+    });
+    return response.data;
+  },
+
+  // Which of up to 500 users are online right now
+  async getPresence(userIds: number[]) {
+    const response = await apiClient.post<UserPresence[]>('/users/presence', { user_ids: userIds });
+    return response.data;
+  },
+
+  getWebSocketUrl(roomId: string, token: string, lastId?: number) {
+    return apiClient.getWebSocketUrl(roomId, token, lastId);
   },
 
-  getWebSocketUrl(roomId: string, token: string) {
-    return apiClient.getWebSocketUrl(roomId, token);
+  getEventStreamUrl(roomId: string, token: string, lastId?: number) {
+    return apiClient.getEventStreamUrl(roomId, token, lastId);
   },
 };
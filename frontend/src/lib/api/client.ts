@@ -224,9 +224,18 @@ class ApiClient {
     return this.client.patch<T>(url, data, config);
   }
 
-  getWebSocketUrl(roomId: string, token: string): string {
+  // Pass the newest message id already shown to have missed ones replayed
+  getWebSocketUrl(roomId: string, token: string, lastId?: number): string {
     const wsBaseUrl = process.env.NEXT_PUBLIC_WS_URL || 'ws://localhost:8000';
-    return `${wsBaseUrl}/ws/chat/${roomId}?token=${token}`;
+    const url = `${wsBaseUrl}/ws/chat/${roomId}?token=${token}`;
+    return lastId ? `${url}&last_id=${lastId}` : url;
+  }
+
+  // Server-Sent Events for a room, for networks that break WebSockets.
+  // EventSource resumes on its own after a drop via Last-Event-ID.
+  getEventStreamUrl(roomId: string, token: string, lastId?: number): string {
+    const url = `${API_BASE_URL}/api/v1/messages/stream/${roomId}?token=${token}`;
+    return lastId ? `${url}&last_id=${lastId}` : url;
   }
 }
 
@@ -8,8 +8,9 @@ if [ -f .env ]; then
     export $(grep -v '^#' .env | xargs)
 fi
 
-# Run migrations
+# Run migrations in a one-off container: the backend service itself will
+# not start until the database is at the latest revision
 echo "Running database migrations..."
-docker-compose exec backend alembic upgrade head
+docker-compose run --rm backend alembic upgrade head
 
 echo "Database migrations completed successfully!"
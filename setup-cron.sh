@@ -15,6 +15,9 @@ echo "0 0,12 * * * $PROJECT_DIR/renew-certs.sh >> $PROJECT_DIR/cert-renewal.log
 # Add the database backup job (runs daily at 2 AM)
 echo "0 2 * * * $PROJECT_DIR/backup-db.sh >> $PROJECT_DIR/backup-db.log 2>&1" >> $CRON_FILE
 
+# Archive message partitions past MESSAGE_RETENTION_MONTHS (runs monthly on the 1st at 3 AM)
+echo "0 3 1 * * cd $PROJECT_DIR && docker-compose exec -T backend python -m app.core.partitions archive >> $PROJECT_DIR/partitions.log 2>&1" >> $CRON_FILE
+
 # Install the crontab
 crontab $CRON_FILE
 rm $CRON_FILE